@@ -0,0 +1,138 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Lengths of array fields are computed by an ingest pipeline when documents
+# are indexed and stored as integer fields with doc values, so that
+# sort_by_count doesn't need to run a script reading _source of every hit.
+
+COUNT_SCRIPT = """
+for (String field : params.fields) {
+    def value = ctx;
+    for (String part : field.splitOnToken('.')) {
+        value = value instanceof Map ? value.get(part) : null;
+    }
+    int count = 0;
+    if (value instanceof List) {
+        count = value.size();
+    } else if (value != null) {
+        count = 1;
+    }
+    ctx[field.replace('.', '_') + '_count'] = count;
+}
+"""
+
+
+def count_field_name(field):
+    """
+    This function will return name of the field with length of array field
+    :param field: path of the array field
+    :return: name of the count field
+    """
+    return f"{field.replace('.', '_')}_count"
+
+
+def pipeline_id(index):
+    """
+    This function will return id of the ingest pipeline for the index
+    :param index: name of the index
+    :return: pipeline id
+    """
+    return f"{index}_array_counts"
+
+
+def array_count_pipeline(fields, chained=None):
+    """
+    This function will generate ingest pipeline that stores length of each
+    array field in <field>_count
+    :param fields: paths of the array fields
+    :param chained: id of the pipeline to run before counting, e.g. default
+    pipeline the index had before
+    :return: pipeline definition
+    """
+    processors = [{'pipeline': {'name': chained}}] if chained else []
+    processors.append({
+        'script': {
+            'lang': 'painless',
+            'source': COUNT_SCRIPT,
+            'params': {'fields': list(fields)}
+        }
+    })
+    return {
+        'description': 'Store lengths of array fields for sort_by_count',
+        'processors': processors
+    }
+
+
+def array_count_mapping(fields):
+    """
+    This function will generate mapping for the count fields
+    :param fields: paths of the array fields
+    :return: mapping
+    """
+    return {
+        'properties': {
+            count_field_name(field): {'type': 'integer'} for field in fields
+        }
+    }
+
+
+def default_pipelines(es, index):
+    """
+    This function will return default pipelines of the index
+    :param es: Elasticsearch client
+    :param index: name of the index or alias
+    :return: set of pipeline ids, empty if index has no default pipeline
+    """
+    response = es.indices.get_settings(index=index, name='index.default_pipeline', flat_settings=True)
+    pipelines = {index_settings['settings'].get('index.default_pipeline') for index_settings in response.values()}
+    return pipelines - {None, '_none'}
+
+
+def chained_pipeline(es, index):
+    """
+    This function will return pipeline chained by already installed array
+    counts pipeline
+    :param es: Elasticsearch client
+    :param index: name of the index
+    :return: pipeline id or None
+    """
+    response = es.ingest.get_pipeline(id=pipeline_id(index), ignore=404)
+    for processor in response.get(pipeline_id(index), {}).get('processors', []):
+        if 'pipeline' in processor:
+            return processor['pipeline']['name']
+    return None
+
+
+def install_array_counts(es, index, fields, backfill=False, chain=False):
+    """
+    This function will create the pipeline, add count fields to the mapping
+    and make the pipeline default for the index, so every document written
+    afterwards gets count fields
+    :param es: Elasticsearch client
+    :param index: name of the index
+    :param fields: paths of the array fields
+    :param backfill: also update documents already in the index
+    :param chain: run default pipeline the index already has before counting,
+    otherwise such index is refused
+    :return: task id of the backfill, None if backfill wasn't requested
+    """
+    other_pipelines = default_pipelines(es, index) - {pipeline_id(index)}
+    if len(other_pipelines) > 1:
+        raise ValueError(f"Indices of {index} have different default pipelines: "
+                         f"{', '.join(sorted(other_pipelines))}")
+    if other_pipelines and not chain:
+        raise ValueError(f"{index} already has default pipeline {other_pipelines.pop()}, "
+                         f"chain it to install array counts")
+    # reinstalling keeps the pipeline chained before
+    chained = other_pipelines.pop() if other_pipelines else chained_pipeline(es, index)
+
+    es.ingest.put_pipeline(id=pipeline_id(index), body=array_count_pipeline(fields, chained))
+    es.indices.put_mapping(index=index, body=array_count_mapping(fields))
+    es.indices.put_settings(index=index, body={'index': {'default_pipeline': pipeline_id(index)}})
+    logger.info(f"Installed array counts for {index}: {fields}")
+    if not backfill:
+        return None
+    response = es.update_by_query(index=index, pipeline=pipeline_id(index), conflicts='proceed',
+                                  wait_for_completion=False)
+    return response['task']
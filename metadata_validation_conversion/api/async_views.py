@@ -0,0 +1,102 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from metadata_validation_conversion.es_client import get_async_es_client, async_raw_search, RAW_CLIENT
+
+from .views import ALLOWED_INDICES
+from .helpers import parse_search_params, search_kwargs, detail_query, select_detail_hits, \
+    get_as_search_response, global_search_results, global_search_requests, error_response, \
+    search_response, detail_response, GLOBAL_ALLOWED_INDICES
+from .cache import async_cached_search
+from .id_map import resolve_id, remember_id
+from .pagination import async_cursor_search, InvalidCursor
+from .query_compiler import compile_search_body
+
+# Async versions of the search, detail and global search endpoints. Under
+# ASGI these run on the event loop of the worker, so requests waiting for
+# Elasticsearch don't hold a thread. Requests are parsed and responses are
+# shaped by the same helpers as in the sync views in views.py.
+
+
+def _csrf_exempt(view):
+    # django.views.decorators.csrf.csrf_exempt wraps the view into a sync
+    # function in Django 3.2, which would turn async view into a sync one
+    view.csrf_exempt = True
+    return view
+
+
+@_csrf_exempt
+async def globindex(request):
+    if request.method != 'GET':
+        return error_response(405, 'This method is not allowed!')
+
+    index_searches = global_search_requests(request.GET.get('sterm', ''), GLOBAL_ALLOWED_INDICES)
+    es = get_async_es_client()
+    outp_data = await asyncio.gather(*(
+        es.search(index=name, body=body) for name, body in index_searches), return_exceptions=True)
+    for data in outp_data:
+        # e.g. cancellation of the request
+        if isinstance(data, BaseException) and not isinstance(data, Exception):
+            raise data
+    return JsonResponse(global_search_results(index_searches, outp_data))
+
+
+@_csrf_exempt
+async def index(request, name):
+    if request.method != 'GET' and request.method != 'POST':
+        return error_response(405, 'This method is not allowed!')
+    if name not in ALLOWED_INDICES:
+        return error_response(404, 'This index doesn\'t exist!')
+
+    params = parse_search_params(request.GET)
+    try:
+        # mapping of the index may be fetched with the sync client
+        body = await sync_to_async(compile_search_body, thread_sensitive=False)(
+            name, params['filters'], params['aggs'], params['search'],
+            params['sort_by_count'])
+    except ValueError as e:
+        return error_response(400, str(e))
+
+    cursor = request.GET.get('cursor', '')
+    if cursor and not request.body:
+        try:
+            data = await async_cursor_search(
+                get_async_es_client(), name, body, params['size'], sort=params['sort'],
+                cursor=cursor, _source=params['_source'], q=params['q'])
+        except InvalidCursor as e:
+            return error_response(400, str(e))
+        return JsonResponse(data)
+
+    es = get_async_es_client(RAW_CLIENT)
+    kwargs = search_kwargs(name, params, body, request.body)
+
+    async def fetch():
+        return await async_raw_search(es, **kwargs)
+
+    data = await async_cached_search(name, kwargs, fetch, raw=True)
+    return search_response(request, data)
+
+
+async def detail(request, name, id):
+    if request.method != 'GET':
+        return error_response(405, 'This method is not allowed!')
+    if name not in ALLOWED_INDICES:
+        return error_response(404, 'This index doesn\'t exist!')
+    es = get_async_es_client()
+
+    async def fetch():
+        doc_id = await sync_to_async(resolve_id, thread_sensitive=False)(name, id)
+        if doc_id is not None:
+            doc = await es.get(index=name, id=doc_id, ignore=404)
+            if doc.get('found'):
+                return get_as_search_response(doc)
+        results = select_detail_hits(await es.search(index=name, body=detail_query(id),
+                                                     seq_no_primary_term=True))
+        if results['hits']['hits']:
+            await sync_to_async(remember_id, thread_sensitive=False)(
+                name, id, results['hits']['hits'][0]['_id'])
+        return results
+
+    results = await async_cached_search(name, {'id': id}, fetch)
+    return detail_response(request, results)
@@ -0,0 +1,308 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+import redis
+from elasticsearch import TransportError
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .singleflight import SingleFlight, AsyncSingleFlight
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'search_cache'
+
+# identical queries running at the same time in this process share one call,
+# the redis lock in cached_search does the same across workers
+_flights = SingleFlight()
+_async_flights = AsyncSingleFlight()
+
+_redis_client = None
+_redis_pid = None
+_redis_lock = threading.Lock()
+
+
+def get_redis():
+    """
+    This function will return redis client shared by all threads of the process
+    :return: redis client
+    """
+    global _redis_client, _redis_pid
+    if _redis_client is None or _redis_pid != os.getpid():
+        with _redis_lock:
+            if _redis_client is None or _redis_pid != os.getpid():
+                _redis_client = redis.Redis.from_url(
+                    settings.SEARCH_CACHE_URL,
+                    socket_timeout=settings.SEARCH_CACHE_SOCKET_TIMEOUT,
+                    socket_connect_timeout=settings.SEARCH_CACHE_SOCKET_TIMEOUT)
+                _redis_pid = os.getpid()
+    return _redis_client
+
+
+def normalize_params(params):
+    """
+    This function will convert request parameters to canonical form, so that
+    the same query always produces the same cache key
+    :param params: dict with request parameters, json strings are parsed
+    :return: canonical json string
+    """
+    normalized = {}
+    for key, value in params.items():
+        if isinstance(value, (bytes, bytearray)):
+            value = value.decode('utf-8')
+        if isinstance(value, str) and value[:1] in ('{', '['):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                pass
+        elif isinstance(value, int):
+            value = str(value)
+        if value in (None, '', {}, []):
+            continue
+        normalized[key] = value
+    return json.dumps(normalized, sort_keys=True, separators=(',', ':'))
+
+
+def _generation_key(index):
+    return f"{KEY_PREFIX}:gen:{index}"
+
+
+def make_cache_key(index, params, generation=0):
+    """
+    This function will generate cache key for the query
+    :param index: name of the index
+    :param params: request parameters
+    :param generation: current generation of the index, see invalidate_index
+    :return: cache key
+    """
+    digest = hashlib.sha1(normalize_params(params).encode('utf-8')).hexdigest()
+    return f"{KEY_PREFIX}:{index}:{generation}:{digest}"
+
+
+def _current_key(client, index, params):
+    generation = client.get(_generation_key(index))
+    return make_cache_key(index, params, int(generation) if generation else 0)
+
+
+def current_cache_key(index, params):
+    """
+    This function will generate key for the query that changes when the index
+    is invalidated, see invalidate_index
+    :param index: name of the index
+    :param params: request parameters
+    :return: key
+    """
+    return _current_key(get_redis(), index, params)
+
+
+def _lookup(index, params):
+    """
+    This function will read cached value and try to take the lock for key
+    :return: client, key, lock key, cached value and whether lock was taken
+    """
+    client = get_redis()
+    key = _current_key(client, index, params)
+    lock_key = f"{key}:lock"
+    cached = client.get(key)
+    if cached is not None:
+        return client, key, lock_key, cached, False
+    have_lock = client.set(lock_key, os.getpid(), nx=True,
+                           ex=settings.SEARCH_CACHE_LOCK_TIMEOUT)
+    return client, key, lock_key, None, have_lock
+
+
+def _store(client, key, lock_key, data, raw=False):
+    """
+    This function will save response in cache and release the lock
+    """
+    try:
+        if data is not None:
+            client.set(key, data if raw else json.dumps(data), ex=settings.SEARCH_CACHE_TTL)
+    except redis.RedisError as e:
+        logger.warning(f"Couldn't store search cache entry: {e}")
+    try:
+        client.delete(lock_key)
+    except redis.RedisError:
+        pass
+
+
+def cached_search(index, params, fetch, raw=False):
+    """
+    Read-through cache for Elasticsearch responses. Only one worker runs fetch
+    for a missing key at a time, others wait for its result (stampede
+    protection), concurrent calls within the process share one lookup. Any
+    redis failure falls back to calling Elasticsearch directly.
+    :param index: name of the index, used for invalidation
+    :param params: request parameters that fully describe the query
+    :param fetch: function without arguments returning the ES response
+    :param raw: fetch returns undecoded json, it's stored and returned as is
+    :return: ES response, shared with concurrent callers, must not be modified
+    """
+    return _flights.do((make_cache_key(index, params), raw),
+                       lambda: _cached_search(index, params, fetch, raw))
+
+
+def _cached_search(index, params, fetch, raw):
+    loads = (lambda value: value) if raw else json.loads
+    if not settings.SEARCH_CACHE_ENABLED:
+        return fetch()
+    try:
+        client, key, lock_key, cached, have_lock = _lookup(index, params)
+    except redis.RedisError as e:
+        logger.warning(f"Search cache is unavailable: {e}")
+        return fetch()
+    if cached is not None:
+        return loads(cached)
+
+    if not have_lock:
+        cached = _wait_for_value(client, key, lock_key)
+        if cached is not None:
+            return loads(cached)
+        return fetch()
+
+    data = None
+    try:
+        data = fetch()
+        return data
+    finally:
+        _store(client, key, lock_key, data, raw)
+
+
+async def async_cached_search(index, params, fetch, raw=False):
+    """
+    Version of cached_search for async views, redis calls run in the default
+    thread pool so that they don't block the event loop
+    :param index: name of the index, used for invalidation
+    :param params: request parameters that fully describe the query
+    :param fetch: coroutine function without arguments returning the ES response
+    :param raw: fetch returns undecoded json, it's stored and returned as is
+    :return: ES response, shared with concurrent callers, must not be modified
+    """
+    return await _async_flights.do((make_cache_key(index, params), raw),
+                                   lambda: _async_cached_search(index, params, fetch, raw))
+
+
+async def _async_cached_search(index, params, fetch, raw):
+    loads = (lambda value: value) if raw else json.loads
+    if not settings.SEARCH_CACHE_ENABLED:
+        return await fetch()
+    try:
+        client, key, lock_key, cached, have_lock = await sync_to_async(
+            _lookup, thread_sensitive=False)(index, params)
+    except redis.RedisError as e:
+        logger.warning(f"Search cache is unavailable: {e}")
+        return await fetch()
+    if cached is not None:
+        return loads(cached)
+
+    if not have_lock:
+        cached = await sync_to_async(_wait_for_value, thread_sensitive=False)(
+            client, key, lock_key)
+        if cached is not None:
+            return loads(cached)
+        return await fetch()
+
+    data = None
+    try:
+        data = await fetch()
+        return data
+    finally:
+        await sync_to_async(_store, thread_sensitive=False)(client, key, lock_key, data, raw)
+
+
+def cached_msearch(queries, fetch):
+    """
+    Read-through cache for batch of queries: cached responses are read with
+    one MGET and only the misses are passed to fetch, so they can be sent to
+    Elasticsearch in one _msearch request. Error responses are not cached.
+    :param queries: list of (index, params) pairs
+    :param fetch: function taking list of positions of missing queries and
+    returning list of ES responses for them, in the same order
+    :return: list of ES responses in order of queries
+    """
+    results = [None] * len(queries)
+    keys = None
+    if settings.SEARCH_CACHE_ENABLED and queries:
+        try:
+            client = get_redis()
+            indices = sorted(set(index for index, _ in queries))
+            generations = dict(zip(indices, client.mget([_generation_key(index) for index in indices])))
+            keys = [make_cache_key(index, params, int(generations[index] or 0))
+                    for index, params in queries]
+            for position, cached in enumerate(client.mget(keys)):
+                if cached is not None:
+                    results[position] = json.loads(cached)
+        except redis.RedisError as e:
+            logger.warning(f"Search cache is unavailable: {e}")
+            keys = None
+
+    missing = [position for position, data in enumerate(results) if data is None]
+    if not missing:
+        return results
+    fetched = fetch(missing)
+    for position, data in zip(missing, fetched):
+        results[position] = data
+    if keys is not None:
+        try:
+            pipeline = client.pipeline(transaction=False)
+            for position, data in zip(missing, fetched):
+                if 'error' not in data:
+                    pipeline.set(keys[position], json.dumps(data), ex=settings.SEARCH_CACHE_TTL)
+            pipeline.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Couldn't store search cache entries: {e}")
+    return results
+
+
+def _wait_for_value(client, key, lock_key):
+    """
+    This function will poll cache while another worker holds the lock for key
+    :return: cached value or None if lock was released without value
+    """
+    deadline = time.monotonic() + settings.SEARCH_CACHE_LOCK_TIMEOUT
+    try:
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            cached = client.get(key)
+            if cached is not None:
+                return cached
+            if not client.exists(lock_key):
+                return client.get(key)
+    except redis.RedisError as e:
+        logger.warning(f"Search cache is unavailable: {e}")
+    return None
+
+
+def invalidate_index(*indices):
+    """
+    This function will invalidate all cached responses for indices, should be
+    called after writing to Elasticsearch. Old entries are left to expire.
+    :param indices: names of the modified indices
+    """
+    if not settings.SEARCH_CACHE_ENABLED:
+        return
+    try:
+        client = get_redis()
+        for index in indices:
+            client.incr(_generation_key(index))
+    except redis.RedisError as e:
+        logger.warning(f"Couldn't invalidate search cache for {indices}: {e}")
+
+
+def refresh_and_invalidate(es, *indices):
+    """
+    This function will make documents written to indices visible to search
+    and then invalidate cached responses, so that a search made in between
+    can't cache the old result again
+    :param es: Elasticsearch client used for the writes
+    :param indices: names of the modified indices
+    """
+    try:
+        es.indices.refresh(index=','.join(indices))
+    except TransportError as e:
+        logger.warning(f"Couldn't refresh {indices}: {e}")
+    invalidate_index(*indices)
@@ -14,4 +14,44 @@ HUMAN_READABLE_NAMES = {
     'materialSummary': 'Materials',
     'specieSummary': 'Species',
     'assayTypeSummary': 'Assay type'
-}
\ No newline at end of file
+}
+# Array fields used by sort_by_count, their lengths are stored at index time
+# as <field>_count, see api/array_counts.py
+ARRAY_COUNT_FIELDS = {
+    'dataset': ['experiment', 'specimen', 'file', 'species'],
+    '2026_03_26_dataset': ['experiment', 'specimen', 'file', 'species'],
+}
+
+# Global search: when files match but datasets don't, datasets of the matching
+# files are returned instead
+GLOBAL_FILE_INDEX = '2026_03_26_file'
+GLOBAL_DATASET_INDEX = '2026_03_26_dataset'
+# keyword field of the file index with accessions of the studies
+GLOBAL_STUDY_ACCESSION_FIELD = 'study.accession'
+# max number of dataset accessions returned by the fallback
+GLOBAL_DATASET_FALLBACK_SIZE = 1000
+
+# Fields with ids and names offered by /data/_suggest/, per index
+SUGGEST_FIELDS = {
+    '2026_03_26_organism': ['biosampleId', 'organism.text', 'breed.text'],
+    '2026_03_26_specimen': ['biosampleId', 'alternativeId', 'cellType.text'],
+    '2026_03_26_dataset': ['accession', 'title', 'species.text'],
+    '2026_03_26_file': ['name', 'study.accession'],
+    '2026_03_26_experiment': ['accession'],
+    'analysis': ['accession', 'title'],
+    'protocol_files': ['key', 'name'],
+    'protocol_analysis': ['key', 'protocolName'],
+    'protocol_samples': ['key', 'protocolName'],
+    'article': ['pmcId', 'doi', 'title'],
+}
+
+# Identifier resolution for detail lookups, see api/id_map.py: values of
+# these fields are mapped to _id of the document. Only fields searched by
+# helpers.detail_query are mapped, so cold and warm map find the same records
+ID_MAP_FIELDS = ['alternativeId', 'biosampleId']
+ID_MAP_INDICES = ['2026_03_26_organism', '2026_03_26_specimen', '2026_03_26_experiment',
+                  '2026_03_26_file', '2026_03_26_dataset', 'organism', 'specimen',
+                  'experiment', 'file', 'dataset', 'analysis']
+
+# max number of ids in one request to the _mget endpoint
+MGET_MAX_IDS = 1000
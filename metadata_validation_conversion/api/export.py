@@ -0,0 +1,384 @@
+import csv
+import json
+import zlib
+import tempfile
+from itertools import chain
+
+import xlsxwriter
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from .pagination import iter_pit_slices
+from .query_compiler import compile_search_body
+
+# Helpers for downloads: records are produced one by one from a stream of
+# ES hits and written incrementally, so memory doesn't grow with the number
+# of exported records.
+
+# columns that are computed from the arrays instead of being copied
+COUNT_COLUMNS = {
+    "_source.experiment": "Number of Experiments",
+    "_source.specimen": "Number of Specimens",
+    "_source.file": "Number of Files",
+}
+
+
+# number of records fetched from Elasticsearch at once
+PAGE_SIZE = 5000
+# rows of tabular export are kept in memory up to this size, then on disk
+SPOOL_MAX_SIZE = 10 * 1024 * 1024
+# number of records in one parquet row group
+PARQUET_ROW_GROUP_SIZE = 10000
+# size of chunks read from temporary files
+CHUNK_SIZE = 64 * 1024
+
+
+class Echo:
+    """
+    File-like object that returns written value instead of storing it, used
+    to get lines from csv.writer
+    """
+    def write(self, value):
+        return value
+
+
+def source_fields(columns):
+    """
+    This function will generate _source parameter for the columns
+    :param columns: list of columns in the format _source.field
+    :return: comma separated fields
+    """
+    request_fields = []
+    for col in columns:
+        cols = col.split('.')
+        if cols[0] == '_source':
+            request_fields.append('.'.join(cols[1:]))
+    return ','.join(request_fields)
+
+
+def _filters_body(name, params):
+    # generate query for filtering, body has only the query
+    filters = params.get('filters', '{}')
+    if isinstance(filters, str):
+        filters = json.loads(filters)
+    return compile_search_body(name, filters)
+
+
+def count_records(es, name, params):
+    """
+    This function will count records matching download parameters
+    :param es: Elasticsearch client
+    :param name: name of the index
+    :param params: download parameters, see prepare_export
+    :return: number of records
+    """
+    return es.count(index=name, body=_filters_body(name, params))['count']
+
+
+def prepare_export(es, name, params):
+    """
+    This function will parse download parameters and prepare records, nothing
+    is fetched from Elasticsearch until records are consumed
+    :param es: Elasticsearch client
+    :param name: name of the index
+    :param params: dict with _source, columns, sort and filters, columns and
+    filters can be json strings
+    :return: tuple of (generator of records, columns, column names)
+    """
+    columns = params.get('_source', '').split(',')
+    column_names = params.get('columns', '[]')
+    if isinstance(column_names, str):
+        column_names = json.loads(column_names)
+    body = _filters_body(name, params)
+    sort = params.get('sort', '')
+    # slices are merged in sort order only when it was requested
+    hits = iter_pit_slices(es, name, body, size=PAGE_SIZE, sort=sort, ordered=bool(sort),
+                           _source=source_fields(columns))
+    return iter_records(hits, columns, column_names), columns, column_names
+
+
+def iter_records(hits, columns, column_names):
+    """
+    This function will convert hits to records with value for each column
+    :param hits: iterable of ES hits
+    :param columns: list of columns in the format _source.field
+    :param column_names: human readable names of the columns
+    :return: generator of dicts column -> value
+    """
+    # Check if we need to compute count for some columns
+    counted = {col for col, name in COUNT_COLUMNS.items() if name in column_names}
+    include_species_text = "Species" in column_names
+    for row in hits:
+        record = {}
+        for col in columns:
+            cols = col.split('.')
+            record[col] = ''
+            source = row
+            for c in cols:
+                if isinstance(source, dict) and c in source.keys():
+                    record[col] = source[c]
+                    source = source[c]
+                else:
+                    record[col] = ''
+                    break
+
+            # Compute count for experiment, specimen and file and assign correct value to return to the other cols
+            if col in counted:
+                record[col] = len(source) if isinstance(source, list) else 0
+
+            if col == "_source.species" and include_species_text:
+                if isinstance(source, list):
+                    record[col] = ", ".join(item['text'] for item in source if 'text' in item)
+                else:
+                    record[col] = 0
+            if col in ["_source.assayType", "_source.archive"]:
+                if isinstance(source, list):
+                    record[col] = ", ".join(source)
+        yield record
+
+
+def iter_csv(records, columns, column_names):
+    """
+    This function will generate csv lines, header first
+    :param records: iterable of records, see iter_records
+    :param columns: list of columns
+    :param column_names: header for each column
+    :return: generator of csv lines
+    """
+    writer = csv.DictWriter(Echo(), fieldnames=columns)
+    yield writer.writerow(dict(zip(columns, column_names)))
+    for record in records:
+        yield writer.writerow(record)
+
+
+def iter_tabular(records, columns, column_names):
+    """
+    This function will generate fixed width and '|' separated text, rows are
+    spooled to temporary file while widths of the columns are computed, then
+    read back and padded
+    :param records: iterable of records, see iter_records
+    :param columns: list of columns
+    :param column_names: header for each column
+    :return: generator of text lines
+    """
+    widths = [0] * len(columns)
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, mode='w+', newline='',
+                                       encoding='utf-8') as spool:
+        writer = csv.writer(spool)
+        rows = ([record[col] for col in columns] for record in records)
+        for row in chain([column_names], rows):
+            cells = ['' if value is None else str(value) for value in row]
+            for i, cell in enumerate(cells):
+                if len(cell) > widths[i]:
+                    widths[i] = len(cell)
+            writer.writerow(cells)
+        spool.seek(0)
+        for i, cells in enumerate(csv.reader(spool)):
+            line = ' | '.join(cell.ljust(width) for cell, width in zip(cells, widths))
+            yield line if i == 0 else '\n' + line
+
+
+
+def _text(value):
+    """
+    This function will convert value of the record to text, lists and dicts
+    are serialized to json
+    :param value: value of the record
+    :return: text or None
+    """
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return str(value)
+
+
+def iter_ndjson(records, columns, column_names):
+    """
+    This function will generate one json object per line, keys of the objects
+    are names of the columns
+    :param records: iterable of records, see iter_records
+    :param columns: list of columns
+    :param column_names: key for each column
+    :return: generator of json lines
+    """
+    for record in records:
+        yield json.dumps({name: record[col] for col, name in zip(columns, column_names)}) + '\n'
+
+
+def iter_xlsx(records, columns, column_names):
+    """
+    This function will write records to xlsx workbook in constant memory mode,
+    rows are flushed to disk as they are written. Workbook is a zip file, so
+    it is sent once all records are written
+    :param records: iterable of records, see iter_records
+    :param columns: list of columns
+    :param column_names: header for each column
+    :return: generator of bytes
+    """
+    with tempfile.NamedTemporaryFile(suffix='.xlsx') as output:
+        workbook = xlsxwriter.Workbook(output.name, {'constant_memory': True})
+        worksheet = workbook.add_worksheet()
+        worksheet.write_row(0, 0, column_names)
+        for row, record in enumerate(records, start=1):
+            worksheet.write_row(row, 0, [
+                record[col] if isinstance(record[col], (int, float)) else _text(record[col])
+                for col in columns])
+        workbook.close()
+        output.seek(0)
+        yield from iter(lambda: output.read(CHUNK_SIZE), b'')
+
+
+class _ChunkSink:
+    """
+    Writable file-like object that keeps written bytes until they are drained
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_parquet(records, columns, column_names):
+    """
+    This function will write records to parquet, one row group per
+    PARQUET_ROW_GROUP_SIZE records. Counts are stored as integers, other
+    values as text
+    :param records: iterable of records, see iter_records
+    :param columns: list of columns
+    :param column_names: name of each column in parquet schema
+    :return: generator of bytes
+    """
+    counted = {col for col, name in COUNT_COLUMNS.items() if name in column_names}
+    schema = pyarrow.schema([
+        (name, pyarrow.int64() if col in counted else pyarrow.string())
+        for col, name in zip(columns, column_names)])
+    sink = _ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(pyarrow.PythonFile(sink, mode='w'), schema)
+    batch = []
+    for record in chain(records, [None]):
+        if record is not None:
+            batch.append(record)
+        if batch and (record is None or len(batch) == PARQUET_ROW_GROUP_SIZE):
+            writer.write_table(pyarrow.Table.from_arrays([
+                pyarrow.array([r[col] if col in counted else _text(r[col]) for r in batch],
+                              type=field.type)
+                for col, field in zip(columns, schema)], schema=schema))
+            batch = []
+            yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def gzip_chunks(chunks):
+    """
+    This function will compress chunks to gzip stream
+    :param chunks: iterable of str or bytes
+    :return: generator of compressed bytes
+    """
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def zstd_chunks(chunks):
+    """
+    This function will compress chunks to zstd stream
+    :param chunks: iterable of str or bytes
+    :return: generator of compressed bytes
+    """
+    compressor = zstandard.ZstdCompressor().compressobj()
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# file_format -> (writer, content type, file extension)
+EXPORT_FORMATS = {
+    'csv': (iter_csv, 'text/csv', 'csv'),
+    'txt': (iter_tabular, 'text/plain', 'txt'),
+    'ndjson': (iter_ndjson, 'application/x-ndjson', 'ndjson'),
+    'xlsx': (iter_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+    'parquet': (iter_parquet, 'application/vnd.apache.parquet', 'parquet'),
+}
+# formats that are compressed by their writers
+COMPRESSED_FORMATS = {'xlsx', 'parquet'}
+# suffix of file_format -> (compressor, content type)
+EXPORT_COMPRESSIONS = {
+    'gz': (gzip_chunks, 'application/gzip'),
+    'zst': (zstd_chunks, 'application/zstd'),
+}
+
+
+def parse_export_format(file_format):
+    """
+    This function will check requested format, e.g. csv, parquet or csv.gz
+    :param file_format: requested format with optional compression suffix
+    :return: tuple of (format, compression), compression is '' for
+    uncompressed files
+    """
+    file_format, _, compression = file_format.partition('.')
+    if compression and compression not in EXPORT_COMPRESSIONS:
+        raise ValueError(f"Compression '{compression}' is not supported")
+    if compression and file_format in COMPRESSED_FORMATS:
+        raise ValueError(f"{file_format} files are compressed already, '.{compression}' can't be added")
+    if compression == 'zst' and zstandard is None:
+        raise ValueError("zstd compression is not available, zstandard isn't installed")
+    if file_format == 'parquet' and pyarrow is None:
+        raise ValueError("parquet format is not available, pyarrow isn't installed")
+    return file_format, compression
+
+
+def export_stream(records, columns, column_names, file_format):
+    """
+    This function will choose writer for the requested format, e.g. csv,
+    parquet or csv.gz, unknown formats are written as tabular text
+    :param records: iterable of records, see iter_records
+    :param columns: list of columns
+    :param column_names: names of the columns
+    :param file_format: requested format with optional compression suffix
+    :return: tuple of (generator of chunks, content type, filename)
+    """
+    file_format, compression = parse_export_format(file_format)
+    writer, content_type, extension = EXPORT_FORMATS.get(file_format, EXPORT_FORMATS['txt'])
+    chunks = writer(records, columns, column_names)
+    filename = f'faang_data.{extension}'
+    if compression:
+        compressor, content_type = EXPORT_COMPRESSIONS[compression]
+        chunks = compressor(chunks)
+        filename = f'{filename}.{compression}'
+    return chunks, content_type, filename
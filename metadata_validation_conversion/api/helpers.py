@@ -1,5 +1,34 @@
+import re
+import json
+import hashlib
+import logging
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from django.middleware.gzip import re_accepts_gzip
+from django.utils.cache import patch_vary_headers, patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from django.utils.text import compress_string
+
+from .pagination import parse_sort
+from .constants import GLOBAL_FILE_INDEX, GLOBAL_DATASET_INDEX, GLOBAL_DATASET_FALLBACK_SIZE, \
+    GLOBAL_STUDY_ACCESSION_FIELD
 # import pandas as pd
 
+logger = logging.getLogger(__name__)
+
+# timing and shard counts at the start of search response, they differ
+# between runs of the same search
+_SEARCH_RESPONSE_TIMING = re.compile(rb'^\{"took":\d+,"timed_out":(?:true|false),"_shards":\{[^{}]*\},')
+# added to ETag of gzip compressed responses
+_GZIP_ETAG_SUFFIX = '-gzip"'
+
+# indices searched by the global search, used by the search endpoints and
+# the websocket consumer
+GLOBAL_ALLOWED_INDICES = ['2026_03_26_organism', '2026_03_26_specimen', '2026_03_26_dataset',
+                          '2026_03_26_file', '2026_03_26_experiment', 'analysis',
+                          'protocol_files', 'protocol_analysis', 'protocol_samples', 'article']
+
 
 def generate_df(field_name, column_name, data):
     """
@@ -49,3 +78,423 @@ def generate_df_for_breeds(field_name, column_name, data):
     #                                                        'Number'])
     # return df, df_faang_only
     return None
+
+
+def parse_search_params(params):
+    """
+    This function will parse parameters of the search endpoint
+    :param params: query dict (request.GET) or dict with the same keys
+    :return: dict with search parameters, filters and aggs are parsed
+    """
+    filters = params.get('filters', '{}')
+    aggregations = params.get('aggs', '{}')
+    return {
+        'size': params.get('size', 10),
+        '_source': params.get('_source', ''),
+        'sort': params.get('sort', ''),
+        'sort_by_count': params.get('sort_by_count', ''),
+        'q': params.get('q', ''),
+        'search': params.get('search', ''),
+        'from_': params.get('from_', 0),
+        # Example: {field1: [val1, val2], field2: [val1, val2], ...}
+        'filters': json.loads(filters) if isinstance(filters, str) else filters,
+        # Example: {aggName1: field1, aggName2: field2, ...}
+        'aggs': json.loads(aggregations) if isinstance(aggregations, str) else aggregations,
+    }
+
+
+def portal_index_name(index):
+    """
+    This function will convert name of the index to the name used by portal
+    :param index: name of the index
+    :return: portal name
+    """
+    return index.replace(
+        'protocol_files', 'protocol/experiments'
+    ).replace(
+        'protocol_analysis', 'protocol/analysis'
+    ).replace('protocol_samples', 'protocol/samples')
+
+
+def empty_search_response():
+    """
+    This function will return search response without hits, used in place of
+    the indices that couldn't be searched
+    :return: ES response
+    """
+    return {'hits': {'total': {'value': 0}, 'hits': []}}
+
+
+def format_global_results(outp_data):
+    """
+    This function will combine results of global search, indices without hits
+    are skipped
+    :param outp_data: list of ES responses with 'index' key, see
+    global_search_requests
+    :return: dict with results per index
+    """
+    outp_json_data = dict()
+    study_aggregations = None
+    for el in outp_data:
+        aggregations = el.pop('aggregations', None)
+        if len(el['hits']['hits']) != 0:
+            outp_json_data[el['index']] = el
+            if el['index'] == GLOBAL_FILE_INDEX:
+                study_aggregations = aggregations
+    if (GLOBAL_FILE_INDEX in outp_json_data) and (GLOBAL_DATASET_INDEX not in outp_json_data) \
+            and study_aggregations:
+        study_accessions = [
+            bucket['key'] for bucket in study_aggregations['study_accessions']['buckets']]
+        if len(study_accessions) != 0:
+            outp_json_data[GLOBAL_DATASET_INDEX] = {
+                'hits': {'total': {'value': study_aggregations['study_count']['value']}, 'hits': []},
+                'search_terms': study_accessions
+            }
+    return outp_json_data
+
+
+def global_search_results(index_searches, outp_data):
+    """
+    This function will combine responses of the global search, failure of one
+    index doesn't fail the whole search
+    :param index_searches: list of (index, body) pairs, see global_search_requests
+    :param outp_data: ES responses in the same order, failed searches are
+    exceptions or msearch responses with 'error'
+    :return: dict with results per index, see format_global_results
+    """
+    results = []
+    for (name, _), data in zip(index_searches, outp_data):
+        error = data if isinstance(data, Exception) else data.get('error')
+        if error:
+            logger.warning(f"Global search failed for {name}: {error}")
+            data = empty_search_response()
+        data.pop('status', None)
+        data['index'] = portal_index_name(name)
+        results.append(data)
+    return format_global_results(results)
+
+
+def global_search_requests(sterm, indices):
+    """
+    This function will generate searches for the global search, search of
+    the file index also collects accessions of the studies for the dataset
+    fallback
+    :param sterm: search term
+    :param indices: names of the indices
+    :return: list of (index, body) pairs
+    """
+    searches = []
+    for index in indices:
+        body = dict(global_search_body(sterm), track_total_hits=True)
+        if index == GLOBAL_FILE_INDEX:
+            # field is configured rather than looked up in the mapping, so
+            # global search doesn't wait for the mapping request
+            body['aggs'] = {
+                'study_accessions': {
+                    'terms': {'field': GLOBAL_STUDY_ACCESSION_FIELD, 'size': GLOBAL_DATASET_FALLBACK_SIZE}
+                },
+                'study_count': {'cardinality': {'field': GLOBAL_STUDY_ACCESSION_FIELD}}
+            }
+        searches.append((index, body))
+    return searches
+
+
+def search_kwargs(name, params, body, raw_body=b''):
+    """
+    This function will generate arguments for the ES search call, the same
+    for sync and async clients
+    :param name: name of the index
+    :param params: parsed search parameters, see parse_search_params
+    :param body: compiled query body
+    :param raw_body: ES query posted by the user, replaces compiled body
+    :return: kwargs for search
+    """
+    if raw_body:
+        return {'index': name, 'size': params['size'],
+                'body': json.loads(raw_body.decode("utf-8")), 'track_total_hits': True}
+    kwargs = {'index': name, 'from_': params['from_'], 'size': params['size'],
+              '_source': params['_source'], 'sort': params['sort'], 'body': body,
+              'track_total_hits': True}
+    if params['q'] != '':
+        kwargs['q'] = params['q']
+    return kwargs
+
+
+def msearch_body(params, body):
+    """
+    This function will convert search parameters to body of one search in
+    _msearch request, url parameters like sort and q are moved to the body
+    :param params: parsed search parameters, see parse_search_params
+    :param body: compiled query body
+    :return: search body
+    """
+    body = dict(body)
+    body['size'] = int(params['size'])
+    body['from'] = int(params['from_'])
+    body['track_total_hits'] = True
+    if params['_source']:
+        body['_source'] = params['_source'].split(',')
+    if params['sort']:
+        body['sort'] = parse_sort(params['sort'])
+    if params['q'] != '':
+        query_string = {'query_string': {'query': params['q']}}
+        bool_query = dict(body.get('query', {}).get('bool', {}))
+        bool_query['must'] = list(bool_query.get('must', [])) + [query_string]
+        body['query'] = {'bool': bool_query}
+    return body
+
+
+def id_field_clauses(id, name_suffix=''):
+    """
+    This function will generate clauses matching id against alternativeId and
+    biosampleId, clauses are named after the field
+    :param id: id of the record
+    :param name_suffix: added to names of the clauses
+    :return: list of clauses
+    """
+    return [{"match_phrase": {field: {"query": id, "_name": f"{field}{name_suffix}"}}}
+            for field in ('alternativeId', 'biosampleId')]
+
+
+def detail_query(id):
+    """
+    This function will generate query used to find record by its id, the id
+    is matched against _id, alternativeId and biosampleId at once
+    :param id: id of the record
+    :return: query body
+    """
+    # Use structured queries with the id passed as a value (not concatenated
+    # into a Lucene query string) to avoid query injection (CWE-943).
+    return {
+        "query": {
+            "bool": {
+                "should": [{"ids": {"values": [id], "_name": "_id"}}] + id_field_clauses(id),
+                "minimum_should_match": 1
+            }
+        }
+    }
+
+
+def select_detail_hits(results):
+    """
+    This function will keep hits matched by the most specific part of
+    detail_query: _id, then alternativeId, then biosampleId
+    :param results: ES response for detail_query
+    :return: ES response
+    """
+    hits = results['hits']['hits']
+    for name in ('_id', 'alternativeId', 'biosampleId'):
+        selected = [hit for hit in hits if name in hit.get('matched_queries', [])]
+        if selected:
+            break
+    for hit in selected:
+        hit.pop('matched_queries', None)
+    if len(selected) != len(hits):
+        results['hits']['hits'] = selected
+        results['hits']['total'] = {'value': len(selected), 'relation': 'eq'}
+    return results
+
+
+def get_as_search_response(doc):
+    """
+    This function will convert response of ES get to the format of search
+    response returned by detail
+    :param doc: ES get response for existing document
+    :return: ES search response with one hit
+    """
+    return {
+        'took': 0,
+        'timed_out': False,
+        '_shards': {'total': 1, 'successful': 1, 'skipped': 0, 'failed': 0},
+        'hits': {
+            'total': {'value': 1, 'relation': 'eq'},
+            'max_score': 1.0,
+            'hits': [{
+                '_index': doc['_index'],
+                '_type': doc.get('_type', '_doc'),
+                '_id': doc['_id'],
+                '_seq_no': doc.get('_seq_no'),
+                '_primary_term': doc.get('_primary_term'),
+                '_score': 1.0,
+                '_source': doc.get('_source', {})
+            }]
+        }
+    }
+
+
+def global_search_body(sterm):
+    """
+    This function will generate query for the global search
+    :param sterm: search term
+    :return: query body
+    """
+    body = {}
+    if sterm:
+        match = {
+            'multi_match': {
+                'query': sterm,
+                'fields': ['*']
+            }
+        }
+        body['query'] = {
+            'bool': {
+                'must': [match]
+            }
+        }
+    return body
+
+
+def content_etag(data):
+    """
+    This function will generate strong ETag from response body
+    :param data: response body as str or bytes
+    :return: quoted ETag
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return quote_etag(hashlib.blake2b(data, digest_size=16).hexdigest())
+
+
+def search_etag(data):
+    """
+    This function will generate ETag from undecoded search response, timing
+    fields at the start of the response are skipped, so the same hits and
+    aggregations get the same ETag without decoding the response
+    :param data: ES search response as str or bytes
+    :return: ETag
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return content_etag(_SEARCH_RESPONSE_TIMING.sub(b'{', data, count=1))
+
+
+def detail_etag(results):
+    """
+    This function will generate ETag from versions of the documents in the
+    response
+    :param results: ES search response
+    :return: ETag
+    """
+    versions = []
+    for hit in results['hits']['hits']:
+        if '_seq_no' not in hit:
+            return content_etag(json.dumps(results['hits'], sort_keys=True))
+        versions.append(f"{hit['_index']}/{hit['_id']}/{hit.get('_primary_term')}/{hit['_seq_no']}")
+    return content_etag(','.join(versions))
+
+
+def _opaque_etag(etag):
+    # compressed representation has its own ETag, see raw_json_response
+    etag = etag[2:] if etag.startswith('W/') else etag
+    return etag[:-len(_GZIP_ETAG_SUFFIX)] + '"' if etag.endswith(_GZIP_ETAG_SUFFIX) else etag
+
+
+def etag_matches(request, etag):
+    """
+    This function will check If-None-Match header of the request, weak
+    comparison is used as required for If-None-Match, ETag of compressed
+    response matches the same response sent uncompressed
+    :param request: request
+    :param etag: ETag of the current response
+    :return: True if client has current version
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    return '*' in etags or _opaque_etag(etag) in [_opaque_etag(e) for e in etags]
+
+
+def add_cache_headers(response, etag):
+    """
+    This function will add ETag and Cache-Control headers to the response
+    :param response: response
+    :param etag: ETag
+    :return: response
+    """
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=settings.SEARCH_HTTP_MAX_AGE)
+    return response
+
+
+def not_modified_response(etag):
+    """
+    This function will return 304 response for the client that has current
+    version of the response
+    :param etag: ETag
+    :return: response
+    """
+    response = HttpResponseNotModified()
+    if settings.SEARCH_GZIP_RESPONSES:
+        patch_vary_headers(response, ('Accept-Encoding',))
+    return add_cache_headers(response, etag)
+
+
+def error_response(status, reason):
+    """
+    This function will return json response with the error
+    :param status: HTTP status code
+    :param reason: error message
+    :return: response
+    """
+    context = {'status': str(status), 'reason': reason}
+    response = HttpResponse(
+        json.dumps(context), content_type='application/json')
+    response.status_code = status
+    return response
+
+
+def search_response(request, data):
+    """
+    This function will return response of the search endpoint, responses to
+    GET requests get ETag and cache headers
+    :param request: request
+    :param data: ES response as undecoded json
+    :return: response
+    """
+    if request.body:
+        return raw_json_response(request, data)
+    etag = search_etag(data)
+    if etag_matches(request, etag):
+        return not_modified_response(etag)
+    return raw_json_response(request, data, etag)
+
+
+def detail_response(request, results):
+    """
+    This function will return response of the details endpoint, client with
+    the current version of the documents gets 304 and the response isn't
+    serialized
+    :param request: request
+    :param results: ES search response
+    :return: response
+    """
+    etag = detail_etag(results)
+    if etag_matches(request, etag):
+        return not_modified_response(etag)
+    return add_cache_headers(JsonResponse(results), etag)
+
+
+def raw_json_response(request, data, etag=None):
+    """
+    This function will return json that is already serialized, e.g. response
+    body from Elasticsearch, compressed if client accepts gzip
+    :param request: request
+    :param data: json as str or bytes
+    :param etag: ETag of uncompressed body
+    :return: response
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    response = HttpResponse(data, content_type='application/json')
+    if settings.SEARCH_GZIP_RESPONSES:
+        patch_vary_headers(response, ('Accept-Encoding',))
+        # small responses get bigger after compression
+        if len(data) >= 200 and re_accepts_gzip.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+            response.content = compress_string(data)
+            response['Content-Encoding'] = 'gzip'
+            # compressed body is a different representation
+            if etag:
+                etag = etag[:-1] + _GZIP_ETAG_SUFFIX
+    if etag:
+        add_cache_headers(response, etag)
+    return response
@@ -0,0 +1,215 @@
+import logging
+
+import redis
+from elasticsearch.helpers import scan
+
+from .cache import get_redis
+from .constants import ID_MAP_FIELDS
+from .helpers import id_field_clauses
+
+logger = logging.getLogger(__name__)
+
+# Identifier -> _id table for each index, kept in a redis hash, so that detail
+# can find a record by any of its ids with one lookup and one get instead of
+# trying several searches.
+
+KEY_PREFIX = 'idmap'
+# identifiers searched with one request, two clauses per identifier have to
+# stay under max_clause_count of Elasticsearch
+SEARCH_IDS_BATCH_SIZE = 500
+
+# sets identifier of the first of ID_MAP_FIELDS, unless the identifier is _id
+# of some document (entries for _id map the value to itself)
+_SET_PRIORITY_ID = """
+if redis.call('hget', KEYS[1], ARGV[1]) ~= ARGV[1] then
+    redis.call('hset', KEYS[1], ARGV[1], ARGV[2])
+end
+"""
+
+
+def id_map_key(index):
+    return f"{KEY_PREFIX}:{index}"
+
+
+def _identifiers(source, field):
+    value = source.get(field)
+    if isinstance(value, list):
+        return [item for item in value if isinstance(item, str) and item]
+    return [value] if isinstance(value, str) and value else []
+
+
+def build_id_map(es, index, batch_size=1000):
+    """
+    This function will rebuild identifier map of the index, map is built
+    under temporary key and replaces the old one when complete
+    :param es: Elasticsearch client
+    :param index: name of the index
+    :param batch_size: number of documents written to redis at once
+    :return: number of documents in the map
+    """
+    client = get_redis()
+    key = id_map_key(index)
+    tmp_key = f"{key}:tmp"
+    client.delete(tmp_key)
+    set_priority_id = client.register_script(_SET_PRIORITY_ID)
+    pipeline = client.pipeline(transaction=False)
+    count = 0
+    for hit in scan(es, index=index, query={'_source': ID_MAP_FIELDS}, size=batch_size):
+        # identifiers are mapped with the same priority as detail matches
+        # them, whatever the order of documents: _id, then ID_MAP_FIELDS in order
+        source = hit.get('_source', {})
+        pipeline.hset(tmp_key, hit['_id'], hit['_id'])
+        for identifier in _identifiers(source, ID_MAP_FIELDS[0]):
+            set_priority_id(keys=[tmp_key], args=[identifier, hit['_id']], client=pipeline)
+        for field in ID_MAP_FIELDS[1:]:
+            for identifier in _identifiers(source, field):
+                pipeline.hsetnx(tmp_key, identifier, hit['_id'])
+        count += 1
+        if count % batch_size == 0:
+            pipeline.execute()
+    pipeline.execute()
+    if count:
+        client.rename(tmp_key, key)
+    else:
+        client.delete(key)
+    logger.info(f"Identifier map for {index} built with {count} documents")
+    return count
+
+
+def resolve_id(index, identifier):
+    """
+    This function will find _id of the document by any of its identifiers
+    :param index: name of the index
+    :param identifier: _id, alternative id or biosample id
+    :return: _id or None if identifier is unknown or map isn't available
+    """
+    try:
+        doc_id = get_redis().hget(id_map_key(index), identifier)
+    except redis.RedisError as e:
+        logger.warning(f"Identifier map is unavailable: {e}")
+        return None
+    return doc_id.decode('utf-8') if doc_id is not None else None
+
+
+def remember_id(index, identifier, doc_id):
+    """
+    This function will add identifier found by search to the map, so that
+    records indexed after the last rebuild are resolved next time
+    """
+    try:
+        client = get_redis()
+        if client.exists(id_map_key(index)):
+            client.hset(id_map_key(index), identifier, doc_id)
+    except redis.RedisError as e:
+        logger.warning(f"Identifier map is unavailable: {e}")
+
+
+def resolve_ids(index, identifiers):
+    """
+    This function will find _id of documents for list of identifiers with one
+    redis call
+    :param index: name of the index
+    :param identifiers: list of identifiers
+    :return: list of _id, None for unknown identifiers
+    """
+    if not identifiers:
+        return []
+    try:
+        doc_ids = get_redis().hmget(id_map_key(index), identifiers)
+    except redis.RedisError as e:
+        logger.warning(f"Identifier map is unavailable: {e}")
+        return [None] * len(identifiers)
+    return [doc_id.decode('utf-8') if doc_id is not None else None for doc_id in doc_ids]
+
+
+def remember_ids(index, doc_ids):
+    """
+    This function will add identifiers found by search to the map
+    :param index: name of the index
+    :param doc_ids: dict identifier -> _id
+    """
+    if not doc_ids:
+        return
+    try:
+        client = get_redis()
+        if client.exists(id_map_key(index)):
+            client.hset(id_map_key(index), mapping=doc_ids)
+    except redis.RedisError as e:
+        logger.warning(f"Identifier map is unavailable: {e}")
+
+
+def _mget(es, index, doc_ids, source=None):
+    if not doc_ids:
+        return {}
+    kwargs = {'_source': source} if source else {}
+    response = es.mget(index=index, body={'ids': sorted(doc_ids)}, **kwargs)
+    return {
+        doc['_id']: {'_index': doc['_index'], '_id': doc['_id'], '_source': doc.get('_source', {})}
+        for doc in response['docs'] if doc.get('found')
+    }
+
+
+def _search_ids(es, index, identifiers):
+    """
+    This function will find documents by identifiers with one search per
+    SEARCH_IDS_BATCH_SIZE identifiers, ids are matched the same way and with
+    the same priority as in detail: _id, then alternativeId, then biosampleId
+    :return: dict identifier -> _id for found identifiers
+    """
+    found = {}
+    for start in range(0, len(identifiers), SEARCH_IDS_BATCH_SIZE):
+        batch = identifiers[start:start + SEARCH_IDS_BATCH_SIZE]
+        should = [{'ids': {'values': list(batch), '_name': '_id'}}]
+        for position, identifier in enumerate(batch):
+            # clause names tell which identifier the hit matched
+            should.extend(id_field_clauses(identifier, f":{position}"))
+        response = es.search(index=index, size=min(len(batch) * 2, 10000), _source=False, body={
+            'query': {
+                'bool': {
+                    'should': should,
+                    'minimum_should_match': 1
+                }
+            }
+        })
+        matches = {'_id': {}, 'alternativeId': {}, 'biosampleId': {}}
+        for hit in response['hits']['hits']:
+            for name in hit.get('matched_queries', []):
+                field, _, position = name.partition(':')
+                identifier = batch[int(position)] if position else hit['_id']
+                matches[field].setdefault(identifier, hit['_id'])
+        for identifier in batch:
+            doc_id = matches['_id'].get(identifier) or matches['alternativeId'].get(identifier) \
+                     or matches['biosampleId'].get(identifier)
+            if doc_id:
+                found[identifier] = doc_id
+    return found
+
+
+def fetch_by_ids(es, index, identifiers, source=None):
+    """
+    This function will fetch documents for list of identifiers: identifiers
+    are resolved with the map, documents are read with one mget, identifiers
+    that aren't in the map are found with one search
+    :param es: Elasticsearch client
+    :param index: name of the index
+    :param identifiers: list of identifiers, as accepted by detail
+    :param source: _source projection, all fields by default
+    :return: list of docs in order of identifiers, each with 'id' and 'found'
+    """
+    doc_ids = dict(zip(identifiers, resolve_ids(index, identifiers)))
+    docs = _mget(es, index, set(doc_id for doc_id in doc_ids.values() if doc_id), source)
+    # not in the map, or the map is outdated
+    missing = [identifier for identifier in identifiers if doc_ids.get(identifier) not in docs]
+    if missing:
+        found = _search_ids(es, index, missing)
+        remember_ids(index, found)
+        doc_ids.update(found)
+        docs.update(_mget(es, index, set(found.values()) - set(docs), source))
+    results = []
+    for identifier in identifiers:
+        doc = docs.get(doc_ids.get(identifier))
+        if doc is None:
+            results.append({'id': identifier, 'found': False})
+        else:
+            results.append(dict(doc, id=identifier, found=True))
+    return results
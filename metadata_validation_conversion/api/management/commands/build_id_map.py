@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from elasticsearch import TransportError
+from redis import RedisError
+
+from metadata_validation_conversion.es_client import get_es_client
+from api.id_map import build_id_map
+from api.constants import ID_MAP_INDICES
+
+
+class Command(BaseCommand):
+    help = 'Rebuild identifier maps used by detail lookups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('index', nargs='*',
+                            help='indices to rebuild, all indices from ID_MAP_INDICES by default')
+
+    def handle(self, *args, **options):
+        es = get_es_client()
+        for index in options['index'] or ID_MAP_INDICES:
+            try:
+                count = build_id_map(es, index)
+            except (TransportError, RedisError) as e:
+                raise CommandError(f"Couldn't build identifier map for {index}: {e}")
+            self.stdout.write(f"{index}: {count} documents")
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from elasticsearch import TransportError
+
+from metadata_validation_conversion.es_client import get_es_client
+from api.array_counts import install_array_counts
+from api.constants import ARRAY_COUNT_FIELDS
+
+
+class Command(BaseCommand):
+    help = 'Install ingest pipeline storing lengths of array fields used by sort_by_count'
+
+    def add_arguments(self, parser):
+        parser.add_argument('index', nargs='*',
+                            help='indices to update, all indices from ARRAY_COUNT_FIELDS by default')
+        parser.add_argument('--fields', nargs='+',
+                            help='array fields, ARRAY_COUNT_FIELDS of the index by default')
+        parser.add_argument('--backfill', action='store_true',
+                            help='update documents that are already in the index')
+        parser.add_argument('--chain', action='store_true',
+                            help='run default pipeline the index already has before counting')
+
+    def handle(self, *args, **options):
+        es = get_es_client()
+        for index in options['index'] or ARRAY_COUNT_FIELDS.keys():
+            fields = options['fields'] or ARRAY_COUNT_FIELDS.get(index)
+            if not fields:
+                raise CommandError(f"No array fields configured for {index}, use --fields")
+            try:
+                task = install_array_counts(es, index, fields, options['backfill'], options['chain'])
+            except (TransportError, ValueError) as e:
+                raise CommandError(f"Couldn't install array counts for {index}: {e}")
+            self.stdout.write(f"{index}: {', '.join(fields)}")
+            if task:
+                self.stdout.write(f"{index}: backfill task {task}")
@@ -0,0 +1,308 @@
+import json
+import heapq
+import queue
+import base64
+import binascii
+import threading
+from functools import cmp_to_key, partial
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from elasticsearch import NotFoundError
+
+# value of the cursor parameter that opens a new point in time
+START_CURSOR = 'true'
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(pit_id, search_after):
+    """
+    This function will encode state of pagination to opaque token
+    :param pit_id: point in time id
+    :param search_after: sort values of the last returned hit
+    :return: url-safe token
+    """
+    state = json.dumps({'pit': pit_id, 'search_after': search_after}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(state.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(token):
+    """
+    This function will decode token produced by encode_cursor
+    :param token: token from the 'next' field of previous response
+    :return: point in time id and search_after values
+    """
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        return state['pit'], state['search_after']
+    except (binascii.Error, ValueError, KeyError, TypeError, UnicodeError):
+        raise InvalidCursor(f"Invalid cursor: {token}")
+
+
+def parse_sort(sort):
+    """
+    This function will convert sort parameter to list of sort clauses
+    :param sort: sort in the format field1:asc,field2:desc
+    :return: list of sort clauses
+    """
+    clauses = []
+    for item in filter(None, sort.split(',')):
+        field, _, order = item.partition(':')
+        clauses.append({field: order or 'asc'})
+    return clauses
+
+
+def _cursor_request(body, size, sort, pit_id, search_after, kwargs):
+    """
+    This function will generate arguments of the search for one page of
+    cursor pagination
+    :return: kwargs for es.search
+    """
+    body = dict(body)
+    sort_clauses = body.pop('sort', None) or parse_sort(sort)
+    if isinstance(sort_clauses, dict):
+        sort_clauses = [sort_clauses]
+    # _shard_doc is unique within point in time, so it breaks ties between
+    # documents with equal sort values
+    body['sort'] = list(sort_clauses) + [{'_shard_doc': 'asc'}]
+    body['pit'] = {'id': pit_id, 'keep_alive': settings.ES_PIT_KEEP_ALIVE}
+    if search_after is not None:
+        body['search_after'] = search_after
+    return dict(body=body, size=size, track_total_hits=True, **{k: v for k, v in kwargs.items() if v})
+
+
+def _finish_page(data, pit_id, size):
+    """
+    This function will add 'next' token to the page
+    :param data: ES response
+    :param pit_id: id of the point in time used for the search
+    :param size: page size
+    :return: id of the point in time to close when it was the last page, None otherwise
+    """
+    hits = data['hits']['hits']
+    pit_id = data.get('pit_id', pit_id)
+    if len(hits) < size or not hits:
+        data['next'] = None
+        return pit_id
+    data['next'] = encode_cursor(pit_id, hits[-1]['sort'])
+    return None
+
+
+def cursor_search(es, index, body, size, sort='', cursor=START_CURSOR, **kwargs):
+    """
+    This function will fetch one page using point in time and search_after,
+    cost of the request doesn't depend on how deep the page is
+    :param es: Elasticsearch client
+    :param index: name of the index
+    :param body: query body, 'sort' from the body takes priority over sort param
+    :param size: page size
+    :param sort: sort in the format field1:asc,field2:desc
+    :param cursor: START_CURSOR for the first page or token from previous page
+    :param kwargs: other search parameters (_source, q)
+    :return: ES response with 'next' token, None when there are no more pages
+    """
+    size = int(size)
+    if cursor == START_CURSOR:
+        pit_id = es.open_point_in_time(index=index, keep_alive=settings.ES_PIT_KEEP_ALIVE)['id']
+        search_after = None
+    else:
+        pit_id, search_after = decode_cursor(cursor)
+    try:
+        data = es.search(**_cursor_request(body, size, sort, pit_id, search_after, kwargs))
+    except NotFoundError:
+        raise InvalidCursor("Cursor has expired, please start again")
+    last_pit_id = _finish_page(data, pit_id, size)
+    if last_pit_id:
+        es.close_point_in_time(body={'id': last_pit_id}, ignore=404)
+    return data
+
+
+async def async_cursor_search(es, index, body, size, sort='', cursor=START_CURSOR, **kwargs):
+    """
+    Version of cursor_search for AsyncElasticsearch client
+    :param es: AsyncElasticsearch client
+    :param index: name of the index
+    :param body: query body, 'sort' from the body takes priority over sort param
+    :param size: page size
+    :param sort: sort in the format field1:asc,field2:desc
+    :param cursor: START_CURSOR for the first page or token from previous page
+    :param kwargs: other search parameters (_source, q)
+    :return: ES response with 'next' token, None when there are no more pages
+    """
+    size = int(size)
+    if cursor == START_CURSOR:
+        pit_id = (await es.open_point_in_time(index=index, keep_alive=settings.ES_PIT_KEEP_ALIVE))['id']
+        search_after = None
+    else:
+        pit_id, search_after = decode_cursor(cursor)
+    try:
+        data = await es.search(**_cursor_request(body, size, sort, pit_id, search_after, kwargs))
+    except NotFoundError:
+        raise InvalidCursor("Cursor has expired, please start again")
+    last_pit_id = _finish_page(data, pit_id, size)
+    if last_pit_id:
+        await es.close_point_in_time(body={'id': last_pit_id}, ignore=404)
+    return data
+
+
+def _pit_body(body, sort):
+    """
+    This function will add sort clauses to body, _shard_doc is added as
+    tiebreaker
+    :return: tuple of (new body, list of sort orders)
+    """
+    body = dict(body or {})
+    sort_clauses = body.pop('sort', None) or parse_sort(sort)
+    if isinstance(sort_clauses, dict):
+        sort_clauses = [sort_clauses]
+    body['sort'] = list(sort_clauses) + [{'_shard_doc': 'asc'}]
+    orders = []
+    for clause in body['sort']:
+        order = next(iter(clause.values()))
+        orders.append(order if isinstance(order, str) else order.get('order', 'asc'))
+    return body, orders
+
+
+def _iter_pages(es, pit, body, size, kwargs):
+    """
+    This function will fetch pages of hits within point in time, pit['id'] is
+    updated with the id returned by Elasticsearch
+    """
+    search_after = None
+    while True:
+        page = dict(body, pit={'id': pit['id'], 'keep_alive': settings.ES_PIT_KEEP_ALIVE})
+        if search_after is not None:
+            page['search_after'] = search_after
+        data = es.search(body=page, size=size, track_total_hits=False, **kwargs)
+        hits = data['hits']['hits']
+        pit['id'] = data.get('pit_id', pit['id'])
+        yield hits
+        if len(hits) < size:
+            break
+        search_after = hits[-1]['sort']
+
+
+def iter_pit(es, index, body=None, size=1000, sort='', **kwargs):
+    """
+    This function will iterate over all hits of the query using point in
+    time and search_after, only one page is held in memory at a time
+    :param es: Elasticsearch client
+    :param index: name of the index
+    :param body: query body
+    :param size: page size
+    :param sort: sort in the format field1:asc,field2:desc
+    :param kwargs: other search parameters (_source, q)
+    :return: generator of hits
+    """
+    pit = es.open_point_in_time(index=index, keep_alive=settings.ES_PIT_KEEP_ALIVE)
+    try:
+        body, _ = _pit_body(body, sort)
+        for hits in _iter_pages(es, pit, body, size, {k: v for k, v in kwargs.items() if v}):
+            yield from hits
+    finally:
+        # also runs when the consumer stops early, e.g. client disconnected
+        es.close_point_in_time(body={'id': pit['id']}, ignore=404)
+
+
+def _compare_sort_values(orders, first, second):
+    # missing values are sorted last, as Elasticsearch does by default
+    for order, a, b in zip(orders, first, second):
+        if a == b:
+            continue
+        if a is None:
+            return 1
+        if b is None:
+            return -1
+        if a < b:
+            return -1 if order == 'asc' else 1
+        return 1 if order == 'asc' else -1
+    return 0
+
+
+def _put(items, item, stop):
+    # blocks while the consumer is behind, gives up when it went away
+    while not stop.is_set():
+        try:
+            items.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(items):
+    item = items.get()
+    if isinstance(item, BaseException):
+        raise item
+    return item
+
+
+def iter_pit_slices(es, index, body=None, slices=None, size=1000, sort='', ordered=False, **kwargs):
+    """
+    This function will iterate over all hits of the query like iter_pit, but
+    slices of the point in time are read concurrently on a thread pool. At
+    most two pages per slice are held in memory
+    :param es: Elasticsearch client
+    :param index: name of the index
+    :param body: query body
+    :param slices: number of slices, ES_PIT_SLICES by default
+    :param size: page size
+    :param sort: sort in the format field1:asc,field2:desc
+    :param ordered: merge slices in sort order, otherwise hits are returned
+    in the order pages arrive
+    :param kwargs: other search parameters (_source, q)
+    :return: generator of hits
+    """
+    slices = slices or settings.ES_PIT_SLICES
+    if slices < 2:
+        yield from iter_pit(es, index, body, size, sort, **kwargs)
+        return
+    kwargs = {k: v for k, v in kwargs.items() if v}
+    body, orders = _pit_body(body, sort)
+    pit = es.open_point_in_time(index=index, keep_alive=settings.ES_PIT_KEEP_ALIVE)
+    stop = threading.Event()
+    # one queue per slice keeps hits of each slice in order for the merge
+    queues = [queue.Queue(maxsize=2) for _ in range(slices)] if ordered else [queue.Queue(maxsize=2 * slices)]
+
+    def fetch_slice(slice_id):
+        items = queues[slice_id if ordered else 0]
+        try:
+            slice_body = dict(body, slice={'id': slice_id, 'max': slices})
+            # slices share the point in time, the latest id returned by any of them is kept
+            for hits in _iter_pages(es, pit, slice_body, size, kwargs):
+                if not _put(items, hits, stop):
+                    return
+            _put(items, None, stop)
+        except Exception as e:
+            _put(items, e, stop)
+
+    def iter_slice(items):
+        while True:
+            hits = _get(items)
+            if hits is None:
+                return
+            yield from hits
+
+    executor = ThreadPoolExecutor(max_workers=slices, thread_name_prefix='pit_slice')
+    try:
+        for slice_id in range(slices):
+            executor.submit(fetch_slice, slice_id)
+        if ordered:
+            sort_key = cmp_to_key(partial(_compare_sort_values, orders))
+            yield from heapq.merge(*(iter_slice(items) for items in queues),
+                                   key=lambda hit: sort_key(hit['sort']))
+        else:
+            finished = 0
+            while finished < slices:
+                hits = _get(queues[0])
+                if hits is None:
+                    finished += 1
+                else:
+                    yield from hits
+    finally:
+        stop.set()
+        executor.shutdown(wait=True)
+        es.close_point_in_time(body={'id': pit['id']}, ignore=404)
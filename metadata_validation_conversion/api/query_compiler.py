@@ -0,0 +1,269 @@
+import re
+import copy
+import json
+import time
+import logging
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from elasticsearch import TransportError
+
+from metadata_validation_conversion.es_client import get_es_client
+
+from .array_counts import count_field_name
+
+logger = logging.getLogger(__name__)
+
+SORT_FIELD_RE = re.compile(r'[A-Za-z0-9_.]+')
+
+# index -> (time fetched, {field path: type})
+_mappings = {}
+# index -> time after which mapping that couldn't be fetched is requested again
+_mapping_retries = {}
+_mappings_lock = threading.Lock()
+
+
+def _flatten_properties(properties, prefix, fields):
+    for name, definition in properties.items():
+        path = f"{prefix}{name}"
+        fields[path] = definition.get('type', 'object')
+        for sub_name, sub_definition in definition.get('fields', {}).items():
+            fields[f"{path}.{sub_name}"] = sub_definition.get('type')
+        if 'properties' in definition:
+            _flatten_properties(definition['properties'], f"{path}.", fields)
+
+
+def get_index_mapping(index):
+    """
+    This function will return flattened mapping of the index, mapping is
+    fetched once and then reused for ES_MAPPING_CACHE_TTL seconds. Failed
+    fetches are not cached, previous mapping is used until the next retry
+    :param index: name of the index
+    :return: dict with field paths and their types, empty if not available
+    """
+    cached = _mappings.get(index)
+    if cached and time.monotonic() - cached[0] < settings.ES_MAPPING_CACHE_TTL:
+        return cached[1]
+    with _mappings_lock:
+        cached = _mappings.get(index)
+        if cached and time.monotonic() - cached[0] < settings.ES_MAPPING_CACHE_TTL:
+            return cached[1]
+        # retry in a minute rather than on every request
+        if time.monotonic() < _mapping_retries.get(index, 0):
+            return cached[1] if cached else {}
+        try:
+            response = get_es_client().indices.get_mapping(index=index)
+        except TransportError as e:
+            logger.warning(f"Couldn't fetch mapping for {index}: {e}")
+            _mapping_retries[index] = time.monotonic() + 60
+            return cached[1] if cached else {}
+        fields = {}
+        # index can be an alias, merge mappings of all concrete indices
+        for index_mapping in response.values():
+            _flatten_properties(index_mapping.get('mappings', {}).get('properties', {}), '', fields)
+        _mappings[index] = (time.monotonic(), fields)
+        _mapping_retries.pop(index, None)
+        # compiled bodies depend on the mapping
+        _compile_search_body.cache_clear()
+        return fields
+
+
+def keyword_field(index, field):
+    """
+    This function will return field to use for exact matching and
+    aggregations: text fields are replaced with their keyword subfield
+    :param index: name of the index, None to skip mapping lookup
+    :param field: field path
+    :return: field path
+    """
+    if index is None:
+        return field
+    mapping = get_index_mapping(index)
+    if mapping.get(field) == 'text' and mapping.get(f"{field}.keyword") == 'keyword':
+        return f"{field}.keyword"
+    return field
+
+
+def compile_filters(index, filters):
+    """
+    This function will convert portal filters to filter context clauses
+    :param index: name of the index
+    :param filters: dict in the format {field1: [val1, val2], ...}, 'false'
+    as the first value excludes documents where field is true
+    :return: filter clauses and must_not clauses
+    """
+    filter_values = []
+    not_filter_values = []
+    for key, values in filters.items():
+        # status_activity filter is a special case because the status property
+        # is found within status_activity array of objects
+        if key == 'status_activity':
+            filter_values.append({
+                "nested": {
+                    "path": "status_activity",
+                    "query": {
+                        "bool": {
+                            "filter": [{"match": {"status_activity.status": values[0]}}]
+                        }
+                    }
+                }})
+        elif values[0] != 'false':
+            filter_values.append({"terms": {keyword_field(index, key): values}})
+        else:
+            not_filter_values.append({"match": {key: "true"}})
+
+    if index == 'protocol_samples':
+        filter_values.append({
+            "bool": {
+                "should": [
+                    {"wildcard": {"url": "*/protocols/*"}},
+                    {"wildcard": {"url": "https://data.faang.org/api/fire_api/*"}}
+                ],
+                "minimum_should_match": 1
+            }
+        })
+    return filter_values, not_filter_values
+
+
+def compile_nested_filters(basic_query, index=None, prefix=''):
+    """
+    This function will convert nested filter object (as used by the graphql
+    api) to list of terms clauses, e.g. {organism: {text: [val]}} becomes
+    {terms: {organism.text: [val]}}
+    :param basic_query: nested dict with lists of values as leaves
+    :param index: name of the index, None to skip mapping lookup
+    :param prefix: path of basic_query in the document
+    :return: list of terms clauses
+    """
+    clauses = []
+    for key, value in basic_query.items():
+        es_key = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            clauses.extend(compile_nested_filters(value, index, es_key))
+        else:
+            clauses.append({"terms": {keyword_field(index, es_key): value}})
+    return clauses
+
+
+def compile_aggs(index, aggregations):
+    """
+    This function will convert portal aggregations to ES aggregations
+    :param index: name of the index
+    :param aggregations: dict in the format {aggName1: field1, ...}
+    :return: ES aggregations
+    """
+    agg_values = {}
+    for key, field in aggregations.items():
+        # status_activity aggregation is a special case because the status property is a nested property
+        if key == 'status_activity':
+            agg_values[key] = {
+                "nested": {
+                    "path": "status_activity"
+                },
+                "aggs": {
+                    "status": {
+                        "terms": {
+                            "field": "status_activity.status", 'size': 25
+                        }
+                    }
+                }
+            }
+        else:
+            # size determines number of aggregation buckets returned
+            agg_values[key] = {"terms": {"field": keyword_field(index, field), "size": 25}}
+            if key == 'paper_published':
+                # aggregations for missing paperPublished field
+                agg_values["paper_published_missing"] = {
+                    "missing": {"field": "paperPublished"}}
+    return agg_values
+
+
+def compile_sort_by_count(sort_by_count, index=None):
+    """
+    This function will generate sort by length of field array, count field
+    stored at index time (see api/array_counts.py) is used when the index has
+    it, script reading _source is used otherwise
+    :param sort_by_count: field and order in the format field:asc
+    :param index: name of the index, None to skip mapping lookup
+    :return: sort clause
+    """
+    sort_field, _, order = sort_by_count.partition(':')
+    # sort_field is interpolated into a Painless script, so restrict it to
+    # field-name characters and the order to a known set to prevent script
+    # injection (CWE-94).
+    if not SORT_FIELD_RE.fullmatch(sort_field) or order not in ('asc', 'desc'):
+        raise ValueError('Invalid sort_by_count parameter')
+    count_field = count_field_name(sort_field)
+    if index is not None and get_index_mapping(index).get(count_field) == 'integer':
+        # documents indexed before the pipeline was installed have no count
+        return {count_field: {"order": order, "missing": 0}}
+    return {
+        "_script": {
+            "type": "number",
+            "script": f"params._source?.{sort_field}?.length ?: 0",
+            "order": f"{order}"
+        }
+    }
+
+
+@lru_cache(maxsize=1024)
+def _compile_search_body(index, filters, aggregations, search, sort_by_count):
+    body = {}
+    filter_values, not_filter_values = compile_filters(index, json.loads(filters))
+    bool_query = {}
+    if filter_values:
+        bool_query['filter'] = filter_values
+    if not_filter_values:
+        bool_query['must_not'] = not_filter_values
+    # free text search is the only clause that contributes to scoring
+    if search:
+        bool_query['must'] = [{
+            'multi_match': {
+                'query': search,
+                'fields': ['*']
+            }
+        }]
+    if bool_query:
+        body['query'] = {'bool': bool_query}
+
+    agg_values = compile_aggs(index, json.loads(aggregations))
+    if agg_values:
+        body['aggs'] = agg_values
+
+    if sort_by_count:
+        body['sort'] = compile_sort_by_count(sort_by_count, index)
+    return body
+
+
+def _canonical(value):
+    if isinstance(value, str):
+        value = json.loads(value or '{}')
+    return json.dumps(value, sort_keys=True, separators=(',', ':'))
+
+
+def _mapping_unavailable(index):
+    return index in _mapping_retries and index not in _mappings
+
+
+def compile_search_body(index, filters=None, aggregations=None, search='', sort_by_count=''):
+    """
+    This function will generate ES query body for portal search parameters,
+    bodies for repeated parameters are memoized
+    :param index: name of the index
+    :param filters: dict or json string {field1: [val1, val2], ...}
+    :param aggregations: dict or json string {aggName1: field1, ...}
+    :param search: free text search
+    :param sort_by_count: field:order to sort by length of field array
+    :return: ES query body, callers are free to modify it
+    """
+    args = (index, _canonical(filters or {}), _canonical(aggregations or {}),
+            search or '', sort_by_count or '')
+    if _mapping_unavailable(index):
+        # bodies compiled without mapping are not memoized
+        return _compile_search_body.__wrapped__(*args)
+    body = copy.deepcopy(_compile_search_body(*args))
+    if _mapping_unavailable(index):
+        # mapping fetch failed while the body was compiled
+        _compile_search_body.cache_clear()
+    return body
@@ -0,0 +1,87 @@
+import asyncio
+import weakref
+import threading
+from functools import partial
+
+# Request coalescing: while a call for a key is in flight, other callers with
+# the same key wait for it and get the same result instead of repeating it.
+# Results are shared between callers and must not be modified.
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalescing of calls made from different threads of the process
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """
+        This function will call fn unless call with the same key is already
+        in flight, in which case it waits for that call
+        :param key: key identifying the call
+        :param fn: function without arguments
+        :return: result of fn
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+
+class AsyncSingleFlight:
+    """
+    Coalescing of coroutines running on the same event loop
+    """
+
+    def __init__(self):
+        self._calls = weakref.WeakKeyDictionary()
+
+    async def do(self, key, fn):
+        """
+        This function will await fn() unless call with the same key is
+        already in flight, in which case it waits for that call
+        :param key: key identifying the call
+        :param fn: coroutine function without arguments
+        :return: result of fn
+        """
+        loop = asyncio.get_running_loop()
+        calls = self._calls.setdefault(loop, {})
+        task = calls.get(key)
+        if task is None:
+            # the call runs as a separate task, so it isn't cancelled together
+            # with the caller that started it
+            task = calls[key] = loop.create_task(fn())
+            task.add_done_callback(partial(self._forget, calls, key))
+        # shield so that cancelled caller doesn't cancel the call for others
+        return await asyncio.shield(task)
+
+    @staticmethod
+    def _forget(calls, key, task):
+        if calls.get(key) is task:
+            del calls[key]
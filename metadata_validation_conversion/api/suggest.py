@@ -0,0 +1,178 @@
+import os
+import time
+import heapq
+import logging
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+from elasticsearch import TransportError
+from elasticsearch.helpers import scan
+
+from metadata_validation_conversion.es_client import get_es_client
+from .constants import SUGGEST_FIELDS
+from .helpers import portal_index_name
+
+logger = logging.getLogger(__name__)
+
+# Typeahead suggestions are answered from memory: ids and names of documents
+# are kept in one sorted array and prefix lookup is a binary search. The array
+# is built by a background thread and rebuilt for an index only when the
+# index has changed.
+
+
+def _values(source, path):
+    """
+    This function will collect string values of the field, lists are
+    traversed on every level of the path
+    :param source: document source
+    :param path: list with parts of the field path
+    :return: generator of values
+    """
+    if isinstance(source, list):
+        for item in source:
+            yield from _values(item, path)
+    elif not path:
+        if isinstance(source, str) and source:
+            yield source
+    elif isinstance(source, dict):
+        yield from _values(source.get(path[0]), path[1:])
+
+
+def document_entries(index, hit, fields):
+    """
+    This function will generate entries of the prefix index for the document
+    :param index: name of the index
+    :param hit: ES hit
+    :param fields: paths of fields to index
+    :return: list of (key, value, index, id) tuples
+    """
+    entries = set()
+    for field in fields:
+        for value in _values(hit['_source'], field.split('.')):
+            entries.add((value.lower(), value, index, hit['_id']))
+    return entries
+
+
+class PrefixIndex:
+    """
+    Sorted array of (lowercased value, value, index, id) tuples, entries of
+    each index can be replaced separately
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        # replaced as a whole, so readers don't need the lock
+        self._keys = []
+        self._values = []
+
+    def update(self, index, entries):
+        """
+        This function will replace entries of the index
+        :param index: name of the index
+        :param entries: iterable of (key, value, index, id) tuples
+        """
+        with self._lock:
+            self._entries[index] = sorted(entries)
+            merged = list(heapq.merge(*self._entries.values()))
+            self._keys, self._values = [entry[0] for entry in merged], merged
+
+    def suggest(self, prefix, size=10, indices=None):
+        """
+        This function will find values starting with prefix, case insensitive
+        :param prefix: typed text
+        :param size: max number of suggestions
+        :param indices: names of indices to return suggestions from, all by default
+        :return: list of dicts with value, index and id
+        """
+        keys, values = self._keys, self._values
+        prefix = prefix.strip().lower()
+        suggestions = []
+        seen = set()
+        position = bisect_left(keys, prefix)
+        # don't walk the whole array when filter by index excludes most entries
+        end = min(len(keys), position + size * 100)
+        while position < end and keys[position].startswith(prefix) and len(suggestions) < size:
+            _, value, index, id = values[position]
+            position += 1
+            if (indices and index not in indices) or (value, index) in seen:
+                continue
+            seen.add((value, index))
+            suggestions.append({'value': value, 'index': portal_index_name(index), 'id': id})
+        return suggestions
+
+    def __len__(self):
+        return len(self._keys)
+
+
+suggest_index = PrefixIndex()
+# index -> stats used to detect changes
+_fingerprints = {}
+_builder_pid = None
+_builder_lock = threading.Lock()
+
+
+def _fingerprint(es, index):
+    stats = es.indices.stats(index=index, metric='docs,indexing')['_all']['primaries']
+    return (stats['docs']['count'], stats['indexing']['index_total'],
+            stats['indexing']['delete_total'])
+
+
+def refresh_index(es, index, fields):
+    """
+    This function will reload entries of the index if it has changed since
+    the last refresh
+    :param es: Elasticsearch client
+    :param index: name of the index
+    :param fields: paths of fields to index
+    :return: True if entries were reloaded
+    """
+    fingerprint = _fingerprint(es, index)
+    if _fingerprints.get(index) == fingerprint:
+        return False
+    entries = set()
+    for hit in scan(es, index=index, query={'_source': fields}, size=1000):
+        entries.update(document_entries(index, hit, fields))
+    suggest_index.update(index, entries)
+    _fingerprints[index] = fingerprint
+    logger.info(f"Suggest index for {index} reloaded with {len(entries)} entries")
+    return True
+
+
+def refresh_all(es):
+    """
+    This function will refresh entries of all indices, index that fails keeps
+    entries from the previous refresh
+    :param es: Elasticsearch client
+    """
+    for index, fields in SUGGEST_FIELDS.items():
+        try:
+            refresh_index(es, index, fields)
+        except TransportError as e:
+            logger.warning(f"Couldn't refresh suggest index for {index}: {e}")
+        except Exception:
+            # e.g. unexpected document, builder thread has to keep running
+            logger.exception(f"Couldn't refresh suggest index for {index}")
+
+
+def _run_builder():
+    es = get_es_client()
+    while True:
+        refresh_all(es)
+        time.sleep(settings.SUGGEST_REFRESH_INTERVAL)
+
+
+def start_suggest_builder():
+    """
+    This function will start background thread that builds suggest index and
+    keeps it up to date, it's started once per process
+    """
+    global _builder_pid
+    if not settings.SUGGEST_ENABLED or _builder_pid == os.getpid():
+        return
+    with _builder_lock:
+        if _builder_pid == os.getpid():
+            return
+        _builder_pid = os.getpid()
+        threading.Thread(target=_run_builder, name='suggest-builder', daemon=True).start()
@@ -184,3 +184,24 @@ index_search_request_example = {
         }
     }
 }
+
+index_msearch_request_example = [
+    {
+        "index": "2026_03_26_organism",
+        "size": 10,
+        "filters": {"standardMet": ["FAANG"]},
+        "aggs": {"sex": "sex.text"}
+    },
+    {
+        "index": "2026_03_26_specimen",
+        "size": 0,
+        "search": "liver"
+    }
+]
+
+index_msearch_response_example = {
+    "responses": [
+        index_search_response_example,
+        index_search_response_example
+    ]
+}
@@ -1,35 +1,259 @@
 from abc import ABC
 from celery import Task
-from metadata_validation_conversion.celery import app
-from elasticsearch import Elasticsearch
-from elasticsearch import RequestsHttpConnection
 from django.conf import settings
+from metadata_validation_conversion.celery import app
+from metadata_validation_conversion.es_client import get_es_client
+from metadata_validation_conversion.helpers import send_message
+from .cache import get_redis, current_cache_key
+from .constants import ID_MAP_INDICES
+from .id_map import build_id_map
+from .export import prepare_export, count_records, export_stream
+import io
+import os
 import json
+import time
+import shutil
+import uuid
+import redis
+import requests
+import tempfile
 import logging
+from urllib3.fields import RequestField
 
 logger = logging.getLogger(__name__)
 
+EXPORT_UPLOAD_URL = 'http://nginx-svc:80/files_upload'
+EXPORT_DOWNLOAD_URL = 'https://api.faang.org/files/exports'
+# the same directory as served by nginx, the volume is shared with workers
+EXPORT_FILES_DIR = '/usr/share/nginx/html/files/exports'
+# progress is reported after every EXPORT_PROGRESS_STEP records
+EXPORT_PROGRESS_STEP = 10000
+
 
 class CeleryTask(Task, ABC):
     abstract = True
 
 
-@app.task(bind=True, base=CeleryTask)
-def es_search_task(self, index, key_args):
+def export_job_key(name, params):
+    """
+    This function will generate redis key of the export job, key changes when
+    the index is invalidated, so modified data is exported again
+    :param name: name of the index
+    :param params: download parameters
+    :return: redis key
+    """
+    return f"export:{current_cache_key(name, params)}"
+
+
+def get_export_job(key):
+    """
+    This function will return export job stored for key
+    :param key: key from export_job_key
+    :return: dict with task 'id' and 'url' when finished, or None
+    """
+    job = get_redis().get(key)
+    return json.loads(job) if job is not None else None
+
+
+def claim_export_job(key, task_id):
+    """
+    This function will register task as the one building the export for key,
+    claim expires unless the task refreshes it, see refresh_export_job
+    :param key: key from export_job_key
+    :param task_id: id of the task
+    :return: True if there was no job for the key yet
+    """
+    return bool(get_redis().set(key, json.dumps({'id': task_id}), nx=True,
+                                ex=settings.EXPORT_CLAIM_TTL))
+
+
+def refresh_export_job(key, task_id):
+    """
+    This function will extend the claim of the running task, so that the job
+    of a worker that died is released after EXPORT_CLAIM_TTL
+    :param key: key from export_job_key
+    :param task_id: id of the task
+    """
+    job = get_export_job(key)
+    if job is not None and job['id'] == task_id and 'url' not in job:
+        get_redis().set(key, json.dumps({'id': task_id}), xx=True, ex=settings.EXPORT_CLAIM_TTL)
+
+
+def release_export_job(key, task_id):
+    """
+    This function will remove unfinished job of the task, so that the next
+    identical request starts a new export
+    :param key: key from export_job_key
+    :param task_id: id of the task
+    """
+    job = get_export_job(key)
+    if job is not None and job['id'] == task_id and 'url' not in job:
+        get_redis().delete(key)
+
+
+def finish_export_job(key, task_id, url):
+    """
+    This function will store url of the finished export for key
+    :param key: key from export_job_key
+    :param task_id: id of the task
+    :param url: url of the exported file
+    """
+    get_redis().set(key, json.dumps({'id': task_id, 'url': url}), ex=settings.EXPORT_JOB_TTL)
+
+
+class MultipartStream:
+    """
+    Body of multipart/form-data request read part by part, so uploaded file
+    isn't loaded into memory
+    """
+
+    def __init__(self, fields, name, filename, fileobj, content_type):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f'multipart/form-data; boundary={self.boundary}'
+        self._parts = []
+        for field, value in fields.items():
+            self._parts.append(io.BytesIO(self._header(RequestField(field, value)) +
+                                          value.encode('utf-8') + b'\r\n'))
+        file_field = RequestField(name, b'', filename)
+        file_field.make_multipart(content_type=content_type)
+        self._parts.append(io.BytesIO(self._header(file_field)))
+        self._parts.append(fileobj)
+        self._parts.append(io.BytesIO(f'\r\n--{self.boundary}--\r\n'.encode('utf-8')))
+        self._size = sum(len(part.getvalue()) for part in self._parts if isinstance(part, io.BytesIO)) + \
+            os.fstat(fileobj.fileno()).st_size - fileobj.tell()
+
+    def _header(self, field):
+        if 'Content-Disposition' not in field.headers:
+            field.make_multipart()
+        return f'--{self.boundary}\r\n{field.render_headers()}'.encode('utf-8')
+
+    def __len__(self):
+        return self._size
+
+    def read(self, size=-1):
+        chunks = []
+        while self._parts and size != 0:
+            chunk = self._parts[0].read(size)
+            if not chunk:
+                self._parts.pop(0)
+                continue
+            chunks.append(chunk)
+            if size > 0:
+                size -= len(chunk)
+        return b''.join(chunks)
+
+
+class ExportTask(Task, ABC):
+    abstract = True
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        send_message(room_id=task_id, submission_message='Export failed',
+                     errors=f'Error: {exc}')
+        # let the next identical request start a new export
+        if args[0] is not None:
+            try:
+                release_export_job(args[0], task_id)
+            except redis.RedisError as e:
+                logger.warning(f"Couldn't remove export job {args[0]}: {e}")
+
+
+def remove_expired_exports(files_dir=EXPORT_FILES_DIR):
+    """
+    This function will remove exported files older than EXPORT_FILES_TTL
+    :param files_dir: directory with one subdirectory per export
+    :return: number of removed exports
+    """
+    removed = 0
+    expired = time.time() - settings.EXPORT_FILES_TTL
+    if not os.path.isdir(files_dir):
+        return removed
+    for entry in os.scandir(files_dir):
+        if entry.is_dir(follow_symlinks=False) and entry.stat(follow_symlinks=False).st_mtime < expired:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+@app.task
+def rebuild_id_maps():
+    """
+    This task will rebuild identifier maps of ID_MAP_INDICES, runs
+    periodically from celery beat, see CELERY_BEAT_SCHEDULE
+    :return: number of documents in the map per index
+    """
+    es = get_es_client()
+    counts = {}
+    for index in ID_MAP_INDICES:
+        try:
+            counts[index] = build_id_map(es, index)
+        except Exception:
+            # map of other indices is still rebuilt, detail falls back to search
+            logger.exception(f"Couldn't build identifier map for {index}")
+    return counts
+
+
+def _heartbeat(key, task_id):
+    if key is None:
+        return
+    try:
+        refresh_export_job(key, task_id)
+    except redis.RedisError as e:
+        logger.warning(f"Couldn't refresh export job {key}: {e}")
 
-    es = Elasticsearch([settings.NODE], connection_class=RequestsHttpConnection,
-                       http_auth=(settings.ES_USER, settings.ES_PASSWORD), use_ssl=True, verify_certs=True)
 
-    data = es.search(
-        index=index, body=key_args['body'], track_total_hits=key_args['track_total_hits']
-    )
+@app.task(base=ExportTask, bind=True)
+def export_records(self, key, name, params):
+    """
+    This task will write records of the index to file on the nginx file
+    server, the file is served as static file, so downloads can be resumed
+    with HTTP Range requests
+    :param key: key of the job from export_job_key or None
+    :param name: name of the index
+    :param params: download parameters, same as for download view
+    :return: dict with url of the file
+    """
+    task_id = self.request.id
+    _heartbeat(key, task_id)
+    send_message(room_id=task_id, submission_message='Starting export')
+    es = get_es_client()
+    total = count_records(es, name, params)
+    records, columns, column_names = prepare_export(es, name, params)
 
-    index = index.replace(
-        'protocol_files', 'protocol/experiments'
-    ).replace(
-        'protocol_analysis', 'protocol/analysis'
-    ).replace('protocol_samples', 'protocol/samples')
+    def report_progress(records):
+        for count, record in enumerate(records, start=1):
+            yield record
+            if count % EXPORT_PROGRESS_STEP == 0:
+                _heartbeat(key, task_id)
+                self.update_state(state='PROGRESS', meta={'records': count, 'total': total})
+                send_message(room_id=task_id, submission_message=f'Exported {count} of {total} records')
 
-    data['index'] = index
+    chunks, content_type, filename = export_stream(
+        report_progress(records), columns, column_names, params.get('file_format', ''))
+    with tempfile.TemporaryFile() as output:
+        for chunk in chunks:
+            output.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        output.seek(0)
+        _heartbeat(key, task_id)
+        send_message(room_id=task_id, submission_message='Uploading file')
+        data = {
+            'path': f'exports/{task_id}',
+            'name': filename
+        }
+        # file is streamed from disk rather than encoded in memory
+        body = MultipartStream(data, 'file', filename, output, content_type)
+        res = requests.post(EXPORT_UPLOAD_URL, data=body, headers={'Content-Type': body.content_type})
+    if res.status_code != 200:
+        raise RuntimeError(f"Upload failed with status {res.status_code}")
 
-    return data
+    url = f'{EXPORT_DOWNLOAD_URL}/{task_id}/{filename}'
+    if key is not None:
+        try:
+            finish_export_job(key, task_id, url)
+        except redis.RedisError as e:
+            logger.warning(f"Couldn't store export job {key}: {e}")
+    send_message(room_id=task_id, submission_message=f'Success! Please download your file at \n {url}')
+    try:
+        remove_expired_exports()
+    except OSError as e:
+        logger.warning(f"Couldn't remove expired exports: {e}")
+    return {'url': url, 'records': total}
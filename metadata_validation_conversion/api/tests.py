@@ -1,3 +1,973 @@
-from django.test import TestCase
+import time
+import gzip
+import unittest
+import json
+import asyncio
+import threading
+from unittest import mock
 
-# Create your tests here.
+from elasticsearch import Connection, ConnectionError, Elasticsearch, TransportError
+from django.test import SimpleTestCase, RequestFactory, AsyncRequestFactory, override_settings
+
+from metadata_validation_conversion.es_client import raw_search, RawJSON, RawJSONSerializer
+from . import async_views
+from .helpers import raw_json_response, search_etag, detail_etag, etag_matches, portal_index_name, \
+    GLOBAL_ALLOWED_INDICES
+from .singleflight import SingleFlight, AsyncSingleFlight
+from .suggest import PrefixIndex, document_entries, refresh_all
+from .id_map import fetch_by_ids, build_id_map
+from .export import iter_tabular, export_stream
+from .array_counts import array_count_mapping, array_count_pipeline, install_array_counts
+from .cache import make_cache_key, normalize_params
+from . import query_compiler, constants, export
+from .query_compiler import compile_nested_filters, compile_search_body
+from .pagination import START_CURSOR, InvalidCursor, cursor_search, decode_cursor, encode_cursor, parse_sort, \
+    iter_pit, iter_pit_slices
+
+
+class SearchCacheKeyTests(SimpleTestCase):
+
+    def test_normalize_params_is_order_independent(self):
+        first = normalize_params({'filters': '{"a": ["1"], "b": ["2"]}', 'size': 10, 'search': ''})
+        second = normalize_params({'size': '10', 'filters': {'b': ['2'], 'a': ['1']}})
+        self.assertEqual(first, second)
+
+    def test_cache_key_depends_on_index_and_generation(self):
+        params = {'filters': {'a': ['1']}}
+        self.assertNotEqual(make_cache_key('file', params), make_cache_key('specimen', params))
+        self.assertNotEqual(make_cache_key('file', params, 0), make_cache_key('file', params, 1))
+
+
+class FakeEs:
+    def __init__(self, hits):
+        self.hits = hits
+        self.bodies = []
+        self.closed = []
+
+    def open_point_in_time(self, index, keep_alive):
+        return {'id': 'pit-1'}
+
+    def close_point_in_time(self, body, ignore=None):
+        self.closed.append(body['id'])
+
+    def search(self, body, size, **kwargs):
+        self.bodies.append(body)
+        hits = self.hits
+        if 'slice' in body:
+            hits = [hit for i, hit in enumerate(hits) if i % body['slice']['max'] == body['slice']['id']]
+        start = 0
+        if 'search_after' in body:
+            start = [hit['sort'] for hit in hits].index(body['search_after']) + 1
+        return {'pit_id': 'pit-2', 'hits': {'hits': hits[start:start + size]}}
+
+
+class InvalidationTests(SimpleTestCase):
+
+    def test_writes_are_refreshed_before_invalidation(self):
+        from trackhubs.tasks import associate_specimen
+        calls = mock.Mock()
+        data = {'Hub Data': [{'Name': 'hub'}], 'Genome Data': [{'Assembly Accession': 'GCA_1'}],
+                'Tracks Data': [{'Related Specimen ID': ['SAMEA1']}]}
+        with mock.patch('trackhubs.tasks.get_es_client', return_value=calls.es), \
+                mock.patch('trackhubs.tasks.send_message'), \
+                mock.patch('api.cache.invalidate_index', calls.invalidate_index):
+            associate_specimen({'error_flag': False, 'data': data}, 'room')
+        self.assertEqual([call[0] for call in calls.mock_calls],
+                         ['es.update', 'es.indices.refresh', 'invalidate_index'])
+        calls.es.indices.refresh.assert_called_once_with(index='specimen')
+        calls.invalidate_index.assert_called_once_with('specimen')
+
+
+class TrackhubSpecimenTests(SimpleTestCase):
+
+    @staticmethod
+    def _mget(url, json):
+        response = mock.Mock(status_code=200)
+        response.json.return_value = {'docs': [{'id': id, 'found': id != '12.0'} for id in json['ids']]}
+        return response
+
+    def test_specimen_ids_are_checked_in_chunks(self):
+        from trackhubs.tasks import find_invalid_specimen_ids
+        ids = [f"SAMEA{i}" for i in range(constants.MGET_MAX_IDS + 1)] + [12.0]
+        with mock.patch('trackhubs.tasks.requests.post', side_effect=self._mget) as post:
+            self.assertEqual(find_invalid_specimen_ids(ids), ['12.0'])
+        self.assertEqual([len(call.kwargs['json']['ids']) for call in post.call_args_list],
+                         [constants.MGET_MAX_IDS, 2])
+
+    def test_request_error_is_not_reported_as_invalid_ids(self):
+        from requests import HTTPError
+        from trackhubs.tasks import validate
+        data = {'Tracks Data': [{'Related Specimen ID': ['SAMEA1']}]}
+        response = mock.Mock(status_code=400)
+        response.raise_for_status.side_effect = HTTPError('400 Client Error')
+        with mock.patch('trackhubs.tasks.requests.post', return_value=response), \
+                mock.patch('trackhubs.tasks.send_message'):
+            result = validate({'error_flag': False, 'data': data}, {}, 'room')
+        self.assertTrue(result['error_flag'])
+        self.assertEqual(result['data']['Tracks Data'][0]['Related Specimen ID'],
+                         "Couldn't check specimen IDs: 400 Client Error")
+
+
+class CursorPaginationTests(SimpleTestCase):
+
+    def test_cursor_round_trip(self):
+        token = encode_cursor('pit-1', ['2020-01-01', 5])
+        self.assertEqual(decode_cursor(token), ('pit-1', ['2020-01-01', 5]))
+        with self.assertRaises(InvalidCursor):
+            decode_cursor('not a cursor')
+
+    def test_parse_sort(self):
+        self.assertEqual(parse_sort('releaseDate:desc,id'), [{'releaseDate': 'desc'}, {'id': 'asc'}])
+
+    def test_cursor_search_walks_all_pages(self):
+        es = FakeEs([{'_id': str(i), 'sort': [i]} for i in range(5)])
+        seen = []
+        cursor = START_CURSOR
+        while cursor:
+            data = cursor_search(es, 'file', {}, 2, sort='id:asc', cursor=cursor)
+            seen.extend(hit['_id'] for hit in data['hits']['hits'])
+            cursor = data['next']
+        self.assertEqual(seen, ['0', '1', '2', '3', '4'])
+        self.assertEqual(es.bodies[0]['sort'], [{'id': 'asc'}, {'_shard_doc': 'asc'}])
+        self.assertEqual(es.bodies[1]['pit']['id'], 'pit-2')
+        self.assertEqual(es.closed, ['pit-2'])
+
+
+class QueryCompilerTests(SimpleTestCase):
+    mapping = {'organism': 'object', 'organism.text': 'text', 'organism.text.keyword': 'keyword',
+               'paperPublished': 'keyword'}
+
+    def test_filters_go_to_filter_context_with_keyword_fields(self):
+        with mock.patch('api.query_compiler.get_index_mapping', return_value=self.mapping):
+            body = compile_search_body('cache_test_organism', '{"organism.text": ["Sus scrofa"], '
+                                                              '"paperPublished": ["false"]}',
+                                       {'species': 'organism.text'}, 'liver')
+        self.assertEqual(body['query']['bool']['filter'],
+                         [{'terms': {'organism.text.keyword': ['Sus scrofa']}}])
+        self.assertEqual(body['query']['bool']['must_not'], [{'match': {'paperPublished': 'true'}}])
+        self.assertEqual(body['query']['bool']['must'][0]['multi_match']['query'], 'liver')
+        self.assertEqual(body['aggs']['species']['terms']['field'], 'organism.text.keyword')
+
+    def test_compiled_body_is_a_copy(self):
+        body = compile_search_body('cache_test_file', {})
+        body['query'] = {}
+        self.assertEqual(compile_search_body('cache_test_file', {}), {})
+
+    def test_body_compiled_without_mapping_is_not_memoized(self):
+        es = mock.Mock()
+        es.indices.get_mapping.side_effect = [
+            TransportError(500, 'unavailable'),
+            {'cache_test_outage': {'mappings': {'properties': {
+                'breed': {'type': 'text', 'fields': {'keyword': {'type': 'keyword'}}}}}}}]
+        with mock.patch('api.query_compiler.get_es_client', return_value=es):
+            body = compile_search_body('cache_test_outage', {'breed': ['Duroc']})
+            self.assertEqual(body['query']['bool']['filter'], [{'terms': {'breed': ['Duroc']}}])
+            # mapping is fetched again once the retry delay has passed
+            query_compiler._mapping_retries['cache_test_outage'] = 0
+            body = compile_search_body('cache_test_outage', {'breed': ['Duroc']})
+        self.assertEqual(body['query']['bool']['filter'], [{'terms': {'breed.keyword': ['Duroc']}}])
+
+    def test_invalid_sort_by_count(self):
+        with self.assertRaises(ValueError):
+            compile_search_body('cache_test_file', {}, sort_by_count='a;b:asc')
+
+    def test_sort_by_count_uses_count_field(self):
+        with mock.patch('api.query_compiler.get_index_mapping', return_value={'specimen_count': 'integer'}):
+            body = compile_search_body('cache_test_dataset', {}, sort_by_count='specimen:desc')
+        self.assertEqual(body['sort'], {'specimen_count': {'order': 'desc', 'missing': 0}})
+        with mock.patch('api.query_compiler.get_index_mapping', return_value={}):
+            body = compile_search_body('cache_test_dataset_2', {}, sort_by_count='specimen:desc')
+        self.assertIn('_script', body['sort'])
+
+    def test_array_count_pipeline(self):
+        fields = ['specimen', 'organism.breed']
+        pipeline = array_count_pipeline(fields)
+        self.assertEqual(pipeline['processors'][0]['script']['params']['fields'], fields)
+        self.assertEqual(array_count_mapping(fields)['properties'],
+                         {'specimen_count': {'type': 'integer'}, 'organism_breed_count': {'type': 'integer'}})
+
+    def test_array_counts_keep_existing_default_pipeline(self):
+        es = mock.Mock()
+        es.indices.get_settings.return_value = {
+            'dataset_v2': {'settings': {'index.default_pipeline': 'timestamps'}}}
+        with self.assertRaises(ValueError):
+            install_array_counts(es, 'dataset', ['specimen'])
+        es.indices.put_settings.assert_not_called()
+
+        install_array_counts(es, 'dataset', ['specimen'], chain=True)
+        processors = es.ingest.put_pipeline.call_args.kwargs['body']['processors']
+        self.assertEqual(processors[0], {'pipeline': {'name': 'timestamps'}})
+        es.indices.put_settings.assert_called_once_with(
+            index='dataset', body={'index': {'default_pipeline': 'dataset_array_counts'}})
+
+    def test_nested_filters(self):
+        self.assertEqual(compile_nested_filters({'organism': {'text': ['Bos taurus']}, 'sex': ['female']}),
+                         [{'terms': {'organism.text': ['Bos taurus']}}, {'terms': {'sex': ['female']}}])
+
+
+class FakeAsyncEs:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = []
+        self.gets = []
+
+    async def search(self, **kwargs):
+        self.calls.append(kwargs)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    async def get(self, **kwargs):
+        self.gets.append(kwargs)
+        return {'_index': kwargs['index'], '_id': kwargs['id'], 'found': True,
+                '_source': {'biosampleId': kwargs['id']}}
+
+
+@override_settings(SEARCH_CACHE_ENABLED=False)
+class AsyncViewTests(SimpleTestCase):
+
+    @staticmethod
+    def _response(total, hits=()):
+        return {'hits': {'total': {'value': total}, 'hits': list(hits)}}
+
+    async def test_detail_prefers_id_over_alternative_id(self):
+        es = FakeAsyncEs([self._response(2, [
+            {'_id': 'b', 'matched_queries': ['alternativeId']},
+            {'_id': 'SAMEA1', 'matched_queries': ['_id', 'biosampleId']}])])
+        request = AsyncRequestFactory().get('/data/async/specimen/SAMEA1')
+        with mock.patch('api.async_views.get_async_es_client', return_value=es), \
+                mock.patch('api.async_views.resolve_id', return_value=None), \
+                mock.patch('api.async_views.remember_id') as remember_id:
+            response = await async_views.detail(request, 'specimen', 'SAMEA1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(es.calls), 1)
+        self.assertEqual(json.loads(response.content)['hits'],
+                         {'total': {'value': 1, 'relation': 'eq'}, 'hits': [{'_id': 'SAMEA1'}]})
+        remember_id.assert_called_once_with('specimen', 'SAMEA1', 'SAMEA1')
+
+    async def test_detail_uses_id_map(self):
+        es = FakeAsyncEs([])
+        request = AsyncRequestFactory().get('/data/async/specimen/ALT1')
+        with mock.patch('api.async_views.get_async_es_client', return_value=es), \
+                mock.patch('api.async_views.resolve_id', return_value='SAMEA1'):
+            response = await async_views.detail(request, 'specimen', 'ALT1')
+        hits = json.loads(response.content)['hits']['hits']
+        self.assertEqual([(hit['_id'], hit['_source']) for hit in hits], [('SAMEA1', {'biosampleId': 'SAMEA1'})])
+        self.assertEqual(es.calls, [])
+        self.assertEqual(es.gets, [{'index': 'specimen', 'id': 'SAMEA1', 'ignore': 404}])
+
+    async def test_global_search_runs_all_indices(self):
+        es = FakeAsyncEs([self._response(1, [{'_id': 'a'}]) for _ in async_views.GLOBAL_ALLOWED_INDICES])
+        request = AsyncRequestFactory().get('/data/async/_gsearch/', {'sterm': 'liver'})
+        with mock.patch('api.async_views.get_async_es_client', return_value=es), \
+                mock.patch('api.query_compiler.get_index_mapping') as get_index_mapping:
+            response = await async_views.globindex(request)
+        get_index_mapping.assert_not_called()
+        self.assertEqual(len(es.calls), len(async_views.GLOBAL_ALLOWED_INDICES))
+        self.assertIn('protocol/samples', json.loads(response.content))
+
+    async def test_global_search_skips_failed_index(self):
+        responses = [self._response(1, [{'_id': 'a'}]) for _ in async_views.GLOBAL_ALLOWED_INDICES]
+        responses[0] = ConnectionError('N/A', 'timed out', None)
+        es = FakeAsyncEs(responses)
+        request = AsyncRequestFactory().get('/data/async/_gsearch/', {'sterm': 'liver'})
+        with mock.patch('api.async_views.get_async_es_client', return_value=es):
+            response = await async_views.globindex(request)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertNotIn(portal_index_name(async_views.GLOBAL_ALLOWED_INDICES[0]), data)
+        self.assertEqual(len(data), len(async_views.GLOBAL_ALLOWED_INDICES) - 1)
+
+    async def test_global_search_socket_rejects_malformed_message(self):
+        from channels.testing import WebsocketCommunicator
+        from ws.consumers import GlobalSearchConsumer
+        communicator = WebsocketCommunicator(GlobalSearchConsumer.as_asgi(), '/ws/gsearch/')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        for message in ['not json', '["liver"]', '{"sterm": 1}']:
+            await communicator.send_to(text_data=message)
+            self.assertEqual(json.loads(await communicator.receive_from())['status'], '400')
+        # socket is still open
+        await communicator.send_to(text_data='null')
+        self.assertEqual(json.loads(await communicator.receive_from())['status'], '400')
+        await communicator.disconnect()
+
+    async def test_global_search_socket_skips_failed_index(self):
+        from channels.testing import WebsocketCommunicator
+        from ws.consumers import GlobalSearchConsumer
+        def search(index, body):
+            if index == GLOBAL_ALLOWED_INDICES[0]:
+                raise ValueError('bad response')
+            return self._response(1, [{'_id': 'a'}])
+
+        es = mock.Mock(search=mock.AsyncMock(side_effect=search))
+        communicator = WebsocketCommunicator(GlobalSearchConsumer.as_asgi(), '/ws/gsearch/')
+        await communicator.connect()
+        with mock.patch('ws.consumers.get_async_es_client', return_value=es):
+            await communicator.send_to(text_data=json.dumps({'sterm': 'liver'}))
+            messages = []
+            while not messages or not messages[-1].get('done'):
+                messages.append(json.loads(await communicator.receive_from()))
+        indices = [message['index'] for message in messages[:-1]]
+        self.assertNotIn(portal_index_name(GLOBAL_ALLOWED_INDICES[0]), indices)
+        self.assertEqual(len(indices), len(GLOBAL_ALLOWED_INDICES) - 1)
+        await communicator.disconnect()
+
+    async def test_streaming_response_is_produced_off_the_loop(self):
+        from django.http import StreamingHttpResponse
+        from metadata_validation_conversion.asgi_handler import StreamingASGIHandler
+        loop_thread = threading.get_ident()
+        threads = []
+
+        def parts():
+            for part in (b'a,b\n', b'1,2\n'):
+                threads.append(threading.get_ident())
+                yield part
+
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        await StreamingASGIHandler().send_response(StreamingHttpResponse(parts()), send)
+        self.assertEqual(b''.join(m.get('body', b'') for m in messages[1:]), b'a,b\n1,2\n')
+        self.assertEqual(messages[-1], {'type': 'http.response.body'})
+        self.assertNotIn(loop_thread, threads)
+
+    async def test_search_passes_raw_response_with_etag(self):
+        body = json.dumps({'hits': {'hits': [{'_id': 'a'}]}})
+        request = AsyncRequestFactory().get('/data/async/file/_search/')
+        with mock.patch('api.async_views.async_raw_search', return_value=body) as search, \
+                mock.patch('api.async_views.get_async_es_client'):
+            response = await async_views.index(request, 'file')
+            self.assertEqual(response.content, body.encode('utf-8'))
+            self.assertEqual(search.call_args.kwargs['index'], 'file')
+            # Django 3.2 AsyncRequestFactory takes headers by their names
+            request = AsyncRequestFactory().get('/data/async/file/_search/', **{'if-none-match': response['ETag']})
+            self.assertEqual((await async_views.index(request, 'file')).status_code, 304)
+
+    async def test_cursor_search_uses_async_client(self):
+        es = FakeAsyncEs([self._response(1, [{'_id': 'a', 'sort': [1]}])])
+        es.open_point_in_time = mock.AsyncMock(return_value={'id': 'pit'})
+        es.close_point_in_time = mock.AsyncMock()
+        request = AsyncRequestFactory().get(f'/data/async/file/_search/?cursor={START_CURSOR}&size=10')
+        with mock.patch('api.async_views.get_async_es_client', return_value=es):
+            response = await async_views.index(request, 'file')
+        self.assertIsNone(json.loads(response.content)['next'])
+        self.assertEqual(es.calls[0]['body']['pit']['id'], 'pit')
+        es.close_point_in_time.assert_awaited_once_with(body={'id': 'pit'}, ignore=404)
+
+    async def test_unknown_index(self):
+        request = AsyncRequestFactory().get('/data/async/unknown/_search/')
+        response = await async_views.index(request, 'unknown')
+        self.assertEqual(response.status_code, 404)
+
+
+class FakeMsearchEs:
+    def __init__(self):
+        self.searches = None
+
+    def msearch(self, body):
+        self.searches = body
+        return {'responses': [{'status': 200, 'hits': {'total': {'value': i}, 'hits': []}}
+                              for i in range(len(body) // 2)]}
+
+
+@override_settings(SEARCH_CACHE_ENABLED=False)
+class MultiSearchTests(SimpleTestCase):
+
+    def test_msearch_keeps_order_and_reports_errors(self):
+        from . import views
+        es = FakeMsearchEs()
+        specs = [
+            {'index': 'cache_test_unknown'},
+            {'index': 'file', 'size': 5, 'sort': 'id:desc', 'q': 'sex:female', '_source': 'id,name'},
+            {'index': 'file', 'sort_by_count': 'bad;field:asc'},
+            {'index': 'specimen', 'size': 0, 'filters': {'sex.text': ['female']}},
+        ]
+        with mock.patch('api.views.get_es_client', return_value=es), \
+                mock.patch('api.query_compiler.get_index_mapping', return_value={}):
+            request = RequestFactory().post('/data/_msearch/', json.dumps(specs), content_type='application/json')
+            response = views.multi_search(request)
+        responses = json.loads(response.content)['responses']
+        self.assertEqual([r.get('status') for r in responses], ['404', None, '400', None])
+        self.assertEqual([r['hits']['total']['value'] for r in (responses[1], responses[3])], [0, 1])
+        self.assertEqual(es.searches[0], {'index': 'file'})
+        self.assertEqual(es.searches[1]['sort'], [{'id': 'desc'}])
+        self.assertEqual(es.searches[1]['_source'], ['id', 'name'])
+        self.assertEqual(es.searches[1]['query']['bool']['must'], [{'query_string': {'query': 'sex:female'}}])
+        self.assertEqual(es.searches[3]['query']['bool']['filter'], [{'terms': {'sex.text': ['female']}}])
+
+    def test_msearch_reports_malformed_parameters(self):
+        from . import views
+        es = FakeMsearchEs()
+        specs = [
+            {'index': 'file', 'size': [1]},
+            {'index': 'specimen', 'filters': {'sex': []}},
+            {'index': 'file', 'filters': 5},
+            {'index': 'file'},
+        ]
+        with mock.patch('api.views.get_es_client', return_value=es), \
+                mock.patch('api.query_compiler.get_index_mapping', return_value={}):
+            request = RequestFactory().post('/data/_msearch/', json.dumps(specs), content_type='application/json')
+            response = views.multi_search(request)
+        self.assertEqual(response.status_code, 200)
+        responses = json.loads(response.content)['responses']
+        self.assertEqual([r.get('status') for r in responses], ['400', '400', '400', None])
+        self.assertEqual(es.searches[0], {'index': 'file'})
+
+
+class FakeConnection(Connection):
+    responses = []
+    requests = []
+
+    def perform_request(self, method, url, params=None, body=None, timeout=None, ignore=(), headers=None):
+        self.requests.append((method, url, params, body))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return 200, {'content-type': 'application/json', 'x-elastic-product': 'Elasticsearch'}, response
+
+
+class RawSearchTests(SimpleTestCase):
+    info = json.dumps({'version': {'number': '7.16.2', 'build_flavor': 'default'},
+                       'tagline': 'You Know, for Search'})
+
+    def setUp(self):
+        FakeConnection.requests = []
+        self.es = Elasticsearch(['a', 'b'], connection_class=FakeConnection,
+                                serializers={'application/json': RawJSONSerializer()})
+
+    def test_raw_search_returns_body_unchanged(self):
+        FakeConnection.responses = [self.info, '{"hits": {"hits": []}}']
+        data = raw_search(self.es, 'file', body={'query': {'match_all': {}}}, from_=0, size=10,
+                          _source='', sort='', track_total_hits=True)
+        self.assertEqual(data, '{"hits": {"hits": []}}')
+        method, url, params, body = FakeConnection.requests[1]
+        self.assertEqual((method, url), ('POST', '/file/_search'))
+        params = {k: v.decode() if isinstance(v, bytes) else v for k, v in params.items()}
+        self.assertEqual(params, {'from': '0', 'size': '10', 'track_total_hits': 'true'})
+        self.assertEqual(json.loads(body), {'query': {'match_all': {}}})
+
+    def test_raw_search_retries_on_connection_error(self):
+        FakeConnection.responses = [self.info, ConnectionError('N/A', 'down', None), '{}']
+        self.assertEqual(raw_search(self.es, 'file'), '{}')
+        self.assertEqual(len(FakeConnection.requests), 3)
+        self.assertEqual(len(self.es.transport.connection_pool.dead_count), 1)
+
+    def test_raw_responses_can_be_used_as_dict(self):
+        FakeConnection.responses = [self.info, '{"found": false}']
+        response = self.es.get(index='file', id='x', ignore=404)
+        self.assertIsInstance(response, RawJSON)
+        self.assertEqual(response.raw, '{"found": false}')
+        self.assertFalse(response.get('found'))
+        self.assertEqual(dict(RawJSON(self.info))['tagline'], 'You Know, for Search')
+
+    def test_raw_json_response_is_compressed(self):
+        data = json.dumps({'hits': {'hits': [{'_id': str(i)} for i in range(50)]}})
+        request = RequestFactory().get('/data/file/_search/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        response = raw_json_response(request, data)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.content)), json.loads(data))
+        response = raw_json_response(RequestFactory().get('/data/file/_search/'), data)
+        self.assertEqual(response.content, data.encode('utf-8'))
+
+
+class SingleFlightTests(SimpleTestCase):
+
+    def test_concurrent_calls_share_result(self):
+        flights = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return {'hits': {}}
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flights.do('key', fetch)))
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=lambda: results.append(flights.do('key', fetch)))
+                     for _ in range(3)]
+        for thread in followers:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), 4)
+        self.assertTrue(all(result is results[0] for result in results))
+        # finished call isn't reused
+        flights.do('key', fetch)
+        self.assertEqual(len(calls), 2)
+
+    async def test_async_calls_share_result_and_error(self):
+        flights = AsyncSingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {'hits': {}}
+
+        results = await asyncio.gather(*(flights.do('key', fetch) for _ in range(5)))
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(result is results[0] for result in results))
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError('ES is down')
+
+        results = await asyncio.gather(*(flights.do('key', fail) for _ in range(2)), return_exceptions=True)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+
+    async def test_cancelled_leader_doesnt_fail_waiters(self):
+        flights = AsyncSingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.02)
+            return {'hits': {}}
+
+        leader = asyncio.ensure_future(flights.do('key', fetch))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(flights.do('key', fetch))
+        await asyncio.sleep(0)
+        # client of the first request disconnected
+        leader.cancel()
+        self.assertEqual(await waiter, {'hits': {}})
+        self.assertTrue(leader.cancelled())
+
+
+class GlobalSearchTests(SimpleTestCase):
+
+    def test_global_search_uses_one_msearch_and_dataset_fallback(self):
+        from . import views
+
+        class Es:
+            searches = None
+
+            def msearch(self, body):
+                Es.searches = body
+                responses = []
+                for header in body[::2]:
+                    hits = [{'_id': '1'}] if header['index'] in ('2026_03_26_file', 'protocol_samples') else []
+                    response = {'status': 200, 'hits': {'total': {'value': len(hits)}, 'hits': hits}}
+                    if header['index'] == '2026_03_26_file':
+                        response['aggregations'] = {
+                            'study_accessions': {'buckets': [{'key': 'PRJEB1', 'doc_count': 3}]},
+                            'study_count': {'value': 1}}
+                    responses.append(response)
+                return {'responses': responses}
+
+        request = RequestFactory().get('/data/_gsearch/', {'sterm': 'liver'})
+        with mock.patch('api.views.get_es_client', return_value=Es()), \
+                mock.patch('api.query_compiler.get_index_mapping', return_value={}):
+            response = views.globindex(request)
+        data = json.loads(response.content)
+        self.assertEqual(len(Es.searches), 2 * len(views.GLOBAL_ALLOWED_INDICES))
+        self.assertEqual(sorted(data), ['2026_03_26_dataset', '2026_03_26_file', 'protocol/samples'])
+        self.assertEqual(data['2026_03_26_dataset'],
+                         {'hits': {'total': {'value': 1}, 'hits': []}, 'search_terms': ['PRJEB1']})
+        self.assertNotIn('aggregations', data['2026_03_26_file'])
+
+
+class SuggestTests(SimpleTestCase):
+
+    def test_document_entries_walk_lists(self):
+        hit = {'_id': 'SAMEA1', '_source': {'biosampleId': 'SAMEA1', 'breed': [{'text': 'Angus'}, {'text': ''}]}}
+        self.assertEqual(document_entries('organism', hit, ['biosampleId', 'breed.text', 'missing']),
+                         {('samea1', 'SAMEA1', 'organism', 'SAMEA1'), ('angus', 'Angus', 'organism', 'SAMEA1')})
+
+    def test_prefix_lookup(self):
+        index = PrefixIndex()
+        index.update('organism', [('samea1', 'SAMEA1', 'organism', '1'), ('samea2', 'SAMEA2', 'organism', '2'),
+                                  ('sus scrofa', 'Sus scrofa', 'organism', '1')])
+        index.update('protocol_samples', [('samea10', 'SAMEA10', 'protocol_samples', '10')])
+        self.assertEqual([s['value'] for s in index.suggest('SAM')], ['SAMEA1', 'SAMEA10', 'SAMEA2'])
+        self.assertEqual(index.suggest('samea10'),
+                         [{'value': 'SAMEA10', 'index': 'protocol/samples', 'id': '10'}])
+        self.assertEqual(len(index.suggest('sam', size=2)), 2)
+        self.assertEqual([s['id'] for s in index.suggest('sam', indices={'organism'})], ['1', '2'])
+        # entries of the index are replaced on refresh
+        index.update('organism', [('sus scrofa', 'Sus scrofa', 'organism', '1')])
+        self.assertEqual([s['value'] for s in index.suggest('s')], ['SAMEA10', 'Sus scrofa'])
+
+    def test_failed_refresh_doesnt_stop_other_indices(self):
+        fields = {'organism': ['biosampleId'], 'specimen': ['biosampleId']}
+        refreshed = []
+
+        def refresh_index(es, index, fields):
+            if index == 'organism':
+                raise KeyError('hits')
+            refreshed.append(index)
+
+        with mock.patch('api.suggest.SUGGEST_FIELDS', fields), \
+                mock.patch('api.suggest.refresh_index', side_effect=refresh_index), \
+                self.assertLogs('api.suggest', level='ERROR'):
+            refresh_all(mock.Mock())
+        self.assertEqual(refreshed, ['specimen'])
+
+
+class FakeIdMapRedis:
+    """
+    Hashes of redis, pipeline runs commands right away and the script of
+    build_id_map is done in python
+    """
+
+    def __init__(self):
+        self.hashes = {}
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def execute(self):
+        pass
+
+    def delete(self, key):
+        self.hashes.pop(key, None)
+
+    def rename(self, key, new_key):
+        self.hashes[new_key] = self.hashes.pop(key)
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = value
+
+    def hsetnx(self, key, field, value):
+        self.hashes.setdefault(key, {}).setdefault(field, value)
+
+    def register_script(self, script):
+        def set_priority_id(keys, args, client):
+            if self.hashes.get(keys[0], {}).get(args[0]) != args[0]:
+                self.hset(keys[0], args[0], args[1])
+        return set_priority_id
+
+
+class IdMapTests(SimpleTestCase):
+
+    def test_identifiers_follow_detail_priority(self):
+        docs = [
+            {'_id': 'SAMEA1', '_source': {'alternativeId': 'X', 'biosampleId': 'SAMEA1'}},
+            {'_id': 'SAMEA2', '_source': {'alternativeId': 'SAMEA3', 'biosampleId': 'Y'}},
+            {'_id': 'SAMEA3', '_source': {'biosampleId': 'X'}},
+            {'_id': 'SAMEA4', '_source': {'alternativeId': 'Y'}},
+        ]
+        # the result doesn't depend on the order documents are scanned in
+        for hits in (docs, docs[::-1]):
+            client = FakeIdMapRedis()
+            with mock.patch('api.id_map.get_redis', return_value=client), \
+                    mock.patch('api.id_map.scan', return_value=iter(hits)):
+                self.assertEqual(build_id_map(None, 'specimen'), 4)
+            self.assertEqual(client.hashes['idmap:specimen'], {
+                'SAMEA1': 'SAMEA1', 'SAMEA2': 'SAMEA2', 'SAMEA3': 'SAMEA3', 'SAMEA4': 'SAMEA4',
+                'X': 'SAMEA1', 'Y': 'SAMEA4'})
+
+    def test_maps_are_rebuilt_periodically(self):
+        from django.conf import settings
+        from .tasks import rebuild_id_maps
+        self.assertEqual(settings.CELERY_BEAT_SCHEDULE['rebuild-id-maps']['task'], rebuild_id_maps.name)
+        with mock.patch('api.tasks.get_es_client'), \
+                mock.patch('api.tasks.build_id_map', side_effect=[TransportError(500, 'down')] + [1] * 10):
+            counts = rebuild_id_maps()
+        self.assertNotIn(constants.ID_MAP_INDICES[0], counts)
+        self.assertEqual(set(counts), set(constants.ID_MAP_INDICES[1:]))
+
+
+class BulkDetailTests(SimpleTestCase):
+
+    class Es:
+        def __init__(self):
+            self.mgets = []
+            self.searches = []
+            self.docs = {'SAMEA1': {'biosampleId': 'SAMEA1'}, 'SAMEA2': {'alternativeId': ['ALT2']}}
+
+        def mget(self, index, body, **kwargs):
+            self.mgets.append(body['ids'])
+            return {'docs': [{'_index': index, '_id': id, 'found': True, '_source': self.docs[id]}
+                             if id in self.docs else {'_index': index, '_id': id, 'found': False}
+                             for id in body['ids']]}
+
+        def search(self, index, size, _source, body):
+            self.searches.append(body)
+            return {'hits': {'hits': [{'_id': 'SAMEA2', 'matched_queries': ['alternativeId:1']}]}}
+
+    def test_fetch_by_ids_uses_map_then_one_search(self):
+        es = self.Es()
+        with mock.patch('api.id_map.resolve_ids', return_value=['SAMEA1', 'STALE', None, None]), \
+                mock.patch('api.id_map.remember_ids') as remember_ids, \
+                mock.patch('api.query_compiler.get_index_mapping', return_value={}):
+            docs = fetch_by_ids(es, 'specimen', ['SAMEA1', 'OLD', 'ALT2', 'UNKNOWN'])
+        self.assertEqual([(doc['id'], doc['found'], doc.get('_id')) for doc in docs],
+                         [('SAMEA1', True, 'SAMEA1'), ('OLD', False, None),
+                          ('ALT2', True, 'SAMEA2'), ('UNKNOWN', False, None)])
+        self.assertEqual(es.mgets, [['SAMEA1', 'STALE'], ['SAMEA2']])
+        self.assertEqual(len(es.searches), 1)
+        should = es.searches[0]['query']['bool']['should']
+        self.assertEqual(should[0], {'ids': {'values': ['OLD', 'ALT2', 'UNKNOWN'], '_name': '_id'}})
+        # ids are matched like in detail_query
+        self.assertEqual(should[3], {'match_phrase': {'alternativeId': {'query': 'ALT2', '_name': 'alternativeId:1'}}})
+        remember_ids.assert_called_once_with('specimen', {'ALT2': 'SAMEA2'})
+
+    def test_bulk_detail_validates_body(self):
+        from . import views
+        request = RequestFactory().post('/data/specimen/_mget/', json.dumps({'ids': 'SAMEA1'}),
+                                        content_type='application/json')
+        self.assertEqual(views.bulk_detail(request, 'specimen').status_code, 400)
+
+
+@override_settings(SEARCH_CACHE_ENABLED=False)
+class ConditionalGetTests(SimpleTestCase):
+
+    def test_search_returns_304_for_current_etag(self):
+        from . import views
+        body = json.dumps({'hits': {'hits': [{'_id': str(i)} for i in range(50)]}})
+        with mock.patch('api.views.raw_search', return_value=body), \
+                mock.patch('api.views.get_es_client'):
+            response = views.index(RequestFactory().get('/data/file/_search/'), 'file')
+            etag = response['ETag']
+            self.assertIn('max-age', response['Cache-Control'])
+            response = views.index(RequestFactory().get('/data/file/_search/', HTTP_IF_NONE_MATCH=etag), 'file')
+            self.assertEqual(response.status_code, 304)
+            # compressed response has its own strong etag
+            response = views.index(RequestFactory().get('/data/file/_search/', HTTP_ACCEPT_ENCODING='gzip'), 'file')
+            self.assertEqual(response['ETag'], etag[:-1] + '-gzip"')
+            response = views.index(RequestFactory().get('/data/file/_search/', HTTP_IF_NONE_MATCH=response['ETag']),
+                                   'file')
+            self.assertEqual(response.status_code, 304)
+
+    def test_search_etag_ignores_timing_fields(self):
+        hits = {'total': {'value': 1}, 'hits': [{'_id': 'a'}]}
+        # ES sends compact json
+        first = json.dumps({'took': 3, 'timed_out': False, '_shards': {'total': 1}, 'hits': hits},
+                           separators=(',', ':'))
+        second = json.dumps({'took': 15, 'timed_out': False, '_shards': {'total': 2}, 'hits': hits},
+                            separators=(',', ':'))
+        self.assertEqual(search_etag(first), search_etag(second.encode('utf-8')))
+        self.assertTrue(search_etag(first).startswith('"'))
+        self.assertNotEqual(search_etag(first), search_etag(first.replace('"a"', '"b"')))
+
+    def test_detail_etag_depends_on_document_version(self):
+        results = {'hits': {'hits': [{'_index': 'specimen', '_id': 'A', '_seq_no': 1, '_primary_term': 1}]}}
+        changed = {'hits': {'hits': [{'_index': 'specimen', '_id': 'A', '_seq_no': 2, '_primary_term': 1}]}}
+        self.assertTrue(detail_etag(results).startswith('"'))
+        self.assertNotEqual(detail_etag(results), detail_etag(changed))
+        request = RequestFactory().get('/data/specimen/A', HTTP_IF_NONE_MATCH=f'"x", {detail_etag(results)}')
+        self.assertTrue(etag_matches(request, detail_etag(results)))
+        self.assertFalse(etag_matches(request, detail_etag(changed)))
+
+
+class DownloadTests(SimpleTestCase):
+
+    def setUp(self):
+        self.hits = [{'_id': str(i), 'sort': [i], '_source': {
+            'biosampleId': f'SAMEA{i}', 'species': [{'text': 'Sus scrofa'}], 'file': ['a', 'b']}}
+            for i in range(5)]
+
+    def test_iter_pit_walks_all_pages_and_closes_pit(self):
+        es = FakeEs(self.hits)
+        pages = iter_pit(es, 'file', {'query': {'match_all': {}}}, size=2, sort='id:asc')
+        self.assertEqual([hit['_id'] for hit in pages], ['0', '1', '2', '3', '4'])
+        self.assertEqual(len(es.bodies), 3)
+        self.assertEqual(es.bodies[2]['search_after'], [3])
+        self.assertEqual(es.closed, ['pit-2'])
+
+        # pit is also closed when the consumer stops early
+        es = FakeEs(self.hits)
+        pages = iter_pit(es, 'file', {}, size=2)
+        next(pages)
+        pages.close()
+        self.assertEqual(es.closed, ['pit-2'])
+
+    def test_sliced_pit_merges_slices(self):
+        hits = [{'_id': str(i), 'sort': [i // 2, i]} for i in range(9)]
+        es = FakeEs(hits)
+        merged = iter_pit_slices(es, 'file', {}, slices=3, size=2, sort='releaseDate:asc', ordered=True)
+        self.assertEqual([hit['_id'] for hit in merged], [str(i) for i in range(9)])
+        self.assertEqual(sorted(body['slice']['id'] for body in es.bodies if 'search_after' not in body),
+                         [0, 1, 2])
+        self.assertEqual(es.closed, ['pit-2'])
+
+        hits = [{'_id': str(i), 'sort': [None if i > 6 else 10 - i, i]} for i in range(9)]
+        merged = iter_pit_slices(FakeEs(hits), 'file', {}, slices=3, size=2, sort='releaseDate:desc', ordered=True)
+        self.assertEqual([hit['_id'] for hit in merged], [str(i) for i in range(9)])
+
+        unordered = iter_pit_slices(FakeEs(hits), 'file', {}, slices=3, size=2)
+        self.assertEqual(sorted(int(hit['_id']) for hit in unordered), list(range(9)))
+
+    def test_sliced_pit_raises_slice_errors(self):
+        es = FakeEs(self.hits)
+        es.search = mock.Mock(side_effect=ConnectionError('N/A', 'down', None))
+        with self.assertRaises(ConnectionError):
+            list(iter_pit_slices(es, 'file', {}, slices=2, size=2))
+        self.assertEqual(es.closed, ['pit-1'])
+
+    def test_csv_download_is_streamed(self):
+        from . import views
+        request = RequestFactory().get('/data/specimen/download/', {
+            'file_format': 'csv', '_source': '_source.biosampleId,_source.species,_source.file',
+            'columns': json.dumps(['Biosample', 'Species', 'Number of Files'])})
+        es = FakeEs(self.hits)
+        with mock.patch('api.views.get_es_client', return_value=es), \
+                mock.patch('api.export.PAGE_SIZE', 2), \
+                mock.patch('api.query_compiler.get_index_mapping', return_value={}):
+            response = views.download(request, 'specimen')
+            self.assertTrue(response.streaming)
+            # nothing is fetched until the response is consumed
+            self.assertEqual(es.bodies, [])
+            content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertEqual(content.splitlines()[:2], ['Biosample,Species,Number of Files',
+                                                    'SAMEA0,Sus scrofa,2'])
+        self.assertEqual(len(content.splitlines()), 6)
+        self.assertEqual(es.closed, ['pit-2'])
+
+    def test_tabular_download_pads_columns(self):
+        records = [{'a': 'x', 'b': 12345}, {'a': 'longer value', 'b': None}]
+        text = ''.join(iter_tabular(records, ['a', 'b'], ['A', 'Number']))
+        self.assertEqual(text.split('\n'), ['A            | Number',
+                                             'x            | 12345 ',
+                                             'longer value |       '])
+
+    def test_export_formats(self):
+        records = [{'a': 'x', 'b': ['1', '2']}, {'a': None, 'b': 3}]
+        chunks, content_type, filename = export_stream(iter(records), ['a', 'b'], ['A', 'B'], 'ndjson.gz')
+        self.assertEqual((content_type, filename), ('application/gzip', 'faang_data.ndjson.gz'))
+        lines = gzip.decompress(b''.join(chunks)).decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [{'A': 'x', 'B': ['1', '2']}, {'A': None, 'B': 3}])
+
+        chunks, content_type, filename = export_stream(iter(records), ['a', 'b'], ['A', 'B'], 'xlsx')
+        self.assertEqual(filename, 'faang_data.xlsx')
+        self.assertTrue(b''.join(chunks).startswith(b'PK'))
+
+        with self.assertRaises(ValueError):
+            export_stream(iter(records), ['a', 'b'], ['A', 'B'], 'csv.bz2')
+        # xlsx and parquet are compressed by their writers
+        for file_format in ('xlsx.gz', 'parquet.zst'):
+            with self.assertRaises(ValueError):
+                export_stream(iter(records), ['a', 'b'], ['A', 'B'], file_format)
+
+    @unittest.skipUnless(export.pyarrow, "pyarrow isn't installed")
+    def test_parquet_round_trip(self):
+        import io
+        import pyarrow.parquet
+        records = [{'a': 'x', '_source.file': 2}, {'a': None, '_source.file': 0}]
+        chunks, content_type, filename = export_stream(
+            iter(records), ['a', '_source.file'], ['A', 'Number of Files'], 'parquet')
+        self.assertEqual(filename, 'faang_data.parquet')
+        table = pyarrow.parquet.read_table(io.BytesIO(b''.join(chunks)))
+        self.assertEqual(table.to_pylist(), [{'A': 'x', 'Number of Files': 2}, {'A': None, 'Number of Files': 0}])
+
+    @unittest.skipUnless(export.zstandard, "zstandard isn't installed")
+    def test_zstd_round_trip(self):
+        import zstandard
+        records = [{'a': 'x', 'b': 1}]
+        chunks, content_type, filename = export_stream(iter(records), ['a', 'b'], ['A', 'B'], 'csv.zst')
+        self.assertEqual((content_type, filename), ('application/zstd', 'faang_data.csv.zst'))
+        data = zstandard.ZstdDecompressor().decompressobj().decompress(b''.join(chunks))
+        self.assertEqual(data.decode('utf-8').splitlines(), ['A,B', 'x,1'])
+
+
+class PoolStatsTests(SimpleTestCase):
+
+    def test_pool_stats_are_only_for_staff(self):
+        from django.contrib.auth.models import AnonymousUser
+        from rest_framework.test import force_authenticate
+        from . import views
+        request = RequestFactory().get('/data/_es_stats/')
+        force_authenticate(request, user=AnonymousUser())
+        self.assertIn(views.es_pool_stats(request).status_code, (401, 403))
+        request = RequestFactory().get('/data/_es_stats/')
+        force_authenticate(request, user=mock.Mock(is_staff=True, is_authenticated=True))
+        response = views.es_pool_stats(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('clients', json.loads(response.content))
+
+
+class ExportJobTests(SimpleTestCase):
+
+    def post(self, body):
+        from . import views
+        request = RequestFactory().post('/data/specimen/_export/', json.dumps(body),
+                                        content_type='application/json')
+        return views.export_job(request, 'specimen')
+
+    def test_export_job_rejects_compressed_binary_format(self):
+        body = {'file_format': 'xlsx.gz', '_source': '_source.biosampleId', 'columns': ['Biosample']}
+        with mock.patch('api.views.export_records') as task:
+            response = self.post(body)
+        self.assertEqual(response.status_code, 400)
+        task.apply_async.assert_not_called()
+
+    def test_export_job_is_enqueued_once(self):
+        body = {'file_format': 'csv.gz', '_source': '_source.biosampleId', 'columns': ['Biosample']}
+        with mock.patch('api.views.export_job_key', return_value='export:key'), \
+                mock.patch('api.views.claim_export_job', return_value=True), \
+                mock.patch('api.views.export_records') as task:
+            response = self.post(body)
+        self.assertEqual(response.status_code, 202)
+        task_id = json.loads(response.content)['id']
+        # progress is sent to ws/submission/<task_id>/
+        self.assertRegex(f'ws/submission/{task_id}/', r'ws/submission/(?P<task_id>\w+)/$')
+        task.apply_async.assert_called_once_with(args=('export:key', 'specimen', body),
+                                                 task_id=task_id, queue='export')
+
+        job = {'id': 'previous', 'url': 'https://api.faang.org/files/exports/previous/faang_data.csv.gz'}
+        with mock.patch('api.views.export_job_key', return_value='export:key'), \
+                mock.patch('api.views.claim_export_job', return_value=False), \
+                mock.patch('api.views.get_export_job', return_value=job), \
+                mock.patch('api.views.export_records') as task:
+            response = self.post(body)
+        self.assertEqual(json.loads(response.content), dict(job, status='SUCCESS'))
+        task.apply_async.assert_not_called()
+
+    def test_failed_export_job_is_started_again(self):
+        body = {'_source': '_source.biosampleId', 'columns': ['Biosample']}
+        result = mock.Mock(state='FAILURE')
+        with mock.patch('api.views.export_job_key', return_value='export:key'), \
+                mock.patch('api.views.claim_export_job', side_effect=[False, True]), \
+                mock.patch('api.views.get_export_job', return_value={'id': 'dead'}), \
+                mock.patch('api.views.AsyncResult', return_value=result), \
+                mock.patch('api.views.release_export_job') as release_export_job, \
+                mock.patch('api.views.export_records') as task:
+            response = self.post(body)
+        self.assertEqual(response.status_code, 202)
+        release_export_job.assert_called_once_with('export:key', 'dead')
+        task.apply_async.assert_called_once()
+
+    def test_expired_exports_are_removed(self):
+        import os
+        import tempfile
+        from .tasks import remove_expired_exports
+        with tempfile.TemporaryDirectory() as files_dir:
+            for task_id, age in (('old', 200000), ('new', 10)):
+                os.mkdir(os.path.join(files_dir, task_id))
+                mtime = time.time() - age
+                os.utime(os.path.join(files_dir, task_id), (mtime, mtime))
+            with override_settings(EXPORT_FILES_TTL=172800):
+                self.assertEqual(remove_expired_exports(files_dir), 1)
+            self.assertEqual(os.listdir(files_dir), ['new'])
+
+    def test_upload_body_is_streamed_from_file(self):
+        import tempfile
+        import requests
+        from urllib3.filepost import encode_multipart_formdata
+        from .tasks import MultipartStream
+        with tempfile.TemporaryFile() as output:
+            output.write(b'a,b\n1,2\n')
+            output.seek(0)
+            body = MultipartStream({'path': 'exports/1', 'name': 'f.csv'}, 'file', 'f.csv', output, 'text/csv')
+            expected, content_type = encode_multipart_formdata(
+                [('path', 'exports/1'), ('name', 'f.csv'), ('file', ('f.csv', b'a,b\n1,2\n', 'text/csv'))],
+                boundary=body.boundary)
+            prepared = requests.Request('POST', 'http://nginx-svc/files_upload', data=body,
+                                        headers={'Content-Type': body.content_type}).prepare()
+            self.assertEqual(prepared.headers['Content-Length'], str(len(expected)))
+            self.assertEqual(body.content_type, content_type)
+            self.assertEqual(b''.join(iter(lambda: body.read(5), b'')), expected)
+
+    def test_export_job_validates_body(self):
+        self.assertEqual(self.post(['_source']).status_code, 400)
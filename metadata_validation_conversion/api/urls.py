@@ -1,11 +1,20 @@
 from django.urls import path
-from . import views
+from . import views, async_views
 from django.conf.urls import url
 from api.swagger_custom import schema_view
 
 urlpatterns = [
+    path('async/<str:name>/_search/', async_views.index, name='async_index'),
+    path('async/_gsearch/', async_views.globindex, name='async_globindex'),
+    path('async/<str:name>/<str:id>', async_views.detail, name='async_detail'),
     path('<str:name>/_search/', views.index, name='index'),
     path('_gsearch/', views.globindex, name='globindex'),
+    path('_msearch/', views.multi_search, name='multi_search'),
+    path('_suggest/', views.suggest, name='suggest'),
+    path('_es_stats/', views.es_pool_stats, name='es_pool_stats'),
+    path('<str:name>/_mget/', views.bulk_detail, name='bulk_detail'),
+    path('<str:name>/_export/', views.export_job, name='export_job'),
+    path('_export/<str:id>', views.export_status, name='export_status'),
     path('<str:name>/<str:id>', views.detail, name='detail'),
     path('<str:name>/download/', views.download, name='download'),
     path('fire_api/<str:protocol_type>/<str:id>', views.protocols_fire_api,
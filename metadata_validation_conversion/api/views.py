@@ -2,27 +2,38 @@ import requests
 import json
 import os
 import re
+import uuid
 import subprocess
-from celery import group
+import redis
+from celery import states
+from celery.result import AsyncResult
 
-from django.http import JsonResponse, HttpResponse
-from elasticsearch import Elasticsearch
-from elasticsearch import RequestsHttpConnection
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
-
-from .helpers import generate_df, generate_df_for_breeds
-from .constants import FIELD_NAMES, HUMAN_READABLE_NAMES
-from .tasks import es_search_task
+from metadata_validation_conversion.es_client import get_es_client, get_pool_stats, raw_search, RAW_CLIENT
+from metadata_validation_conversion.celery import app as celery_app
+
+from .helpers import generate_df, generate_df_for_breeds, parse_search_params, \
+    search_kwargs, msearch_body, detail_query, select_detail_hits, get_as_search_response, \
+    global_search_results, global_search_requests, search_response, detail_response, GLOBAL_ALLOWED_INDICES
+from .constants import FIELD_NAMES, HUMAN_READABLE_NAMES, MGET_MAX_IDS
+from .cache import cached_search, cached_msearch
+from .pagination import cursor_search, InvalidCursor
+from .query_compiler import compile_search_body
+from .suggest import suggest_index, start_suggest_builder
+from .id_map import resolve_id, remember_id, fetch_by_ids
+from .export import prepare_export, export_stream, parse_export_format
+from .tasks import export_records, export_job_key, get_export_job, claim_export_job, release_export_job
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework.decorators import api_view, renderer_classes, permission_classes
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
 from api.swagger_custom import TextFileRenderer, PdfFileRenderer
 from api.swagger_custom import HTMLAutoSchema, PlainTextAutoSchema, PdfAutoSchema
 from api.swagger_custom import index_search_request_example, \
-    index_search_response_example, index_gsearch_response_example, index_detail_response_example
-import csv
+    index_search_response_example, index_gsearch_response_example, index_detail_response_example, \
+    index_msearch_request_example, index_msearch_response_example
 import logging
 
 logger = logging.getLogger(__name__)
@@ -39,9 +50,10 @@ ALLOWED_INDICES = ['file', 'organism', 'specimen', 'dataset', 'experiment',
                    '2026_03_26_dataset'
                    ]
 
-GLOBAL_ALLOWED_INDICES = ['2026_03_26_organism', '2026_03_26_specimen', '2026_03_26_dataset',
-                          '2026_03_26_file', '2026_03_26_experiment', 'analysis',
-                          'protocol_files', 'protocol_analysis', 'protocol_samples', 'article']
+# max number of searches in one _msearch request
+MSEARCH_MAX_QUERIES = 50
+# parameters of download endpoint accepted by export jobs
+EXPORT_PARAMS = ('file_format', '_source', 'columns', 'sort', 'filters')
 
 
 @swagger_auto_schema(method='get', tags=['GlobalSearch'],
@@ -73,41 +85,53 @@ def globindex(request):
 
     # parse request parameters
     sterm = request.GET.get('sterm', '')
-    body = {}
-
-    # generate query for the search
-    if sterm:
-        match = {
-            'multi_match': {
-                'query': sterm,
-                'fields': ['*']
-            }
-        }
-        body['query'] = {
-            'bool': {
-                'must': [match]
-            }
-        }
-
-    key_args = {'body': body, 'track_total_hits': True}
 
-    tasks_group = group(es_search_task.s(name, key_args) for name in GLOBAL_ALLOWED_INDICES)
-    result_group = tasks_group.apply_async(queue='gsearch')
-    outp_data = result_group.get()
+    # all indices are searched with one request
+    index_searches = global_search_requests(sterm, GLOBAL_ALLOWED_INDICES)
+    searches = []
+    for name, body in index_searches:
+        searches.append({'index': name})
+        searches.append(body)
+    es = get_es_client()
+    outp_data = es.msearch(body=searches)['responses']
+    return JsonResponse(global_search_results(index_searches, outp_data))
 
-    outp_json_data = dict()
-    for el in outp_data:
-        if len(el['hits']['hits']) != 0:
-            outp_json_data[el['index']] = el
-    if ('file' in outp_json_data) and ('dataset' not in outp_json_data):
-        study_accessions = set([
-            hit['_source'].get('study', {}).get('accession') for hit in outp_json_data['file']['hits']['hits']
-        ])
-        if len(study_accessions) != 0:
-            outp_json_data['dataset'] = {'hits': {'total': {'value': len(study_accessions)}}}
-            outp_json_data['dataset']['search_terms'] = list(study_accessions)
 
-    return JsonResponse(outp_json_data)
+@swagger_auto_schema(method='get', tags=['GlobalSearch'],
+        operation_summary="Get ids and names starting with the typed text",
+        manual_parameters=[
+            openapi.Parameter('q', openapi.IN_QUERY,
+                description="typed text",
+                type=openapi.TYPE_STRING),
+            openapi.Parameter('size', openapi.IN_QUERY,
+                description="max no. of suggestions",
+                type=openapi.TYPE_NUMBER, default=10),
+            openapi.Parameter('index', openapi.IN_QUERY,
+                description="indices (comma-separated) to return suggestions from",
+                type=openapi.TYPE_STRING)
+        ],
+        responses={
+            200: openapi.Response(description='OK',
+                schema=openapi.Schema(type=openapi.TYPE_OBJECT)
+            )
+        })
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def suggest(request):
+    # index is built in background, first requests may get no suggestions
+    start_suggest_builder()
+    prefix = request.GET.get('q', '')
+    indices = set(filter(None, request.GET.get('index', '').split(',')))
+    try:
+        size = min(int(request.GET.get('size', 10)), 50)
+    except ValueError:
+        context = {'status': '400', 'reason': 'size should be a number'}
+        response = HttpResponse(
+            json.dumps(context), content_type='application/json')
+        response.status_code = 400
+        return response
+    suggestions = suggest_index.suggest(prefix, size, indices) if prefix.strip() else []
+    return JsonResponse({'suggestions': suggestions})
 
 
 @swagger_auto_schema(method='get', tags=['Search'],
@@ -129,6 +153,10 @@ def globindex(request):
             openapi.Parameter('from_', openapi.IN_QUERY,
                 description="to fetch records starting from specified number",
                 type=openapi.TYPE_NUMBER, default=0),
+            openapi.Parameter('cursor', openapi.IN_QUERY,
+                description="'true' to start cursor pagination, or the 'next' \
+                    token from the previous page, replaces from_ for deep paging",
+                type=openapi.TYPE_STRING),
             openapi.Parameter('filters', openapi.IN_QUERY,
                 description="properties and list of values to filter on, \
                     in the format {prop1: [val1, val2], prop2: [val1, val2], ...} ",
@@ -194,155 +222,128 @@ def index(request, name):
         return response
 
     # Parse request parameters
-    size = request.GET.get('size', 10)
-    field = request.GET.get('_source', '')
-    sort = request.GET.get('sort', '')
-    sort_by_count = request.GET.get('sort_by_count', '')
-    query = request.GET.get('q', '')
-    search = request.GET.get('search', '')
-    from_ = request.GET.get('from_', 0)
-    # Example: {field1: [val1, val2], field2: [val1, val2], ...}
-    filters = request.GET.get('filters', '{}')
-    # Example: {aggName1: field1, aggName2: field2, ...}
-    aggregations = request.GET.get('aggs', '{}')
-    body = {}
-
-    # generate query for filtering
-    filter_values = []
-    not_filter_values = []
-    filters = json.loads(filters)
-    for key in filters.keys():
-        # status_activity filter is a special case because the status property
-        # is found within status_activity arrau of objects
-        if key == 'status_activity':
-            nested_query_body = {
-                "nested": {
-                    "path": "status_activity",
-                    "query": {
-                        "bool": {
-                            "must": [
-                                {
-                                    "match": {
-                                        "status_activity.status": filters[key][0]
-                                    }
-                                }
-                            ]
-                        }
-                    }
-                }}
-            filter_values.append(nested_query_body)
-        else:
-            if filters[key][0] != 'false':
-                filter_values.append({"terms": {key: filters[key]}})
-            else:
-                not_filter_values.append({"match": {key: "true"}})
-    filter_val = {}
-
-    if name == 'protocol_samples':
-        filter_values.append({
-            "bool": {
-                "should": [
-                    {"wildcard": {"url": "*/protocols/*"}},
-                    {"wildcard": {"url": "https://data.faang.org/api/fire_api/*"}}
-                ],
-                "minimum_should_match": 1
-            }
-        })
+    params = parse_search_params(request.GET)
+
+    # generate query for filtering, search, aggregations and sort script
+    try:
+        body = compile_search_body(name, params['filters'], params['aggs'],
+                                   params['search'], params['sort_by_count'])
+    except ValueError as e:
+        context = {'status': '400', 'reason': str(e)}
+        response = HttpResponse(
+            json.dumps(context), content_type='application/json')
+        response.status_code = 400
+        return response
 
-    if filter_values:
-        filter_val['must'] = filter_values
-    if not_filter_values:
-        filter_val['must_not'] = not_filter_values
-
-    if filter_val:
-        body['query'] = {'bool': filter_val}
-
-    # generate query for search
-    if search:
-        match = {
-            'multi_match': {
-                'query': search,
-                'fields': ['*']
-            }
-        }
-        if filter_val:
-            if 'must' in filter_val:
-                body['query']['bool']['must'].append(match)
-            else:
-                body['query']['bool']['must'] = [match]
-        else:
-            body['query'] = {
-                'bool': {
-                    'must': [match]
-                }
-            }
-
-    # generate query for aggregations
-    agg_values = {}
-    aggregations = json.loads(aggregations)
-    for key in aggregations.keys():
-        # status_activity aggregation is a special case because the status property is a nested property
-        if key == 'status_activity':
-            agg_values[key] = {
-                "nested": {
-                    "path": "status_activity"
-                },
-                "aggs": {
-                    "status": {
-                        "terms": {
-                            "field": "status_activity.status", 'size': 25
-                        }
-                    }
-                }
-            }
-        else:
-            # size determines number of aggregation buckets returned
-            agg_values[key] = {"terms": {"field": aggregations[key], "size": 25}}
-            if key == 'paper_published':
-                # aggregations for missing paperPublished field
-                agg_values["paper_published_missing"] = {
-                    "missing": {"field": "paperPublished"}}
-
-    if agg_values:
-        body['aggs'] = agg_values
-
-    # generate query for sort script
-    # sorts by length of field array
-    if sort_by_count:
-        sort_field, _, order = sort_by_count.partition(':')
-        # sort_field is interpolated into a Painless script, so restrict it to
-        # field-name characters and the order to a known set to prevent script
-        # injection (CWE-94).
-        if not re.fullmatch(r'[A-Za-z0-9_.]+', sort_field) or order not in ('asc', 'desc'):
-            context = {'status': '400', 'reason': 'Invalid sort_by_count parameter'}
+    es = get_es_client()
+
+    # cursor based pagination, doesn't go through the cache as every page
+    # belongs to its own point in time
+    cursor = request.GET.get('cursor', '')
+    if cursor and not request.body:
+        try:
+            data = cursor_search(es, name, body, params['size'], sort=params['sort'],
+                                 cursor=cursor, _source=params['_source'], q=params['q'])
+        except InvalidCursor as e:
+            context = {'status': '400', 'reason': str(e)}
             response = HttpResponse(
                 json.dumps(context), content_type='application/json')
             response.status_code = 400
             return response
-        body['sort'] = {
-            "_script": {
-                "type": "number",
-                "script": f"params._source?.{sort_field}?.length ?: 0",
-                "order": f"{order}"
-            }
-        }
+        return JsonResponse(data)
 
-    es = Elasticsearch([settings.NODE], connection_class=RequestsHttpConnection, http_auth=(settings.ES_USER, settings.ES_PASSWORD), use_ssl=True, verify_certs=True)
-    if request.body:
-        data = es.search(
-            index=name,
-            size=size,
-            body=json.loads(request.body.decode("utf-8")),
-            track_total_hits=True)
-    else:
-        if query != '':
-            data = es.search(index=name, from_=from_, size=size, _source=field,
-                                sort=sort, q=query, body=body, track_total_hits=True)
-        else:
-            data = es.search(index=name, from_=from_, size=size, _source=field,
-                                sort=sort, body=body, track_total_hits=True)
+    kwargs = search_kwargs(name, params, body, request.body)
 
-    return JsonResponse(data)
+    # response is returned unchanged, so it's passed to the user without
+    # decoding and encoding it again
+    def fetch():
+        return raw_search(get_es_client(RAW_CLIENT), **kwargs)
+
+    # cache entries and in-flight calls are shared by requests that compile
+    # to the same query
+    data = cached_search(name, kwargs, fetch, raw=True)
+    return search_response(request, data)
+
+
+@swagger_auto_schema(method='post', tags=['Search'],
+        operation_summary="Run several searches in one request",
+        operation_description="List of searches, each with 'index' and the same \
+            parameters as the search endpoint (size, from_, _source, sort, \
+            sort_by_count, q, search, filters, aggs). Results are returned in order.",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_ARRAY,
+            items=openapi.Schema(type=openapi.TYPE_OBJECT),
+            example=index_msearch_request_example
+        ),
+        responses={
+            200: openapi.Response('OK',
+                examples={"application/json": index_msearch_response_example},
+                schema=openapi.Schema(type=openapi.TYPE_OBJECT)
+            ),
+            400: openapi.Response('Bad Request')
+        })
+@api_view(['POST'])
+@permission_classes([AllowAny])
+@csrf_exempt
+def multi_search(request):
+    try:
+        specs = json.loads(request.body.decode("utf-8"))
+    except ValueError:
+        specs = None
+    if not isinstance(specs, list) or not 0 < len(specs) <= MSEARCH_MAX_QUERIES:
+        context = {
+            'status': '400',
+            'reason': f'Request body should be a list of 1 to {MSEARCH_MAX_QUERIES} searches'
+        }
+        response = HttpResponse(
+            json.dumps(context), content_type='application/json')
+        response.status_code = 400
+        return response
+
+    # errors are reported per search, as in the ES _msearch response
+    responses = [None] * len(specs)
+    positions = []
+    queries = []
+    bodies = []
+    for position, spec in enumerate(specs):
+        name = spec.get('index') if isinstance(spec, dict) else None
+        if name not in ALLOWED_INDICES:
+            responses[position] = {'status': '404', 'reason': 'This index doesn\'t exist!'}
+            continue
+        try:
+            params = parse_search_params(spec)
+            body = compile_search_body(name, params['filters'], params['aggs'],
+                                       params['search'], params['sort_by_count'])
+            search_body = msearch_body(params, body)
+            # same cache entries as the search endpoint
+            query = (name, search_kwargs(name, params, body))
+        except ValueError as e:
+            responses[position] = {'status': '400', 'reason': str(e)}
+            continue
+        except (TypeError, KeyError, IndexError, AttributeError) as e:
+            # parameters of wrong type, e.g. filters that are not a dict
+            responses[position] = {'status': '400', 'reason': f"Invalid search parameters: {e}"}
+            continue
+        positions.append(position)
+        bodies.append(search_body)
+        queries.append(query)
+
+    es = get_es_client()
+
+    def fetch(missing):
+        searches = []
+        for i in missing:
+            searches.append({'index': queries[i][0]})
+            searches.append(bodies[i])
+        results = es.msearch(body=searches)['responses']
+        for data in results:
+            if 'error' not in data:
+                data.pop('status', None)
+        return results
+
+    for position, data in zip(positions, cached_msearch(queries, fetch)):
+        responses[position] = data
+    return JsonResponse({'responses': responses})
 
 
 @swagger_auto_schema(method='get', tags=['Details'],
@@ -382,17 +383,83 @@ def detail(request, name, id):
             json.dumps(context), content_type='application/json')
         response.status_code = 404
         return response
-    es = Elasticsearch([settings.NODE], connection_class=RequestsHttpConnection, http_auth=(settings.ES_USER, settings.ES_PASSWORD), use_ssl=True, verify_certs=True)
-    # Use structured queries with the id passed as a value (not concatenated
-    # into a Lucene query string) to avoid query injection (CWE-943).
-    results = es.search(index=name, body={"query": {"ids": {"values": [id]}}})
-    if results['hits']['total'] == 0:
-        results = es.search(index=name, doc_type="_doc",
-                            body={"query": {"match_phrase": {"alternativeId": id}}})
-    if results['hits']['total'] == 0:
-        results = es.search(index=name, doc_type="_doc",
-                            body={"query": {"match_phrase": {"biosampleId": id}}})
-    return JsonResponse(results)
+    es = get_es_client()
+
+    def fetch():
+        # one lookup in the identifier map and one get, search by all
+        # identifier fields at once when the id isn't in the map
+        doc_id = resolve_id(name, id)
+        if doc_id is not None:
+            doc = es.get(index=name, id=doc_id, ignore=404)
+            if doc.get('found'):
+                return get_as_search_response(doc)
+        results = select_detail_hits(es.search(index=name, body=detail_query(id),
+                                               seq_no_primary_term=True))
+        if results['hits']['hits']:
+            remember_id(name, id, results['hits']['hits'][0]['_id'])
+        return results
+
+    results = cached_search(name, {'id': id}, fetch)
+    return detail_response(request, results)
+
+
+@swagger_auto_schema(method='post', tags=['Details'],
+        operation_summary="Get details of several records of the same type by their IDs",
+        operation_description="IDs are resolved in the same way as by the details \
+            endpoint, results are returned in order of IDs with 'found' flag",
+        manual_parameters=[
+            openapi.Parameter('name', openapi.IN_PATH,
+                description="type of records",
+                type=openapi.TYPE_STRING,
+                enum=ALLOWED_INDICES)
+        ],
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'ids': openapi.Schema(type=openapi.TYPE_ARRAY,
+                                      items=openapi.Schema(type=openapi.TYPE_STRING)),
+                '_source': openapi.Schema(type=openapi.TYPE_STRING,
+                                          description="fields (comma-separated) to fetch")
+            },
+            example={'ids': ['SAMEA104728877', 'SAMEA104728878'], '_source': 'biosampleId,organism'}
+        ),
+        responses={
+            200: openapi.Response('OK', schema=openapi.Schema(type=openapi.TYPE_OBJECT)),
+            400: openapi.Response('Bad Request'),
+            404: openapi.Response('Not Found')
+        })
+@api_view(['POST'])
+@permission_classes([AllowAny])
+@csrf_exempt
+def bulk_detail(request, name):
+    if name not in ALLOWED_INDICES:
+        context = {
+            'status': '404', 'reason': 'This index doesn\'t exist!'
+        }
+        response = HttpResponse(
+            json.dumps(context), content_type='application/json')
+        response.status_code = 404
+        return response
+    try:
+        data = json.loads(request.body.decode("utf-8"))
+        ids = data['ids']
+        source = data.get('_source') or None
+    except (ValueError, KeyError, TypeError, AttributeError):
+        ids = None
+    if not isinstance(ids, list) or not 0 < len(ids) <= MGET_MAX_IDS \
+            or not all(isinstance(id, str) for id in ids):
+        context = {
+            'status': '400',
+            'reason': f'Request body should have list of 1 to {MGET_MAX_IDS} ids'
+        }
+        response = HttpResponse(
+            json.dumps(context), content_type='application/json')
+        response.status_code = 400
+        return response
+
+    docs = fetch_by_ids(get_es_client(), name, list(dict.fromkeys(ids)), source)
+    docs = {doc['id']: doc for doc in docs}
+    return JsonResponse({'docs': [docs[id] for id in ids]})
 
 
 @swagger_auto_schema(method='get', tags=['Download'],
@@ -402,7 +469,8 @@ def detail(request, name, id):
                 description="List of column headers", 
                 type=openapi.TYPE_STRING, default='[]'),
             openapi.Parameter('file_format', openapi.IN_QUERY, 
-                description="csv or tabular text file", 
+                description="csv, ndjson, xlsx, parquet or tabular text file, \
+                    add .gz or .zst for compressed csv, ndjson or text file", 
                 type=openapi.TYPE_STRING, default='csv'),
             openapi.Parameter('_source', openapi.IN_QUERY, 
                 description="fields (comma-separated) to fetch", 
@@ -435,141 +503,136 @@ def download(request, name):
     if name not in ALLOWED_INDICES:
         return HttpResponse("This download doesn't exist!\n")
 
-    # Request params
+    # Get records from elasticsearch page by page while the response is sent
     file_format = request.GET.get('file_format', '')
-    field = request.GET.get('_source', '')
-    column_names = request.GET.get('columns', '[]')
-    sort = request.GET.get('sort', '')
-    filters = request.GET.get('filters', '{}')
-
-    columns = field.split(',')
-    request_fields = []
-    for col in columns:
-        cols = col.split('.')
-        if cols[0] == '_source':
-            request_fields.append('.'.join(cols[1:]))
-    request_fields = ','.join(request_fields)
-    column_names = json.loads(column_names)
-
-    # Check if we need to compute count for some columns
-    include_experiment_count = "Number of Experiments" in column_names
-    include_specimen_count = "Number of Specimens" in column_names
-    include_file_count = "Number of Files" in column_names
-    include_species_text = "Species" in column_names
-
-    # generate query for filtering
-    filter_values = []
-    not_filter_values = []
-    filters = json.loads(filters)
-    for key in filters.keys():
-        if filters[key][0] != 'false':
-            filter_values.append({"terms": {key: filters[key]}})
-        else:
-            not_filter_values.append({"terms": {key: ["true"]}})
-    filter_val = {}
-
-    if name == 'protocol_samples':
-        filter_values.append({
-            "bool": {
-                "should": [
-                    {"wildcard": {"url": "*/protocols/*"}},
-                    {"wildcard": {"url": "https://data.faang.org/api/fire_api/*"}}
-                ],
-                "minimum_should_match": 1
-            }
-        })
-
-    if filter_values:
-        filter_val['must'] = filter_values
-    if not_filter_values:
-        filter_val['must_not'] = not_filter_values
-    if filter_val:
-        filters = {"query": {"bool": filter_val}}
-
-    # Get records from elasticsearch
-    es = Elasticsearch([settings.NODE], connection_class=RequestsHttpConnection, http_auth=(settings.ES_USER, settings.ES_PASSWORD), use_ssl=True, verify_certs=True)
-    count = 0
-    records = []
-    while True:
-        data = es.search(index=name, _source=request_fields, sort=sort, 
-                        body=filters, from_=count, size=10000, track_total_hits=True)
-        hits = data['hits']['hits']
-        records += hits
-        count += 10000
-        if count > data['hits']['total']['value']:
-            break
-
-    # generate response payload
-    if file_format == 'csv':
-        filename = 'faang_data.csv'
-        content_type = 'text/csv'
-    else:
-        filename = 'faang_data.txt'
-        content_type = 'text/plain'
-    response = HttpResponse(content_type=content_type)
+    records, columns, column_names = prepare_export(get_es_client(), name, request.GET)
+
+    # generate response payload, written while records are fetched
+    try:
+        chunks, content_type, filename = export_stream(records, columns, column_names, file_format)
+    except ValueError as e:
+        response = HttpResponse(f"{e}\n")
+        response.status_code = 400
+        return response
+    response = StreamingHttpResponse(chunks, content_type=content_type)
     response['Content-Disposition'] = 'attachment; filename=' + filename
+    return response
 
-    # generate csv data
-    writer = csv.DictWriter(response, fieldnames=columns)
-    headers = {}
-    i = 0
-    for col in columns:
-        headers[col] = column_names[i]
-        i += 1
-    writer.writerow(headers)
-    for row in records:
-        record = {}
-        for col in columns:
-            cols = col.split('.')
-            record[col] = ''
-            source = row
-            for c in cols:
-                if isinstance(source, dict) and c in source.keys():
-                    record[col] = source[c]
-                    source = source[c]
-                else:
-                    record[col] = ''
-                    break
-
-            # Compute count for experiment, specimen and file and assign correct valie to return to the other cols
-            mapping = {
-                "_source.experiment": include_experiment_count,
-                "_source.specimen": include_specimen_count,
-                "_source.file": include_file_count,
-            }
-            if col in mapping and mapping[col]:
-                record[col] = len(source) if isinstance(source, list) else 0
-
-            if col == "_source.species" and include_species_text:
-                if isinstance(source, list):
-                    record[col] = ", ".join(item['text'] for item in source if 'text' in item)
-                else:
-                    record[col] = 0
-            if col in ["_source.assayType", "_source.archive"]:
-                if isinstance(source, list):
-                    record[col] = ", ".join(source)
-
-        writer.writerow(record)
-
-    # return formatted data
-    if file_format == 'csv':
+@swagger_auto_schema(method='post', tags=['Download'],
+        operation_summary="Start export of Organisms, Specimens, Files, Datasets etc to file",
+        operation_description="Takes the same parameters as download endpoint in request body. \
+            Identical requests reuse the same export while data doesn't change. \
+            Progress is sent to ws/submission/<id>/ and returned by _export/<id>",
+        manual_parameters=[
+            openapi.Parameter('name', openapi.IN_PATH,
+                description="type of records to export",
+                type=openapi.TYPE_STRING,
+                enum=ALLOWED_INDICES)
+        ],
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'file_format': openapi.Schema(type=openapi.TYPE_STRING),
+                '_source': openapi.Schema(type=openapi.TYPE_STRING),
+                'columns': openapi.Schema(type=openapi.TYPE_ARRAY,
+                                          items=openapi.Schema(type=openapi.TYPE_STRING)),
+                'sort': openapi.Schema(type=openapi.TYPE_STRING),
+                'filters': openapi.Schema(type=openapi.TYPE_OBJECT)
+            },
+            example={'file_format': 'csv.gz', '_source': '_source.biosampleId,_source.organism.text',
+                     'columns': ['Biosample ID', 'Organism'], 'filters': {'organism.text': ['Sus scrofa']}}
+        ),
+        responses={
+            202: openapi.Response('Accepted', schema=openapi.Schema(type=openapi.TYPE_OBJECT)),
+            400: openapi.Response('Bad Request'),
+            404: openapi.Response('Not Found')
+        })
+@api_view(['POST'])
+@permission_classes([AllowAny])
+@csrf_exempt
+def export_job(request, name):
+    if name not in ALLOWED_INDICES:
+        context = {
+            'status': '404', 'reason': 'This index doesn\'t exist!'
+        }
+        response = HttpResponse(
+            json.dumps(context), content_type='application/json')
+        response.status_code = 404
         return response
-    else:
-        # add padding to align with max length data in a column
-        def space(i, d):
-            max_len = len(max(list(zip(*row_data))[i], key=len))
-            return d+' '*(max_len-len(d))
-
-        # create fixed width and '|' separated tabular text file
-        data = response.content
-        lines = [i.rstrip(b'\r\n') for i in filter(None, data.split(b'\n'))]
-        lines = [line.decode("utf-8") for line in lines]
-        row_data = csv.reader(lines, quotechar='"', delimiter=',', quoting=csv.QUOTE_ALL, skipinitialspace=True)
-        row_data = list(row_data)
-        tab_rows = [' | '.join(space(*c) for c in enumerate(b)) for b in row_data]
-        tab_data = '\n'.join(tab_rows)
-        response.content = tab_data
+    try:
+        params = json.loads(request.body.decode("utf-8"))
+    except ValueError:
+        params = None
+    if not isinstance(params, dict) or not params.get('_source'):
+        context = {
+            'status': '400',
+            'reason': 'Request body should be an object with _source and columns'
+        }
+        response = HttpResponse(
+            json.dumps(context), content_type='application/json')
+        response.status_code = 400
         return response
+    params = {key: params[key] for key in EXPORT_PARAMS if key in params}
+    try:
+        if not isinstance(params.get('file_format', ''), str):
+            raise ValueError('file_format should be a string')
+        parse_export_format(params.get('file_format', ''))
+    except ValueError as e:
+        context = {'status': '400', 'reason': str(e)}
+        response = HttpResponse(
+            json.dumps(context), content_type='application/json')
+        response.status_code = 400
+        return response
+
+    # reuse export of the same records made within EXPORT_JOB_TTL
+    key = None
+    # hex id matches the task_id pattern of ws/submission/<id>/
+    task_id = uuid.uuid4().hex
+    try:
+        key = export_job_key(name, params)
+        if not claim_export_job(key, task_id):
+            job = get_export_job(key)
+            if job is not None and 'url' not in job and \
+                    AsyncResult(job['id'], app=celery_app).state in states.PROPAGATE_STATES:
+                # task failed or was revoked without releasing the job
+                release_export_job(key, job['id'])
+                job = None if claim_export_job(key, task_id) else get_export_job(key)
+            if job is not None:
+                return JsonResponse(dict(job, status='SUCCESS' if 'url' in job else 'PENDING'))
+    except redis.RedisError as e:
+        logger.warning(f"Export jobs registry is unavailable: {e}")
+        key = None
+    export_records.apply_async(args=(key, name, params), task_id=task_id, queue='export')
+    return JsonResponse({'id': task_id, 'status': 'PENDING'}, status=202)
+
+
+@swagger_auto_schema(method='get', tags=['Download'],
+        operation_summary="Get status of the export",
+        responses={
+            200: openapi.Response('OK', schema=openapi.Schema(type=openapi.TYPE_OBJECT))
+        })
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def export_status(request, id):
+    result = AsyncResult(id, app=celery_app)
+    data = {'id': id, 'status': result.state}
+    if result.state == 'PROGRESS':
+        data.update(result.info)
+    elif result.state == 'SUCCESS':
+        data.update(result.result)
+    elif result.state == 'FAILURE':
+        data['errors'] = str(result.result)
+    return JsonResponse(data)
+
+
+@swagger_auto_schema(method='get', auto_schema=None)
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def es_pool_stats(request):
+    # connection pool usage of the Elasticsearch clients in this worker process,
+    # only for staff as it shows addresses of the Elasticsearch nodes
+    return JsonResponse(get_pool_stats())
+
 
 @swagger_auto_schema(method='get', tags=['Protocols'],
         auto_schema=PdfAutoSchema,
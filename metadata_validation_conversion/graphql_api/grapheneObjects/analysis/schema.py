@@ -1,11 +1,11 @@
 from graphene import ObjectType, String, Field, ID, relay, List
-from graphene.relay import Connection, Node
+from graphene.relay import Node
 from graphql_api.tasks import launch_celery_task
 from celery.result import AsyncResult
-from ..helpers import fetch_index_records, fetch_with_join
+from ..helpers import fetch_single_record, resolve_connection
 from .field_objects import AnalysisDateField, AnalysisJoinField, FilesField, AnalysisOrganismField
 from .arguments.filter import AnalysisFilterArgument
-from ..common_field_objects import ProtocolField, TaskResponse
+from ..common_field_objects import ProtocolField, TaskResponse, CountableConnection
 
 
 def fetch_single_analysis(kwargs):
@@ -15,7 +15,7 @@ def fetch_single_analysis(kwargs):
     elif kwargs['alternate_id']:
         q = [{"terms": {"alternateId": [kwargs['alternate_id']]}}]
 
-    res = fetch_index_records('analysis', filter=q)[0]
+    res = fetch_single_record('analysis', q)
     res['id'] = res['accession']
     return res
 
@@ -61,7 +61,7 @@ class AnalysisNode(ObjectType):
         return fetch_single_analysis({'id': id})
 
 
-class AnalysisConnection(Connection):
+class AnalysisConnection(CountableConnection):
     class Meta:
         node = AnalysisNode
 
@@ -79,9 +79,7 @@ class AnalysisSchema(ObjectType):
         return fetch_single_analysis(kwargs)
 
     def resolve_all_analysis(root, info, **kwargs):
-        filter_query = kwargs['filter'] if 'filter' in kwargs else {}
-        res = fetch_with_join(filter_query, 'analysis')
-        return res
+        return resolve_connection(info, 'analysis', AnalysisConnection, **kwargs)
 
     def resolve_all_analysis_as_task(root, info, **kwargs):
         task = launch_celery_task.apply_async(args=[kwargs, 'analysis'], queue='graphql_api')
@@ -1,11 +1,11 @@
 from graphene import ObjectType, String, Field, ID, relay, List
-from graphene.relay import Connection, Node
+from graphene.relay import Node
 from graphql_api.tasks import launch_celery_task
 from celery.result import AsyncResult
-from ..helpers import fetch_index_records, fetch_with_join
+from ..helpers import fetch_single_record, resolve_connection
 from .field_objects import RelatedDatasets_Field, ArticleJoin_Field
 from .arguments.filter import ArticleFilterArgument
-from ..common_field_objects import TaskResponse
+from ..common_field_objects import TaskResponse, CountableConnection
 
 
 def fetch_single_article(args):
@@ -17,7 +17,7 @@ def fetch_single_article(args):
             ]
         }
     }]
-    res = fetch_index_records('article', filter=q)[0]
+    res = fetch_single_record('article', q)
     res['id'] = res['pmcId'] if res['pmcId'] else res['pubmedId']
     return res
 
@@ -47,7 +47,7 @@ class ArticleNode(ObjectType):
         return fetch_single_article({'id': id})
 
 
-class ArticleConnection(Connection):
+class ArticleConnection(CountableConnection):
     class Meta:
         node = ArticleNode
 
@@ -65,9 +65,7 @@ class ArticleSchema(ObjectType):
         return fetch_single_article(args)
 
     def resolve_all_articles(root, info, **kwargs):
-        filter_query = kwargs['filter'] if 'filter' in kwargs else {}
-        res = fetch_with_join(filter_query, 'article')
-        return res
+        return resolve_connection(info, 'article', ArticleConnection, **kwargs)
 
     def resolve_all_articles_as_task(root, info, **kwargs):
         task = launch_celery_task.apply_async(args=[kwargs, 'article'], queue='graphql_api')
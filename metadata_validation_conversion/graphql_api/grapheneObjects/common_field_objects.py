@@ -1,4 +1,5 @@
-from graphene import ObjectType, String
+from graphene import ObjectType, String, Int
+from graphene.relay import Connection
 
 
 class OntologyField(ObjectType):
@@ -19,3 +20,16 @@ class ProtocolField(ObjectType):
 class TaskResponse(ObjectType):
     id = String()
     status = String()
+
+
+class CountableConnection(Connection):
+    class Meta:
+        abstract = True
+
+    total_count = Int()
+
+    def resolve_total_count(root, info, **kwargs):
+        # pages fetched from Elasticsearch have total set, lists are counted
+        if root.total_count is not None:
+            return root.total_count
+        return len(root.iterable)
@@ -1,4 +1,6 @@
 MAX_FILTER_QUERY_DEPTH = 3
+# max number of records in one page of connection fetched from Elasticsearch
+MAX_PAGE_SIZE = 10000
 
 ANALYSIS = 'analysis'
 EXPERIMENT = '2026_03_26_experiment'
@@ -11,6 +13,30 @@ PROTOCOL_ANALYSIS = 'protocol_analysis'
 PROTOCOL_FILES = 'protocol_files'
 PROTOCOL_SAMPLES = 'protocol_samples'
 
+# names of the join fields in graphql filters and results -> index names
+join_field_indices = {
+    'analysis': ANALYSIS,
+    'experiment': EXPERIMENT,
+    'specimen': SPECIMEN,
+    'organism': ORGANISM,
+    'article': ARTICLE,
+    'dataset': DATASET,
+    'file': FILE,
+    'protocol_analysis': PROTOCOL_ANALYSIS,
+    'protocol_files': PROTOCOL_FILES,
+    'protocol_samples': PROTOCOL_SAMPLES,
+}
+
+# experiment fields renamed in graphql results -> names in the index
+experiment_source_fields = {
+    'ChIPSeqDnaBinding': 'ChIP-seq DNA-binding',
+    'HiC': 'Hi-C',
+    'RNASeq': 'RNA-seq',
+    'CAGESeq': 'CAGE-seq',
+    'ATACSeq': 'ATAC-seq',
+    'BsSeq': 'BS-seq',
+}
+
 index_mapping = {
     (ANALYSIS, EXPERIMENT): {
         'left_index_key': 'experimentAccessions',
@@ -1,12 +1,12 @@
 from graphene import ObjectType, String, Field, ID, relay, List
-from graphene.relay import Connection, Node
+from graphene.relay import Node
 from graphql_api.tasks import launch_celery_task
 from celery.result import AsyncResult
-from ..helpers import fetch_index_records, fetch_with_join
+from ..helpers import fetch_single_record, resolve_connection
 from .field_objects import DatasetJoinField, DatasetExperimentField, FileField, DatasetPublishedArticlesField, \
     SpecimenField
 from .arguments.filter import DatasetFilterArgument
-from ..common_field_objects import OntologyField, TaskResponse
+from ..common_field_objects import OntologyField, TaskResponse, CountableConnection
 
 
 def fetch_single_dataset(args):
@@ -17,7 +17,7 @@ def fetch_single_dataset(args):
     elif args['alternate_id']:
         q = [{"terms": {"alternateId": [args['alternate_id']]}}]
 
-    res = fetch_index_records('2026_03_26_dataset', filter=q)[0]
+    res = fetch_single_record('2026_03_26_dataset', q)
     res['id'] = res['accession']
     return res
 
@@ -53,7 +53,7 @@ class DatasetNode(ObjectType):
         return fetch_single_dataset({'id': id})
 
 
-class DatasetConnection(Connection):
+class DatasetConnection(CountableConnection):
     class Meta:
         node = DatasetNode
 
@@ -71,9 +71,7 @@ class DatasetSchema(ObjectType):
         return fetch_single_dataset(args)
 
     def resolve_all_datasets(root, info, **kwargs):
-        filter_query = kwargs['filter'] if 'filter' in kwargs else {}
-        res = fetch_with_join(filter_query, '2026_03_26_dataset')
-        return res
+        return resolve_connection(info, '2026_03_26_dataset', DatasetConnection, **kwargs)
 
     def resolve_all_datasets_as_task(root, info, **kwargs):
         task = launch_celery_task.apply_async(args=[kwargs, '2026_03_26_dataset'], queue='graphql_api')
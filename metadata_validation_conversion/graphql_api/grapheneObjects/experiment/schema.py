@@ -1,15 +1,15 @@
 import json
 
 from graphene import ObjectType, String, Field, ID, relay
-from graphene.relay import Connection, Node
+from graphene.relay import Node
 from graphql_api.tasks import launch_celery_task
 from celery.result import AsyncResult
-from ..helpers import fetch_index_records, fetch_with_join
+from ..helpers import fetch_single_record, resolve_connection
 from .field_objects import ATACseqField, BsSeqField, CAGEseqField, ChIPSeqDnaBindingField, \
     ChIPseqInputDNAField, DNaseSeqField, ExperimentCustomFieldField, ExperimentJoinField, HiCField, \
     RNAseqField, WGSField
 from .arguments.filter import ExperimentFilterArgument
-from ..common_field_objects import ProtocolField, UnitField, TaskResponse
+from ..common_field_objects import ProtocolField, UnitField, TaskResponse, CountableConnection
 
 
 def fetch_single_experiment(args):
@@ -19,7 +19,7 @@ def fetch_single_experiment(args):
     elif args['alternate_id']:
         q = [{"terms": {"alternateId": [args['alternate_id']]}}]
 
-    res = fetch_index_records('2026_03_26_experiment', filter=q)[0]
+    res = fetch_single_record('2026_03_26_experiment', q)
     res['id'] = res['accession']
     return res
 
@@ -68,7 +68,7 @@ class ExperimentNode(ObjectType):
         return fetch_single_experiment({'id': id})
 
 
-class ExperimentConnection(Connection):
+class ExperimentConnection(CountableConnection):
     class Meta:
         node = ExperimentNode
 
@@ -86,9 +86,7 @@ class ExperimentSchema(ObjectType):
         return fetch_single_experiment(args)
 
     def resolve_all_experiments(root, info, **kwargs):
-        filter_query = kwargs['filter'] if 'filter' in kwargs else {}
-        res = fetch_with_join(filter_query, '2026_03_26_experiment')
-        return res
+        return resolve_connection(info, '2026_03_26_experiment', ExperimentConnection, **kwargs)
 
     def resolve_all_experiments_as_task(root, info, **kwargs):
         task = launch_celery_task.apply_async(args=[kwargs, '2026_03_26_experiment'], queue='graphql_api')
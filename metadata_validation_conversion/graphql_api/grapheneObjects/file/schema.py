@@ -1,12 +1,12 @@
 from graphene import ObjectType, String, Field, ID, relay, List
-from graphene.relay import Connection, Node
+from graphene.relay import Node
 from graphql_api.tasks import launch_celery_task
 from celery.result import AsyncResult
-from ..helpers import fetch_index_records, fetch_with_join
+from ..helpers import fetch_single_record, resolve_connection
 from .field_objects import FileExperimentField, FileJoinField, FilePublishedArticlesField, RunField, SpeciesField, \
     StudyField
 from .arguments.filter import FileFilterArgument
-from ..common_field_objects import TaskResponse
+from ..common_field_objects import TaskResponse, CountableConnection
 
 
 def fetch_single_file(args):
@@ -17,7 +17,7 @@ def fetch_single_file(args):
     elif args['alternate_id']:
         q = [{"terms": {"alternateId": [args['alternate_id']]}}]
 
-    res = fetch_index_records('2026_03_26_file', filter=q)[0]
+    res = fetch_single_record('2026_03_26_file', q)
 
     res['id'] = res['name'].split('.', 1)[0]
     return res
@@ -58,7 +58,7 @@ class FileNode(ObjectType):
         return fetch_single_file(args)
 
 
-class FileConnection(Connection):
+class FileConnection(CountableConnection):
     class Meta:
         node = FileNode
 
@@ -76,9 +76,7 @@ class FileSchema(ObjectType):
         return fetch_single_file(args)
 
     def resolve_all_files(root, info, **kwargs):
-        filter_query = kwargs['filter'] if 'filter' in kwargs else {}
-        res = fetch_with_join(filter_query, '2026_03_26_file')
-        return res
+        return resolve_connection(info, '2026_03_26_file', FileConnection, **kwargs)
 
     def resolve_all_files_as_task(root, info, **kwargs):
         task = launch_celery_task.apply_async(args=[kwargs, '2026_03_26_file'], queue='graphql_api')
@@ -1,15 +1,27 @@
-import math
+import base64
+import binascii
+import threading
+from functools import lru_cache, partial
 from collections import defaultdict
-from .constants import MAX_FILTER_QUERY_DEPTH, index_mapping
-import json
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
-from elasticsearch import Elasticsearch, RequestsHttpConnection
+from .constants import MAX_FILTER_QUERY_DEPTH, MAX_PAGE_SIZE, EXPERIMENT, index_mapping, join_field_indices
+from .projection import source_includes, join_selection, node_selection
+import json
+from metadata_validation_conversion.es_client import get_es_client
+from api.query_compiler import compile_nested_filters
+from graphene.relay import PageInfo
+from api.pagination import iter_pit_slices
 
-es = Elasticsearch([settings.NODE],
-                   connection_class=RequestsHttpConnection,
-                   http_auth=(settings.ES_USER, settings.ES_PASSWORD),
-                   use_ssl=True,
-                   verify_certs=True)
+# number of records fetched from Elasticsearch at once
+ES_FETCH_PAGE_SIZE = 10000
+# order of connection records, _id is unique, so search_after of the last
+# record starts the next page without point in time
+CONNECTION_SORT = [{'_id': 'asc'}]
+
+# marks threads of the join pool, work started there runs sequentially, so
+# one query uses at most GRAPHQL_JOIN_WORKERS threads for joins and key chunks
+_join_pool = threading.local()
 
 
 def flatten_json(y):
@@ -64,15 +76,9 @@ def is_filter_query_depth_valid(filter, current_depth=1):
     return True
 
 
-def generate_es_filters(basic_query, es_filter_queries, prefix=''):
-    for key in list(basic_query):
-        es_key = prefix + '.' + key if prefix else key
-        if isinstance(basic_query[key], dict):
-            generate_es_filters(basic_query[key], es_filter_queries, es_key)
-        else:
-            # if es_key not in non_keyword_properties:
-            #     es_key += '.keyword'
-            es_filter_queries.append({"terms": {es_key: basic_query[key]}})
+def generate_es_filters(basic_query, es_filter_queries, prefix='', index=None):
+    # text fields are matched on their keyword subfield when index mapping is known
+    es_filter_queries.extend(compile_nested_filters(basic_query, index, prefix))
 
 
 # in-place editing, no need to return right_index_map
@@ -123,25 +129,46 @@ def generate_index_map(index_data, record_key):
     return index_map
 
 
+@lru_cache(maxsize=None)
+def compile_key_path(key_path):
+    """
+    This function will compile dotted key path, e.g. 'experiment.accession',
+    to function returning values found at this path. Lists are walked at any
+    level, like in flatten_json
+    :param key_path: dotted key path
+    :return: function taking a document and returning generator of values
+    """
+    parts = tuple(key_path.split('.'))
+    last = len(parts)
+
+    def walk(value, depth):
+        if isinstance(value, list):
+            for item in value:
+                yield from walk(item, depth)
+        elif depth == last:
+            if value is not None and value != '' and not isinstance(value, dict):
+                yield value
+        elif isinstance(value, dict) and parts[depth] in value:
+            yield from walk(value[parts[depth]], depth + 1)
+
+    return lambda document: walk(document, 0)
+
+
 def retrieve_mapping_keys(record, record_key):
-    flat_doc = flatten_json(record)
-    mapping_keys = flat_doc.get(record_key, None)
-    mapping_keys_list = []
+    # only the keys on the path are visited, order of first appearance is kept
+    return list(dict.fromkeys(compile_key_path(record_key)(record)))
 
-    if mapping_keys:
-        if '.' in record_key:
-            mapping_keys_list = [*set(mapping_keys.split(',\n'))]
-        else:
-            mapping_keys_list = [*set(mapping_keys.split(','))]
 
-    return mapping_keys_list
+def get_index_name(name):
+    # join fields are named after indices without the date prefix
+    return join_field_indices.get(name, name)
 
 
 def get_joined_data(left_index, right_index, left_index_data, right_index_data):
     resultset = []
+    join_keys = index_mapping[(get_index_name(left_index), get_index_name(right_index))]
 
-    right_index_map = generate_index_map(right_index_data,
-                                         index_mapping[(left_index, right_index)]['right_index_key'])
+    right_index_map = generate_index_map(right_index_data, join_keys['right_index_key'])
     for left_document in left_index_data:
 
         # exceptional case in experiment index where field name has space, e.g "ChIP-seq DNA-binding"
@@ -150,14 +177,14 @@ def get_joined_data(left_index, right_index, left_index_data, right_index_data):
         if 'join' not in left_document:
             left_document['join'] = defaultdict(list)
 
-        left_index_fk = index_mapping[(left_index, right_index)]['left_index_key']
+        left_index_fk = join_keys['left_index_key']
         mapping_keys_list = retrieve_mapping_keys(left_document, left_index_fk)
 
         if mapping_keys_list:
             for key in mapping_keys_list:
                 if key in right_index_map:
                     # exceptional case in experiment index where field name has space, e.g "ChIP-seq DNA-binding"
-                    if right_index == "2026_03_26_experiment":
+                    if get_index_name(right_index) == EXPERIMENT:
                         rec_list = right_index_map[key]
                         for dict in rec_list:
                             update_experiment_fieldnames(dict)
@@ -173,67 +200,180 @@ def get_joined_data(left_index, right_index, left_index_data, right_index_data):
     return resultset
 
 
-def fetch_with_join(filter, left_index, prev_index_data=None, key_filter_name=None):
-    if prev_index_data is None:
-        prev_index_data = []
-
+def fetch_with_join(filter, left_index, prev_index_data=None, key_filter_name=None, selection=None):
+    """
+    This function will fetch records of the left index and join records of
+    the indices listed in 'join' part of the filter
+    :param filter: filter with 'basic' and 'join' parts
+    :param left_index: name of the index or of the join field
+    :param prev_index_data: keys of the records to fetch
+    :param key_filter_name: field holding the keys
+    :param selection: fields selected by the query, see projection.node_selection,
+    None to fetch whole records and all joins
+    :return: list of records, joined records are under 'join'
+    """
     # query is invalid if we have a join between more than 3 indices
     if not is_filter_query_depth_valid(filter):
         raise Exception('Query exceeds the maximum join depth of {}'.format(MAX_FILTER_QUERY_DEPTH))
 
-    if not bool(filter):
-        return fetch_index_records(left_index)
+    left_index = get_index_name(left_index)
+    # joins that the query doesn't select can't change the result
+    joins = [right_index for right_index in filter.get('join', {})
+             if selection is None or right_index in selection.get('join', {})]
+    source = None if selection is None else source_includes(left_index, selection, joins, key_filter_name)
+    left_index_data = list(fetch_filtered_records(filter, left_index, prev_index_data, key_filter_name,
+                                                  source=source))
 
+    # if left_index_data is empty (we cannot have join in this case)
+    # or join not found in filter, return result of the left index only
+    if not bool(left_index_data) or not joins:
+        return left_index_data
+
+    return join_records(filter, left_index, left_index_data, joins, selection)
+
+
+def fetch_join_records(filter, left_index, left_index_data, right_index, selection=None):
+    """
+    This function will fetch records of the right index matching keys of the
+    left records
+    :param filter: filter with 'join' part
+    :param left_index: name of the left index
+    :param left_index_data: list of left records
+    :param right_index: join field to fetch
+    :param selection: fields selected by the query or None
+    :return: list or generator of right records
+    """
+    right_index_filter = filter['join'][right_index]
+    join_keys = index_mapping[(left_index, get_index_name(right_index))]
+    right_selection = None if selection is None else join_selection(selection, right_index)
+
+    mapping_key_list = []
+    for rec in left_index_data:
+        mapping_key_list.extend(retrieve_mapping_keys(rec, join_keys['left_index_key']))
+    mapping_key_list = list(dict.fromkeys(mapping_key_list))
+    right_index_key = join_keys['right_index_key']
+
+    if not mapping_key_list:
+        # nothing to join with
+        return []
+    if 'join' in right_index_filter:
+        return fetch_with_join(right_index_filter, right_index,
+                               prev_index_data=mapping_key_list,
+                               key_filter_name=right_index_key,
+                               selection=right_selection)
+    # right records are only read once to build the index map, so they are streamed
+    right_source = None if right_selection is None else \
+        source_includes(get_index_name(right_index), right_selection, key_field=right_index_key)
+    return fetch_filtered_records(right_index_filter, get_index_name(right_index),
+                                  prev_index_data=mapping_key_list,
+                                  key_filter_name=right_index_key,
+                                  source=right_source)
+
+
+def in_join_pool():
+    return getattr(_join_pool, 'active', False)
+
+
+def _run_in_join_pool(fn, item):
+    _join_pool.active = True
+    try:
+        return fn(item)
+    finally:
+        _join_pool.active = False
+
+
+def join_pool_map(fn, items):
+    """
+    This function will call fn for every item on a pool of
+    GRAPHQL_JOIN_WORKERS threads, calls made from the pool run sequentially in
+    the calling thread, so pools aren't nested
+    :param fn: function of one argument
+    :param items: list of arguments
+    :return: generator of results in order of items
+    """
+    if in_join_pool():
+        for item in items:
+            yield fn(item)
+        return
+    workers = min(len(items), settings.GRAPHQL_JOIN_WORKERS)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='graphql_join') as executor:
+        yield from executor.map(partial(_run_in_join_pool, fn), items)
+
+
+def join_records(filter, left_index, left_index_data, joins, selection=None):
+    """
+    This function will join records of the right indices to the left records
+    :param filter: filter with 'join' part
+    :param left_index: name of the left index
+    :param left_index_data: list of left records
+    :param joins: join fields to fetch
+    :param selection: fields selected by the query or None
+    :return: list of left records, joined records are under 'join'
+    """
+    if len(joins) < 2:
+        # single join is streamed straight into the index map
+        fetched = (fetch_join_records(filter, left_index, left_index_data, right_index, selection)
+                   for right_index in joins)
+    else:
+        # sibling joins don't depend on each other, right records are read in the
+        # workers, so each of them is materialized there
+        fetched = list(join_pool_map(
+            lambda right_index: list(fetch_join_records(filter, left_index, left_index_data,
+                                                        right_index, selection)), joins))
+
+    for right_index, right_index_data in zip(joins, fetched):
+        left_index_data = get_joined_data(left_index, right_index, left_index_data, right_index_data)
+
+    # return the joined result data
+    return left_index_data
+
+
+def generate_basic_filters(filter, index):
     es_filter_queries = []
     if 'basic' in filter:
         # exceptional case in experiment index where field name has space, e.g "ChIP-seq DNA-binding"
-        if left_index == "2026_03_26_experiment":
+        if index == EXPERIMENT:
             update_experiment_es_filter_fieldnames(filter['basic'])
-        generate_es_filters(filter['basic'], es_filter_queries)
+        generate_es_filters(filter['basic'], es_filter_queries, index=index)
+    return es_filter_queries
+
+
+def fetch_filtered_records(filter, index, prev_index_data=None, key_filter_name=None, source=None):
+    """
+    This function will fetch records of the index matching 'basic' part of the
+    filter and having key_filter_name in prev_index_data
+    :param filter: filter with optional 'basic' part, 'join' part is ignored
+    :param index: name of the index
+    :param prev_index_data: keys of the records to fetch
+    :param key_filter_name: field holding the keys
+    :param source: list of fields to fetch, all fields when None
+    :return: generator of records
+    """
+    es_filter_queries = generate_basic_filters(filter, index)
 
     # if condition to deal with situation where Terms Query request exceeds the allowed maximum of [65536]
     if prev_index_data and len(prev_index_data) > 50000:
-        left_index_data = []
-        start_from = 0
-        every_nth = 50000
-        run_times = math.ceil(len(prev_index_data) / every_nth)
-        for i in range(run_times):
-            fetched_records = fetch_index_records(index_name=left_index, filter=es_filter_queries,
-                                                  key_filter=prev_index_data[start_from:every_nth],
-                                                  key_filter_name=key_filter_name)
-            for dictionary in fetched_records:
-                if dictionary not in left_index_data:
-                    left_index_data.append(dictionary)
-
-            start_from = every_nth
-            every_nth = every_nth + 50000
-
+        fetch_chunk = partial(fetch_key_chunk, index, es_filter_queries, key_filter_name, source)
+        chunks = [prev_index_data[start_from:start_from + 50000]
+                  for start_from in range(0, len(prev_index_data), 50000)]
+        seen = set()
+        # chunks are fetched concurrently and returned in order
+        for fetched_records in join_pool_map(fetch_chunk, chunks):
+            # record can match keys from different chunks
+            for record in fetched_records:
+                if record['_id'] not in seen:
+                    seen.add(record['_id'])
+                    yield record
     else:
-        left_index_data = fetch_index_records(index_name=left_index, filter=es_filter_queries,
-                                              key_filter=prev_index_data, key_filter_name=key_filter_name)
+        yield from fetch_index_records(index_name=index, filter=es_filter_queries,
+                                       key_filter=prev_index_data, key_filter_name=key_filter_name,
+                                       source=source)
 
-    # if left_index_data is empty (we cannot have join in this case)
-    # or join not found in filter, return result of the left index only
-    if not bool(left_index_data) or 'join' not in filter:
-        return left_index_data
-
-    for right_index in list(filter['join']):
-        right_index_filter = filter['join'][right_index]
-
-        mapping_key_list = []
-        for rec in left_index_data:
-            mapping_key_list.extend(retrieve_mapping_keys(rec,
-                                                          index_mapping[(left_index, right_index)]['left_index_key']))
-
-        right_index_data = fetch_with_join(right_index_filter, right_index,
-                                           prev_index_data=mapping_key_list,
-                                           key_filter_name=index_mapping[(left_index, right_index)][
-                                               'right_index_key'])
-
-        left_index_data = get_joined_data(left_index, right_index, left_index_data, right_index_data)
 
-    # return the joined result data
-    return left_index_data
+def fetch_key_chunk(index, filter_queries, key_filter_name, source, keys):
+    # read in a worker thread, so records are collected to a list there
+    return list(fetch_index_records(index_name=index, filter=filter_queries, key_filter=keys,
+                                    key_filter_name=key_filter_name, source=source))
 
 
 def fetch_index_records(index_name, **kwargs):
@@ -244,36 +384,153 @@ def fetch_index_records(index_name, **kwargs):
     if 'key_filter' in kwargs and kwargs['key_filter'] and 'key_filter_name' in kwargs and kwargs['key_filter_name']:
         filter_queries.append({"terms": {kwargs['key_filter_name']: kwargs['key_filter']}})
 
+    query = build_query(filter_queries)
+    return es_fetch_records(index_name, json.dumps(query), source=kwargs.get('source'),
+                            size=kwargs.get('size', ES_FETCH_PAGE_SIZE), slices=kwargs.get('slices'))
+
+
+class RecordNotFound(Exception):
+    pass
+
+
+def fetch_single_record(index_name, filter_queries):
+    """
+    This function will fetch the first record matching filters with one
+    search
+    :param index_name: name of the index
+    :param filter_queries: list of filter queries
+    :return: record with '_id'
+    """
+    data = get_es_client().search(index=index_name, body=build_query(filter_queries), size=1,
+                                  track_total_hits=False)
+    hits = data['hits']['hits']
+    if not hits:
+        raise RecordNotFound(f"Record not found in {index_name}")
+    return add_id_to_document(hits[0])
+
+
+def build_query(filter_queries):
     if filter_queries:
-        query = {
+        return {
             "query": {
                 "bool": {
                     "filter": filter_queries
                 }
             }
         }
-    else:
-        query = {
-            "query": {
-                'match_all': {}
-            }
+    return {
+        "query": {
+            'match_all': {}
         }
+    }
+
+
+def es_fetch_records(index, filters, source=None, size=ES_FETCH_PAGE_SIZE, slices=None):
+    """
+    This function will fetch records one page at a time, slices of the index
+    are read concurrently and order of records is not kept
+    :param index: name of the index
+    :param filters: json query
+    :param source: list of fields to fetch, all fields when None
+    :param size: page size
+    :param slices: number of slices, ES_PIT_SLICES by default and one slice
+    in threads of the join pool
+    :return: generator of records with '_id'
+    """
+    if not slices and in_join_pool():
+        slices = 1
+    hits = iter_pit_slices(get_es_client(), index, json.loads(filters), slices=slices, size=size,
+                           _source_includes=','.join(source) if source else None)
+    for rec in hits:
+        yield add_id_to_document(rec)
+
+
+def encode_connection_cursor(search_after, position):
+    """
+    This function will encode cursor of the connection edge
+    :param search_after: sort values of the record
+    :param position: number of records up to and including this one
+    :return: url-safe token
+    """
+    state = json.dumps({'search_after': search_after, 'position': position}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(state.encode('utf-8')).decode('ascii')
+
+
+def decode_connection_cursor(cursor):
+    """
+    This function will decode cursor produced by encode_connection_cursor
+    :param cursor: cursor of the edge
+    :return: tuple of (search_after, position)
+    """
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return state['search_after'], int(state['position'])
+    except (binascii.Error, ValueError, KeyError, TypeError, UnicodeError):
+        raise Exception(f"Invalid cursor: {cursor}")
+
+
+def fetch_connection(filter, left_index, connection_type, first, after=None, selection=None):
+    """
+    This function will fetch one page of the connection, page of the left
+    index is read from Elasticsearch with search_after and only its records
+    are joined
+    :param filter: filter with 'basic' and 'join' parts
+    :param left_index: name of the index
+    :param connection_type: graphene connection class
+    :param first: number of records in page
+    :param after: cursor of the last record of previous page
+    :param selection: fields selected by the query, see projection.node_selection
+    :return: instance of connection_type
+    """
+    # query is invalid if we have a join between more than 3 indices
+    if not is_filter_query_depth_valid(filter):
+        raise Exception('Query exceeds the maximum join depth of {}'.format(MAX_FILTER_QUERY_DEPTH))
 
-    recordset = es_fetch_records(index_name, json.dumps(query))
-    return recordset
-
-
-def es_fetch_records(index, filters):
-    count = 0
-    recordset = []
-
-    while True:
-        res = es.search(index=index, size=50000, from_=count,
-                        track_total_hits=True, body=json.loads(filters))
-        count += 50000
-        records = list(map(lambda rec: add_id_to_document(rec), res['hits']['hits']))
-        recordset += records
-
-        if count > res['hits']['total']['value']:
-            break
-    return recordset
\ No newline at end of file
+    left_index = get_index_name(left_index)
+    joins = [right_index for right_index in filter.get('join', {})
+             if selection is None or right_index in selection.get('join', {})]
+    source = None if selection is None else source_includes(left_index, selection, joins)
+    search_after, position = decode_connection_cursor(after) if after else (None, 0)
+    body = dict(build_query(generate_basic_filters(filter, left_index)), sort=CONNECTION_SORT)
+    if search_after is not None:
+        body['search_after'] = search_after
+    data = get_es_client().search(index=left_index, body=body, size=min(first, MAX_PAGE_SIZE),
+                                  track_total_hits=True,
+                                  _source_includes=','.join(source) if source else None)
+
+    hits = data['hits']['hits']
+    cursors = [encode_connection_cursor(hit['sort'], position + i + 1) for i, hit in enumerate(hits)]
+    records = [add_id_to_document(hit) for hit in hits]
+    if records and joins:
+        records = join_records(filter, left_index, records, joins, selection)
+
+    total = data['hits']['total']['value']
+    edges = [connection_type.Edge(node=record, cursor=cursor) for record, cursor in zip(records, cursors)]
+    # cursors keep the position of the record, so both flags are known
+    page_info = PageInfo(start_cursor=cursors[0] if cursors else None,
+                         end_cursor=cursors[-1] if cursors else None,
+                         has_previous_page=position > 0,
+                         has_next_page=position + len(hits) < total)
+    return connection_type(edges=edges, page_info=page_info, total_count=total)
+
+
+def resolve_connection(info, index, connection_type, filter=None, first=None, after=None, last=None,
+                       before=None, **kwargs):
+    """
+    This function will resolve connection field of the index, pages
+    requested with first/after are fetched from Elasticsearch, other
+    requests fetch all records, sort them by _id and are sliced by graphene
+    :param info: graphene resolve info
+    :param index: name of the index
+    :param connection_type: graphene connection class
+    :param filter: filter argument
+    :return: instance of connection_type or list of records
+    """
+    selection = node_selection(info)
+    if first is None or last is not None or before is not None:
+        # slices of the index are read concurrently, records are sorted so
+        # that last/before select the same records on every request
+        records = fetch_with_join(filter or {}, index, selection=selection)
+        records.sort(key=lambda record: record['_id'])
+        return records
+    return fetch_connection(filter or {}, index, connection_type, first, after, selection=selection)
@@ -1,8 +1,8 @@
 from graphene import ObjectType, String, Field, ID, relay, List, Int
-from graphene.relay import Connection, Node
-from ..common_field_objects import TaskResponse
+from graphene.relay import Node
+from ..common_field_objects import TaskResponse, CountableConnection
 from ...tasks import launch_celery_task
-from ..helpers import fetch_index_records, fetch_with_join
+from ..helpers import fetch_single_record, resolve_connection
 from .field_objects import OrganismCustomFieldField, FileOrganizationField, OrganismPublishedArticlesField, \
     OrganismJoinField, TextUnitField, TextOntologyTermsField
 from .arguments.filter import OrganismFilterArgument
@@ -18,7 +18,7 @@ def fetch_single_organism(args):
     elif args['alternate_id']:
         q = [{"terms": {"alternateId": [args['alternate_id']]}}]
 
-    res = fetch_index_records('2026_03_26_organism', filter=q)[0]
+    res = fetch_single_record('2026_03_26_organism', q)
     res['id'] = res['biosampleId']
     return res
 
@@ -68,7 +68,7 @@ class OrganismNode(ObjectType):
         return fetch_single_organism(args)
 
 
-class OrganismConnection(Connection):
+class OrganismConnection(CountableConnection):
     class Meta:
         node = OrganismNode
 
@@ -86,9 +86,7 @@ class OrganismSchema(ObjectType):
         return fetch_single_organism(args)
 
     def resolve_all_organisms(root, info, **kwargs):
-        filter_query = kwargs['filter'] if 'filter' in kwargs else {}
-        res = fetch_with_join(filter_query, '2026_03_26_organism')
-        return res
+        return resolve_connection(info, '2026_03_26_organism', OrganismConnection, **kwargs)
 
     def resolve_all_organisms_as_task(root, info, **kwargs):
         task = launch_celery_task.apply_async(args=[kwargs, '2026_03_26_organism'], queue='graphql_api')
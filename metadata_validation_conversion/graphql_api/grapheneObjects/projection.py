@@ -0,0 +1,91 @@
+from graphql.language.ast import Field, FragmentSpread
+from graphql.type.definition import get_named_type
+from graphene.utils.str_converters import to_camel_case
+from .constants import index_mapping, join_field_indices, experiment_source_fields, EXPERIMENT
+
+
+def _python_names(graphql_type):
+    # graphene converts names of the fields to camelCase in the schema
+    graphene_type = getattr(graphql_type, 'graphene_type', None)
+    if graphene_type is None or not hasattr(graphene_type._meta, 'fields'):
+        return {}
+    return {field.name or to_camel_case(name): name for name, field in graphene_type._meta.fields.items()}
+
+
+def _collect(info, selection_set, graphql_type, tree):
+    names = _python_names(graphql_type)
+    fields = getattr(graphql_type, 'fields', {})
+    for selection in selection_set.selections:
+        if isinstance(selection, Field):
+            name = selection.name.value
+            if name.startswith('__'):
+                continue
+            subtree = tree.setdefault(names.get(name, name), {})
+            if selection.selection_set and name in fields:
+                _collect(info, selection.selection_set, get_named_type(fields[name].type), subtree)
+        else:
+            # fragment spread or inline fragment
+            fragment = info.fragments[selection.name.value] if isinstance(selection, FragmentSpread) else selection
+            fragment_type = graphql_type
+            if fragment.type_condition is not None:
+                fragment_type = info.schema.get_type(fragment.type_condition.name.value)
+            _collect(info, fragment.selection_set, fragment_type, tree)
+
+
+def node_selection(info):
+    """
+    This function will collect fields selected for nodes of the connection
+    returned by the resolver, fragments are expanded
+    :param info: graphene resolve info
+    :return: dict field name -> dict of selected subfields
+    """
+    tree = {}
+    for field_ast in info.field_asts:
+        if field_ast.selection_set:
+            _collect(info, field_ast.selection_set, get_named_type(info.return_type), tree)
+    return tree.get('edges', {}).get('node', {})
+
+
+def join_selection(selection, join_field):
+    """
+    This function will return selection of the nodes of the join field
+    :param selection: selection from node_selection
+    :param join_field: name of the join field
+    :return: dict field name -> dict of selected subfields
+    """
+    return selection.get('join', {}).get(join_field, {}).get('edges', {}).get('node', {})
+
+
+def _leaf_paths(tree, prefix=''):
+    for name, subtree in tree.items():
+        if subtree:
+            yield from _leaf_paths(subtree, f'{prefix}{name}.')
+        else:
+            yield prefix + name
+
+
+def source_includes(index, selection, joins=(), key_field=None):
+    """
+    This function will convert selection to _source includes of the index,
+    keys needed for joins are always included
+    :param index: name of the index
+    :param selection: selection from node_selection
+    :param joins: join fields fetched for the records
+    :param key_field: field matched with keys of the previous index
+    :return: list of fields
+    """
+    includes = []
+    for name, subtree in selection.items():
+        if name == 'join':
+            continue
+        if index == EXPERIMENT and name in experiment_source_fields:
+            # renamed after fetch, see update_experiment_fieldnames
+            includes.append(experiment_source_fields[name])
+            continue
+        includes.extend(_leaf_paths({name: subtree}))
+    for join_field in joins:
+        includes.append(index_mapping[(index, join_field_indices.get(join_field, join_field))]['left_index_key'])
+    if key_field:
+        includes.append(key_field)
+    # _id is not part of _source, so nothing is returned when no fields were selected
+    return list(dict.fromkeys(includes)) or ['_id']
@@ -1,11 +1,11 @@
 from graphene import ObjectType, String, Field, ID, relay, List
-from graphene.relay import Connection, Node
+from graphene.relay import Node
 from graphql_api.tasks import launch_celery_task
 from celery.result import AsyncResult
-from ..helpers import fetch_index_records, fetch_with_join
+from ..helpers import fetch_single_record, resolve_connection
 from .field_objects import AnalysesField, ProtocolAnalysisJoinField
 from .arguments.filter import ProtocolAnalysisFilterArgument
-from ..common_field_objects import TaskResponse
+from ..common_field_objects import TaskResponse, CountableConnection
 
 
 def fetch_single_protocol_analysis(args):
@@ -16,7 +16,7 @@ def fetch_single_protocol_analysis(args):
     elif args['alternate_id']:
         q = [{"terms": {"alternateId": [args['alternate_id']]}}]
 
-    res = fetch_index_records('protocol_analysis', filter=q)[0]
+    res = fetch_single_record('protocol_analysis', q)
     res['id'] = res['key']
     return res
 
@@ -38,7 +38,7 @@ class ProtocolAnalysisNode(ObjectType):
         return fetch_single_protocol_analysis({'id': id})
 
 
-class ProtocolAnalysisConnection(Connection):
+class ProtocolAnalysisConnection(CountableConnection):
     class Meta:
         node = ProtocolAnalysisNode
 
@@ -56,9 +56,7 @@ class ProtocolAnalysisSchema(ObjectType):
         return fetch_single_protocol_analysis(args)
 
     def resolve_all_protocol_analysis(root, info, **kwargs):
-        filter_query = kwargs['filter'] if 'filter' in kwargs else {}
-        res = fetch_with_join(filter_query, 'protocol_analysis')
-        return res
+        return resolve_connection(info, 'protocol_analysis', ProtocolAnalysisConnection, **kwargs)
 
     def resolve_all_protocol_analysis_as_task(root, info, **kwargs):
         task = launch_celery_task.apply_async(args=[kwargs, 'protocol_analysis'], queue='graphql_api')
@@ -1,11 +1,11 @@
 from graphene import ObjectType, String, Field, ID, relay, List
-from graphene.relay import Connection, Node
+from graphene.relay import Node
 from graphql_api.tasks import launch_celery_task
 from celery.result import AsyncResult
-from ..helpers import fetch_index_records, fetch_with_join
+from ..helpers import fetch_single_record, resolve_connection
 from .field_objects import ExperimentsField, ProtocolFilesJoinField
 from .arguments.filter import ProtocolFilesFilterArgument
-from ..common_field_objects import TaskResponse
+from ..common_field_objects import TaskResponse, CountableConnection
 
 
 def fetch_single_protocol_file(args):
@@ -16,7 +16,7 @@ def fetch_single_protocol_file(args):
     elif args['alternate_id']:
         q = [{"terms": {"alternateId": [args['alternate_id']]}}]
 
-    res = fetch_index_records('protocol_files', filter=q)[0]
+    res = fetch_single_record('protocol_files', q)
     res['id'] = res['key']
     return res
 
@@ -40,7 +40,7 @@ class ProtocolFilesNode(ObjectType):
         return fetch_single_protocol_file({'id': id})
 
 
-class ProtocolFilesConnection(Connection):
+class ProtocolFilesConnection(CountableConnection):
     class Meta:
         node = ProtocolFilesNode
 
@@ -58,9 +58,7 @@ class ProtocolFilesSchema(ObjectType):
         return fetch_single_protocol_file(args)
 
     def resolve_all_protocol_files(root, info, **kwargs):
-        filter_query = kwargs['filter'] if 'filter' in kwargs else {}
-        res = fetch_with_join(filter_query, 'protocol_files')
-        return res
+        return resolve_connection(info, 'protocol_files', ProtocolFilesConnection, **kwargs)
 
     def resolve_all_protocol_files_as_task(root, info, **kwargs):
         task = launch_celery_task.apply_async(args=[kwargs, 'protocol_files'], queue='graphql_api')
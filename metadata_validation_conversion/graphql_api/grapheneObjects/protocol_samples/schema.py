@@ -1,11 +1,11 @@
 from graphene import ObjectType, String, Field, ID, relay, List
-from graphene.relay import Connection, Node
+from graphene.relay import Node
 from graphql_api.tasks import launch_celery_task
 from celery.result import AsyncResult
-from ..helpers import fetch_index_records, fetch_with_join
+from ..helpers import fetch_single_record, resolve_connection
 from .field_objects import ProtocolSamplesJoinField, SpecimensField
 from .arguments.filter import ProtocolSamplesFilterArgument
-from ..common_field_objects import TaskResponse
+from ..common_field_objects import TaskResponse, CountableConnection
 
 
 def fetch_single_protocol_sample(args):
@@ -16,7 +16,7 @@ def fetch_single_protocol_sample(args):
     elif args['alternate_id']:
         q = [{"terms": {"alternateId": [args['alternate_id']]}}]
 
-    res = fetch_index_records('protocol_samples', filter=q)[0]
+    res = fetch_single_record('protocol_samples', q)
     res['id'] = res['key']
     return res
 
@@ -39,7 +39,7 @@ class ProtocolSamplesNode(ObjectType):
         return fetch_single_protocol_sample({'id': id})
 
 
-class ProtocolSamplesConnection(Connection):
+class ProtocolSamplesConnection(CountableConnection):
     class Meta:
         node = ProtocolSamplesNode
 
@@ -57,9 +57,7 @@ class ProtocolSamplesSchema(ObjectType):
         return fetch_single_protocol_sample(args)
 
     def resolve_all_protocol_samples(root, info, **kwargs):
-        filter_query = kwargs['filter'] if 'filter' in kwargs else {}
-        res = fetch_with_join(filter_query, 'protocol_samples')
-        return res
+        return resolve_connection(info, 'protocol_samples', ProtocolSamplesConnection, **kwargs)
 
     def resolve_all_protocol_samples_as_task(root, info, **kwargs):
         task = launch_celery_task.apply_async(args=[kwargs, 'protocol_samples'], queue='graphql_api')
@@ -1,13 +1,13 @@
 from graphene import ObjectType, String, Field,ID, relay, List, Int
-from graphene.relay import Connection,Node
+from graphene.relay import Node
 from graphql_api.tasks import launch_celery_task
 from celery.result import AsyncResult
-from ..helpers import fetch_index_records, fetch_with_join
+from ..helpers import fetch_single_record, resolve_connection
 from .field_objects import CellCultureField,SpecimenOrganismField,CellLineField,CellSpecimenField,\
     SpecimenOrganizationField,PoolOfSpecimensField,SpecimenPublishedArticlesField,SpecimenCustomFieldField,\
     SpecimenFromOrganismField,SpecimenJoinField
 from .arguments.filter import SpecimenFilterArgument
-from ..common_field_objects import OntologyField, TaskResponse
+from ..common_field_objects import OntologyField, TaskResponse, CountableConnection
 
 
 def fetch_single_specimen(args):
@@ -18,7 +18,7 @@ def fetch_single_specimen(args):
     elif args['alternate_id']:
         q = [{"terms": {"alternateId": [args['alternate_id']]}}]
 
-    res = fetch_index_records('2026_03_26_specimen', filter=q)[0]
+    res = fetch_single_record('2026_03_26_specimen', q)
     res['id'] = res['biosampleId']
     return res
 
@@ -61,7 +61,7 @@ class SpecimenNode(ObjectType):
         args = {'id':id}
         return fetch_single_specimen(args)
 
-class SpecimenConnection(Connection):
+class SpecimenConnection(CountableConnection):
     class Meta:
         node = SpecimenNode
     
@@ -79,9 +79,7 @@ class SpecimenSchema(ObjectType):
         return fetch_single_specimen(args)
 
     def resolve_all_specimens(root, info,**kwargs):
-        filter_query = kwargs['filter'] if 'filter' in kwargs else {}
-        res = fetch_with_join(filter_query, '2026_03_26_specimen')
-        return res
+        return resolve_connection(info, '2026_03_26_specimen', SpecimenConnection, **kwargs)
 
     def resolve_all_specimens_as_task(root, info,**kwargs):
         task = launch_celery_task.apply_async(args=[kwargs, '2026_03_26_specimen'], queue='graphql_api')
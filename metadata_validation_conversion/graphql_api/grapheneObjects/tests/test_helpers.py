@@ -1,8 +1,11 @@
 import unittest
+from unittest import mock
 from graphql_api.grapheneObjects.tests import index_data
 
 from ..helpers import is_filter_query_depth_valid, generate_es_filters, update_experiment_fieldnames, \
-    retrieve_mapping_keys, generate_index_map, get_joined_data
+    retrieve_mapping_keys, generate_index_map, get_joined_data, compile_key_path, fetch_filtered_records, \
+    es_fetch_records, join_records
+from ..projection import source_includes
 
 
 
@@ -87,6 +90,161 @@ class TestSum(unittest.TestCase):
         result = retrieve_mapping_keys(record, record_key)
         self.assertEqual(result, ['SAMEA4675147'])
 
+    def test_compile_key_path(self):
+        record = {'experiment': [{'accession': 'ERX1'}, {'accession': ['ERX2', 'ERX1']}, {'accession': None}],
+                  'specimen': {'biosampleId': 'SAMEA1', 'organism': {'text': 'Sus scrofa'}},
+                  'sampleAccessions': ['SAMEA1', 'SAMEA2']}
+        self.assertEqual(list(compile_key_path('experiment.accession')(record)), ['ERX1', 'ERX2', 'ERX1'])
+        self.assertEqual(retrieve_mapping_keys(record, 'experiment.accession'), ['ERX1', 'ERX2'])
+        self.assertEqual(retrieve_mapping_keys(record, 'sampleAccessions'), ['SAMEA1', 'SAMEA2'])
+        # path ending at an object or missing path has no keys
+        self.assertEqual(retrieve_mapping_keys(record, 'specimen.organism'), [])
+        self.assertEqual(retrieve_mapping_keys(record, 'file.name'), [])
+        self.assertIs(compile_key_path('experiment.accession'), compile_key_path('experiment.accession'))
+
+    def test_fetch_filtered_records_streams_key_chunks(self):
+        keys = [f'SAMEA{i}' for i in range(50001)]
+
+        def fetch(key_filter, **kwargs):
+            # chunks are fetched concurrently, so records depend on the chunk and not on call order
+            if len(key_filter) == 50000:
+                return iter([{'_id': 'A'}, {'_id': 'B'}])
+            return iter([{'_id': 'B'}, {'_id': 'C'}])
+
+        with mock.patch('graphql_api.grapheneObjects.helpers.fetch_index_records', side_effect=fetch) as fetch:
+            records = fetch_filtered_records({'basic': {}}, 'specimen', keys, 'biosampleId')
+            self.assertEqual(fetch.call_count, 0)
+            self.assertEqual([rec['_id'] for rec in records], ['A', 'B', 'C'])
+        self.assertEqual(sorted(len(call.kwargs['key_filter']) for call in fetch.call_args_list), [1, 50000])
+
+    def test_join_records_fetches_sibling_joins(self):
+        organisms = [{'_id': 'SAMEA1', 'biosampleId': 'SAMEA1'}]
+        right_data = {'2026_03_26_specimen': [{'_id': 'SAMEA2', 'derivedFrom': 'SAMEA1'}],
+                      '2026_03_26_file': [{'_id': 'ERR1', 'organism': 'SAMEA1'}]}
+        with mock.patch('graphql_api.grapheneObjects.helpers.fetch_filtered_records',
+                        side_effect=lambda filter, index, **kwargs: iter(right_data[index])) as fetch:
+            result = join_records({'join': {'specimen': {}, 'file': {}}}, '2026_03_26_organism',
+                                  organisms, ['specimen', 'file'])
+        self.assertEqual(fetch.call_count, 2)
+        self.assertEqual(result[0]['join']['specimen'], right_data['2026_03_26_specimen'])
+        self.assertEqual(result[0]['join']['file'], right_data['2026_03_26_file'])
+
+    def test_join_pool_reads_single_slice(self):
+        organisms = [{'_id': 'SAMEA1', 'biosampleId': 'SAMEA1'}]
+        calls = []
+
+        def iter_pit_slices(es, index, body, slices=None, **kwargs):
+            calls.append(slices)
+            return iter([])
+
+        with mock.patch('graphql_api.grapheneObjects.helpers.get_es_client'), \
+                mock.patch('graphql_api.grapheneObjects.helpers.iter_pit_slices', side_effect=iter_pit_slices):
+            join_records({'join': {'specimen': {}, 'file': {}}}, '2026_03_26_organism',
+                         organisms, ['specimen', 'file'])
+        # slices would multiply threads of the join pool
+        self.assertEqual(calls, [1, 1])
+
+    def test_es_fetch_records_projects_source(self):
+        with mock.patch('graphql_api.grapheneObjects.helpers.get_es_client'), \
+                mock.patch('graphql_api.grapheneObjects.helpers.iter_pit_slices',
+                           return_value=iter([{'_id': 'SAMEA1', '_source': {'name': 'a'}}])) as iter_pit_slices:
+            records = es_fetch_records('specimen', '{}', source=['name', 'biosampleId'])
+            self.assertEqual(list(records), [{'name': 'a', '_id': 'SAMEA1'}])
+        self.assertEqual(iter_pit_slices.call_args.kwargs['_source_includes'], 'name,biosampleId')
+
+    def test_source_includes(self):
+        selection = {'biosampleId': {}, 'sex': {'text': {}}, 'join': {'specimen': {}}}
+        self.assertEqual(source_includes('2026_03_26_organism', selection, ['specimen'], 'organism'),
+                         ['biosampleId', 'sex.text', 'organism'])
+        self.assertEqual(source_includes('2026_03_26_experiment', {'HiC': {'hiCProtocol': {}}}),
+                         ['Hi-C'])
+        self.assertEqual(source_includes('2026_03_26_file', {}), ['_id'])
+
+    def test_query_selects_fields_and_joins(self):
+        from graphql_api.schema import schema
+        calls = []
+
+        def fetch(index, filters, source=None, **kwargs):
+            calls.append((index, source))
+            if index == '2026_03_26_organism':
+                return iter([{'_id': 'SAMEA1', 'biosampleId': 'SAMEA1'}])
+            return iter([{'_id': 'SAMEA2', 'biosampleId': 'SAMEA2', 'derivedFrom': 'SAMEA1'}])
+
+        query = """{ allOrganisms(filter: {join: {specimen: {}, file: {}}}) {
+            edges { node { biosampleId ...Sex join { specimen { edges { node { biosampleId } } } } } } }
+        }
+        fragment Sex on OrganismNode { sex { text } }"""
+        with mock.patch('graphql_api.grapheneObjects.helpers.es_fetch_records', side_effect=fetch):
+            result = schema.execute(query)
+        self.assertIsNone(result.errors)
+        node = result.data['allOrganisms']['edges'][0]['node']
+        self.assertEqual(node['join']['specimen']['edges'][0]['node'], {'biosampleId': 'SAMEA2'})
+        # file join isn't selected, so it isn't fetched
+        self.assertEqual(calls, [('2026_03_26_organism', ['biosampleId', 'sex.text']),
+                                 ('2026_03_26_specimen', ['biosampleId', 'derivedFrom'])])
+
+    def test_connection_pages_are_fetched_from_es(self):
+        from graphql_api.schema import schema
+        hits = [{'_id': f'SAMEA{i}', 'sort': [f'SAMEA{i}'], '_source': {'biosampleId': f'SAMEA{i}'}}
+                for i in range(5)]
+        es = mock.Mock()
+
+        def search(index, body, size, **kwargs):
+            start = int(body['search_after'][0][5:]) + 1 if 'search_after' in body else 0
+            return {'hits': {'total': {'value': 5}, 'hits': hits[start:start + size]}}
+
+        es.search.side_effect = search
+        query = """query($after: String) { allOrganisms(first: 2, after: $after) {
+            totalCount pageInfo { hasNextPage hasPreviousPage endCursor } edges { node { biosampleId } } } }"""
+        with mock.patch('graphql_api.grapheneObjects.helpers.get_es_client', return_value=es):
+            first_page = schema.execute(query).data['allOrganisms']
+            second_page = schema.execute(
+                query, variable_values={'after': first_page['pageInfo']['endCursor']}).data['allOrganisms']
+            last_page = schema.execute(
+                query, variable_values={'after': second_page['pageInfo']['endCursor']}).data['allOrganisms']
+        self.assertEqual(first_page['totalCount'], 5)
+        self.assertEqual(first_page['pageInfo']['hasNextPage'], True)
+        self.assertEqual(first_page['pageInfo']['hasPreviousPage'], False)
+        self.assertEqual([edge['node']['biosampleId'] for edge in second_page['edges']], ['SAMEA2', 'SAMEA3'])
+        self.assertEqual(second_page['pageInfo']['hasPreviousPage'], True)
+        self.assertEqual([edge['node']['biosampleId'] for edge in last_page['edges']], ['SAMEA4'])
+        self.assertEqual(last_page['pageInfo']['hasNextPage'], False)
+        self.assertEqual(es.search.call_args.kwargs['size'], 2)
+        self.assertEqual(es.search.call_args.kwargs['body']['sort'], [{'_id': 'asc'}])
+        # pages don't open point in time that nobody would close
+        es.open_point_in_time.assert_not_called()
+
+    def test_last_records_are_selected_in_id_order(self):
+        from graphql_api.schema import schema
+        # order in which slices answered
+        records = [{'_id': f'SAMEA{i}', 'biosampleId': f'SAMEA{i}'} for i in (3, 1, 4, 0, 2)]
+        query = "{ allOrganisms(last: 2) { edges { node { biosampleId } } } }"
+        with mock.patch('graphql_api.grapheneObjects.helpers.es_fetch_records',
+                        side_effect=lambda *args, **kwargs: iter([dict(record) for record in records])):
+            result = schema.execute(query)
+        self.assertIsNone(result.errors)
+        self.assertEqual([edge['node']['biosampleId'] for edge in result.data['allOrganisms']['edges']],
+                         ['SAMEA3', 'SAMEA4'])
+
+    def test_single_record_is_fetched_with_one_search(self):
+        from graphql_api.schema import schema
+        es = mock.Mock()
+        es.search.side_effect = [
+            {'hits': {'hits': [{'_id': 'SAMEA1', '_source': {'biosampleId': 'SAMEA1'}}]}},
+            {'hits': {'hits': []}},
+        ]
+        query = 'query($id: ID!) { organism(id: $id) { biosampleId } }'
+        with mock.patch('graphql_api.grapheneObjects.helpers.get_es_client', return_value=es):
+            found = schema.execute(query, variable_values={'id': 'SAMEA1'})
+            missing = schema.execute(query, variable_values={'id': 'SAMEA2'})
+        self.assertEqual(found.data['organism'], {'biosampleId': 'SAMEA1'})
+        self.assertEqual(es.search.call_args_list[0].kwargs['size'], 1)
+        self.assertEqual(es.search.call_args_list[0].kwargs['body']['query']['bool']['filter'],
+                         [{'terms': {'biosampleId': ['SAMEA1']}}])
+        self.assertIsNone(missing.data['organism'])
+        self.assertEqual(str(missing.errors[0]), 'Record not found in 2026_03_26_organism')
+        es.open_point_in_time.assert_not_called()
+
     def test_generate_index_map(self):
         index_map = [{'specimen': 'SAMEA104728837', 'organism': 'SAMEA104728862', 'species': {'text': 'Equus caballus',
                                                                                               'ontologyTerms': 'http://purl.obolibrary.org/obo/NCBITaxon_9796'},
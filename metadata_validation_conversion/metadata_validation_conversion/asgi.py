@@ -11,3 +11,7 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE",
                       "metadata_validation_conversion.settings")
 django.setup()
 application = get_default_application()
+
+# build prefix index for /data/_suggest/ while the worker starts
+from api.suggest import start_suggest_builder  # noqa: E402
+start_suggest_builder()
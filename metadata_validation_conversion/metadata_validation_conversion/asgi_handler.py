@@ -0,0 +1,59 @@
+import django
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+
+# Django 3.2 iterates streaming responses on the event loop, so a response
+# generated from Elasticsearch pages (e.g. download) would block every other
+# request of the worker until the last page is sent. Parts of streaming
+# responses are produced in a thread here, as newer Django versions do.
+
+# returned by the iterator when there are no more parts
+_END = object()
+
+
+class StreamingASGIHandler(ASGIHandler):
+
+    @staticmethod
+    def _response_headers(response):
+        headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode('ascii')
+            if isinstance(value, str):
+                value = value.encode('latin1')
+            headers.append((bytes(header), bytes(value)))
+        for c in response.cookies.values():
+            headers.append((b'Set-Cookie', c.output(header='').encode('ascii').strip()))
+        return headers
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            await super().send_response(response, send)
+            return
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': self._response_headers(response),
+        })
+        parts = iter(response)
+        next_part = sync_to_async(next, thread_sensitive=False)
+        try:
+            while True:
+                part = await next_part(parts, _END)
+                if part is _END:
+                    break
+                for chunk, _ in self.chunk_bytes(part):
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body'})
+        finally:
+            await sync_to_async(response.close, thread_sensitive=True)()
+
+
+def get_asgi_application():
+    """
+    This function will set up Django and return handler for http
+    connections, see django.core.asgi.get_asgi_application
+    :return: ASGI application
+    """
+    django.setup(set_prefix=False)
+    return StreamingASGIHandler()
@@ -0,0 +1,211 @@
+import os
+import json
+import asyncio
+import weakref
+import threading
+import logging
+
+from django.conf import settings
+from collections.abc import Mapping
+from elasticsearch import Elasticsearch, AsyncElasticsearch
+from elasticsearch.serializer import JSONSerializer
+
+logger = logging.getLogger(__name__)
+
+# One registry per process: clients are created on first use and reused by
+# every view and celery task so that TCP/TLS connections are kept alive between
+# requests instead of being set up again for each call.
+_clients = {}
+_clients_pid = None
+_clients_lock = threading.Lock()
+# aiohttp sessions are bound to the event loop, so async clients are kept per loop
+_async_clients = weakref.WeakKeyDictionary()
+
+# alias of the client that returns response bodies undecoded, so that search
+# responses can be passed to the user as they came from Elasticsearch
+RAW_CLIENT = 'raw'
+
+
+class RawJSON(Mapping):
+    """
+    Response body kept as it came from Elasticsearch. It's decoded only when
+    used as dict, e.g. by the product check or sniffing of the client.
+    """
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._data = None
+
+    def _decoded(self):
+        if self._data is None:
+            self._data = json.loads(self.raw)
+        return self._data
+
+    def __getitem__(self, key):
+        return self._decoded()[key]
+
+    def __iter__(self):
+        return iter(self._decoded())
+
+    def __len__(self):
+        return len(self._decoded())
+
+    def __str__(self):
+        return self.raw
+
+
+class RawJSONSerializer(JSONSerializer):
+    def loads(self, s):
+        return RawJSON(s)
+
+
+def _client_options(alias='default'):
+    """
+    This function will build Elasticsearch client options from settings
+    :param alias: name of the client in registry
+    :return: kwargs for the Elasticsearch client
+    """
+    options = {
+        'http_auth': (settings.ES_USER, settings.ES_PASSWORD),
+        'use_ssl': True,
+        'verify_certs': True,
+        'maxsize': settings.ES_MAXSIZE,
+        'timeout': settings.ES_TIMEOUT,
+        'retry_on_timeout': True,
+        'sniff_on_start': settings.ES_SNIFF_ON_START,
+        'sniff_on_connection_fail': settings.ES_SNIFF_ON_CONNECTION_FAIL,
+        'sniffer_timeout': settings.ES_SNIFFER_TIMEOUT or None,
+        'http_compress': settings.ES_HTTP_COMPRESS,
+    }
+    if alias == RAW_CLIENT:
+        options['serializers'] = {JSONSerializer.mimetype: RawJSONSerializer()}
+    return options
+
+
+def _reset_after_fork():
+    """
+    Drop clients inherited from a parent process (e.g. celery prefork pool),
+    sockets can't be shared between processes
+    """
+    global _clients_pid, _async_clients
+    if _clients_pid != os.getpid():
+        _clients.clear()
+        _async_clients = weakref.WeakKeyDictionary()
+        _clients_pid = os.getpid()
+
+
+def get_es_client(alias='default'):
+    """
+    This function will return pooled Elasticsearch client for current process
+    :param alias: name of the client in registry
+    :return: Elasticsearch client
+    """
+    client = _clients.get(alias) if _clients_pid == os.getpid() else None
+    if client is not None:
+        return client
+    with _clients_lock:
+        _reset_after_fork()
+        if alias not in _clients:
+            logger.info(f"Creating Elasticsearch client '{alias}' for {settings.ES_NODES}")
+            _clients[alias] = Elasticsearch(settings.ES_NODES, **_client_options(alias))
+        return _clients[alias]
+
+
+def get_async_es_client(alias='default'):
+    """
+    This function will return pooled AsyncElasticsearch client for the running
+    event loop, must be called from a coroutine
+    :param alias: name of the client in registry
+    :return: AsyncElasticsearch client
+    """
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        _reset_after_fork()
+        clients = _async_clients.setdefault(loop, {})
+        if alias not in clients:
+            logger.info(f"Creating AsyncElasticsearch client '{alias}' for {settings.ES_NODES}")
+            options = dict(_client_options(alias), maxsize=settings.ES_ASYNC_MAXSIZE)
+            clients[alias] = AsyncElasticsearch(settings.ES_NODES, **options)
+        return clients[alias]
+
+
+def _search_params(params):
+    """
+    This function will drop empty search parameters, they mean the same as
+    missing parameter for the search endpoints
+    :param params: search parameters (from_, size, _source, sort, q, ...)
+    :return: parameters for client.search
+    """
+    return {key: value for key, value in params.items() if value is not None and value != ''}
+
+
+def raw_search(client, index, body=None, **params):
+    """
+    This function will run search and return undecoded response body, takes
+    the same arguments as client.search
+    :param client: Elasticsearch client with raw serializer, see get_es_client(RAW_CLIENT)
+    :param index: name of the index
+    :param body: query body
+    :param params: search parameters (from_, size, _source, sort, q, ...)
+    :return: response body as str
+    """
+    return client.search(index=index, body=body, **_search_params(params)).raw
+
+
+async def async_raw_search(client, index, body=None, **params):
+    """
+    This function will run search with async client and return undecoded
+    response body, takes the same arguments as client.search
+    :param client: AsyncElasticsearch client with raw serializer, see get_async_es_client(RAW_CLIENT)
+    :param index: name of the index
+    :param body: query body
+    :param params: search parameters (from_, size, _source, sort, q, ...)
+    :return: response body as str
+    """
+    return (await client.search(index=index, body=body, **_search_params(params))).raw
+
+
+def get_pool_stats():
+    """
+    This function will collect connection pool usage for all clients in registry
+    :return: dict with stats per client and per node
+    """
+    stats = {'pid': os.getpid(), 'clients': {}}
+    if _clients_pid != os.getpid():
+        return stats
+    for alias, client in list(_clients.items()):
+        transport = client.transport
+        nodes = []
+        for connection in transport.connection_pool.connections:
+            pool = getattr(connection, 'pool', None)
+            node = {'host': connection.host}
+            if pool is not None and pool.pool is not None:
+                # urllib3 pre-fills its queue with None placeholders, only
+                # real entries are open keep-alive sockets waiting for reuse
+                node.update({
+                    'maxsize': pool.pool.maxsize,
+                    'idle_connections': sum(1 for conn in list(pool.pool.queue) if conn is not None),
+                    'num_connections': pool.num_connections,
+                    'num_requests': pool.num_requests,
+                })
+            nodes.append(node)
+        stats['clients'][alias] = {
+            'live_nodes': len(transport.connection_pool.connections),
+            'dead_nodes': len(getattr(transport.connection_pool, 'dead_count', {})),
+            'nodes': nodes,
+        }
+    async_clients = [(alias, client) for clients in list(_async_clients.values())
+                     for alias, client in list(clients.items())]
+    for i, (alias, client) in enumerate(async_clients):
+        nodes = []
+        for connection in client.transport.connection_pool.connections:
+            node = {'host': connection.host}
+            connector = getattr(getattr(connection, 'session', None), 'connector', None)
+            if connector is not None:
+                node.update({'maxsize': connector.limit})
+            nodes.append(node)
+        stats['clients'][f'async_{i}_{alias}'] = {
+            'live_nodes': len(client.transport.connection_pool.connections),
+            'nodes': nodes,
+        }
+    return stats
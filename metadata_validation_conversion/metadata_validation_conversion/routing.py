@@ -1,9 +1,13 @@
 from channels.auth import AuthMiddlewareStack
 from channels.routing import ProtocolTypeRouter, URLRouter
+from metadata_validation_conversion.asgi_handler import get_asgi_application
 import ws.routing
 
 application = ProtocolTypeRouter({
-    # (http->django views is added by default)
+    # django handler runs async views on the event loop, channels' default
+    # handler would run every view in a thread. Streaming responses are
+    # produced in a thread, see asgi_handler.py
+    'http': get_asgi_application(),
     'websocket': AuthMiddlewareStack(
         URLRouter(
             ws.routing.websocket_urlpatterns
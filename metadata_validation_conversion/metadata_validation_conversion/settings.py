@@ -13,7 +13,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 import os
 import datetime
 
-from decouple import config
+from decouple import config, Csv
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -176,8 +176,38 @@ DATA_UPLOAD_MAX_MEMORY_SIZE = 10485760
 
 CELERY_TIMEZONE = TIME_ZONE
 
+# seconds between rebuilds of identifier maps used by detail, see api/id_map.py
+ID_MAP_REBUILD_INTERVAL = config('ID_MAP_REBUILD_INTERVAL', cast=int, default=86400)
+CELERY_BEAT_SCHEDULE = {
+    'rebuild-id-maps': {
+        'task': 'api.tasks.rebuild_id_maps',
+        'schedule': ID_MAP_REBUILD_INTERVAL,
+        'options': {'queue': 'update'},
+    },
+}
+
 # Nodes with elasticsearch to connect
 NODE = config('NODE')
+ES_NODES = config('ES_NODES', default=NODE, cast=Csv())
+
+# Elasticsearch connection pool options, see metadata_validation_conversion/es_client.py
+ES_MAXSIZE = config('ES_MAXSIZE', cast=int, default=25)
+# connections per node for async views, requests above the limit wait for a free connection
+ES_ASYNC_MAXSIZE = config('ES_ASYNC_MAXSIZE', cast=int, default=200)
+ES_TIMEOUT = config('ES_TIMEOUT', cast=int, default=30)
+ES_SNIFF_ON_START = config('ES_SNIFF_ON_START', cast=bool, default=False)
+ES_SNIFF_ON_CONNECTION_FAIL = config('ES_SNIFF_ON_CONNECTION_FAIL', cast=bool, default=False)
+# seconds between periodic sniffs, 0 disables periodic sniffing
+ES_SNIFFER_TIMEOUT = config('ES_SNIFFER_TIMEOUT', cast=int, default=0)
+ES_HTTP_COMPRESS = config('ES_HTTP_COMPRESS', cast=bool, default=False)
+# how long point in time is kept between pages of cursor pagination
+ES_PIT_KEEP_ALIVE = config('ES_PIT_KEEP_ALIVE', default='2m')
+# slices read concurrently by exports and full index fetches, see api/pagination.py
+ES_PIT_SLICES = config('ES_PIT_SLICES', cast=int, default=4)
+# threads fetching sibling joins and key chunks of graphql queries, see graphql_api/grapheneObjects/helpers.py
+GRAPHQL_JOIN_WORKERS = config('GRAPHQL_JOIN_WORKERS', cast=int, default=4)
+# seconds before index mappings used by api/query_compiler.py are fetched again
+ES_MAPPING_CACHE_TTL = config('ES_MAPPING_CACHE_TTL', cast=int, default=3600)
 
 # Datacenter for fire api
 DATACENTER = config('DATACENTER')
@@ -189,6 +219,29 @@ CACHES = {
     }
 }
 
+# Search responses cache shared by all uvicorn workers, see api/cache.py
+SEARCH_CACHE_ENABLED = config('SEARCH_CACHE_ENABLED', cast=bool, default=True)
+SEARCH_CACHE_URL = config('SEARCH_CACHE_URL', default='redis://redis-svc:6379/1')
+SEARCH_CACHE_TTL = config('SEARCH_CACHE_TTL', cast=int, default=300)
+SEARCH_CACHE_LOCK_TIMEOUT = config('SEARCH_CACHE_LOCK_TIMEOUT', cast=int, default=10)
+SEARCH_CACHE_SOCKET_TIMEOUT = config('SEARCH_CACHE_SOCKET_TIMEOUT', cast=float, default=0.5)
+# in-memory prefix index used by /data/_suggest/, see api/suggest.py
+SUGGEST_ENABLED = config('SUGGEST_ENABLED', cast=bool, default=True)
+# seconds between checks for changed indices
+SUGGEST_REFRESH_INTERVAL = config('SUGGEST_REFRESH_INTERVAL', cast=int, default=300)
+# max-age of Cache-Control header of search and detail responses, clients
+# revalidate with If-None-Match afterwards
+SEARCH_HTTP_MAX_AGE = config('SEARCH_HTTP_MAX_AGE', cast=int, default=60)
+# compress search responses passed through from Elasticsearch when client accepts gzip
+SEARCH_GZIP_RESPONSES = config('SEARCH_GZIP_RESPONSES', cast=bool, default=True)
+# seconds during which identical export requests reuse already built file, see api/tasks.py
+EXPORT_JOB_TTL = config('EXPORT_JOB_TTL', cast=int, default=86400)
+# seconds the running export holds its job without reporting progress
+EXPORT_CLAIM_TTL = config('EXPORT_CLAIM_TTL', cast=int, default=600)
+# seconds after which exported files are removed, longer than EXPORT_JOB_TTL
+# so that links returned just before the job expired still work
+EXPORT_FILES_TTL = config('EXPORT_FILES_TTL', cast=int, default=172800)
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
@@ -1,13 +1,9 @@
 import json
-from django.conf import settings
-from elasticsearch import Elasticsearch, RequestsHttpConnection
 from metadata_validation_conversion.celery import app
+from metadata_validation_conversion.es_client import get_es_client
+from api.cache import refresh_and_invalidate
 import itertools
 
-es = Elasticsearch([settings.NODE], connection_class=RequestsHttpConnection,
-                   http_auth=(settings.ES_USER, settings.ES_PASSWORD),
-                   use_ssl=True, verify_certs=True)
-
 
 # generate field 'type_counts' list of entries based on ontology['type']
 # params: ontology_type: "type": [ "organismPart", "cellType"]
@@ -38,7 +34,7 @@ def es_fetch_records(index, filters):
     recordset = []
 
     while True:
-        res = es.search(index=index, size=50000, from_=count,
+        res = get_es_client().search(index=index, size=50000, from_=count,
                         track_total_hits=True, body=json.loads(filters))
         count += 50000
         records = list(map(lambda rec: rec['_source'], res['hits']['hits']))
@@ -129,6 +125,7 @@ def update_ontology_summary():
     # update index
     for project in project_dict:
         print("updated_project_stats: ", project_dict[project])
-        es.index(index='summary_ontologies', id=project, body=project_dict[project])
+        get_es_client().index(index='summary_ontologies', id=project, body=project_dict[project])
+    refresh_and_invalidate(get_es_client(), 'summary_ontologies')
 
     return "Success"
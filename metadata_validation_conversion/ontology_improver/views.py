@@ -3,9 +3,7 @@ from django.views.decorators.csrf import csrf_exempt
 import requests
 import json
 import copy
-from elasticsearch import Elasticsearch, RequestsHttpConnection
 from ontology_improver.models import User
-from django.conf import settings
 from datetime import datetime
 from django.utils import timezone
 import base64
@@ -13,10 +11,8 @@ from ontology_improver.utils import *
 from ontology_improver.tasks import update_ontology_summary
 from metadata_validation_conversion.constants import ZOOMA_SERVICE
 from metadata_validation_conversion.helpers import send_message
-
-es = Elasticsearch([settings.NODE], connection_class=RequestsHttpConnection,
-                   http_auth=(settings.ES_USER, settings.ES_PASSWORD),
-                   use_ssl=True, verify_certs=True)
+from metadata_validation_conversion.es_client import get_es_client
+from api.cache import refresh_and_invalidate
 
 @csrf_exempt
 def get_zooma_ontologies(request):
@@ -116,6 +112,7 @@ def validate_ontology(request, room_id):
             return HttpResponse(status=409)
 
     # proceed if user's last action is different from the current one or user hasn't validated that term yet
+    es = get_es_client()
     res = es.search(index="ontologies", body={"query": {"match": {"_id": ontology['key']}}})
     if len(res['hits']['hits']) == 0:
         return HttpResponse(status=404)
@@ -165,6 +162,7 @@ def validate_ontology(request, room_id):
         res = es.search(index="ontologies", body={"query": {"match": {"_id": new_ontology['key']}}})
         if len(res['hits']['hits']) == 0:
             es.index(index='ontologies', id=new_ontology['key'], body=new_ontology)
+    refresh_and_invalidate(es, 'ontologies')
 
     # task = update_ontology_summary.s().set(queue='submission')
     # task_chain = chain(task)
@@ -181,6 +179,7 @@ def ontology_updates(request):
     # get user info
     user = data['user']
 
+    es = get_es_client()
     for ontology in ontologies:
         # url = f"{BE_SVC}/data/ontologies/{ontology['key']}"
         # res = requests.get(url)
@@ -212,6 +211,7 @@ def ontology_updates(request):
                 'tags': ontology['tags']
             }
             es.update(index='ontologies', id=existing_ontology['key'], body={"doc": update_payload})
+    refresh_and_invalidate(es, 'ontologies')
     # update summary statistics
     # TODO: check this task
     # task = update_ontology_summary.s().set(queue='submission')
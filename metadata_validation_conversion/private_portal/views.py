@@ -3,9 +3,8 @@ import json
 from rest_framework import permissions
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from metadata_validation_conversion.settings import ES_USER, ES_PASSWORD, NODE
-
-from elasticsearch import Elasticsearch, RequestsHttpConnection
+from metadata_validation_conversion.es_client import get_es_client
+from api.pagination import cursor_search, InvalidCursor
 
 
 class BovRegView(APIView):
@@ -20,6 +19,8 @@ class BovRegView(APIView):
         query = request.GET.get('q', '')
         from_ = request.GET.get('from_', 0)
         search = request.GET.get('search', '')
+        # 'true' to start cursor pagination or 'next' token from previous page
+        cursor = request.GET.get('cursor', '')
 
         # generate query for search
         body = {}
@@ -34,16 +35,18 @@ class BovRegView(APIView):
                     }]
                 }
             }
-        es = Elasticsearch([NODE], 
-            connection_class=RequestsHttpConnection, 
-            http_auth=(ES_USER, ES_PASSWORD), 
-            use_ssl=True, verify_certs=True)
+        es = get_es_client()
         index = f'bovreg_{data_type}'
         if index == 'bovreg_file' or index == 'bovreg_dataset':
             sort = 'private:desc'
         else:
             sort = 'releaseDate:desc'
-        if query != '':
+        if cursor:
+            try:
+                data = cursor_search(es, index, body, size, sort=sort, cursor=cursor, q=query)
+            except InvalidCursor as e:
+                return Response({'status': '400', 'reason': str(e)}, status=400)
+        elif query != '':
             data = es.search(index=index, from_=from_, size=size, sort=sort, body=body, q=query, track_total_hits=True)
         else:
             data = es.search(index=index, from_=from_, size=size, sort=sort, body=body, track_total_hits=True)
@@ -57,10 +60,7 @@ class BovRegDetailsView(APIView):
     permission_classes = (permissions.IsAuthenticated,)
 
     def get(self, request, data_type, item_id):
-        es = Elasticsearch([NODE],
-            connection_class=RequestsHttpConnection,
-            http_auth=(ES_USER, ES_PASSWORD),
-            use_ssl=True, verify_certs=True)
+        es = get_es_client()
         index = f'bovreg_{data_type}'
         # Pass item_id as a value via a structured query rather than building a
         # Lucene query string to avoid query injection (CWE-943).
@@ -1,18 +1,15 @@
 import datetime
 from abc import ABC
-from django.conf import settings
-from elasticsearch import Elasticsearch, RequestsHttpConnection
 from metadata_validation_conversion.celery import app
 from metadata_validation_conversion.helpers import send_message
+from metadata_validation_conversion.es_client import get_es_client
+from api.cache import refresh_and_invalidate
 from metadata_validation_conversion.constants import ORGANIZATIONS, PROTOCOL_INDICES
 import requests
 import os
 import subprocess
 from celery import Task
     
-es = Elasticsearch([settings.NODE], connection_class=RequestsHttpConnection, \
-                    http_auth=(settings.ES_USER, settings.ES_PASSWORD), \
-                    use_ssl=True, verify_certs=True)
 
 class LogErrorsTask(Task, ABC):
     abstract = True
@@ -84,6 +81,7 @@ def add_to_es(upload_results, protocol_type, protocol_file, fileid):
     try:
         if upload_results == 'Success':
             index = PROTOCOL_INDICES[protocol_type]
+            es = get_es_client()
             key = requests.utils.unquote(protocol_file)
             url = f"https://api.faang.org/files/protocols/{protocol_type}/{protocol_file}"
             parsed = protocol_file.strip().split("_")
@@ -115,6 +113,7 @@ def add_to_es(upload_results, protocol_type, protocol_file, fileid):
                     elif index == 'protocol_analysis':
                         protocol_data["analyses"] = []
                     es.index(index, id=key, body=protocol_data)
+                    refresh_and_invalidate(es, index)
                     send_message(submission_message=f"Please download your file at \n {url}.\n" \
                                  f"Protocol added to data portal!", room_id=fileid)
             else:
@@ -130,6 +129,7 @@ def add_to_es(upload_results, protocol_type, protocol_file, fileid):
                         "url": url
                     }
                     es.index(index, id=key, body=protocol_data)
+                    refresh_and_invalidate(es, index)
                     send_message(submission_message=f"Please download your file at \n {url}.\n" \
                                  f"Protocol added to data portal!", room_id=fileid)
             status = 'Success'
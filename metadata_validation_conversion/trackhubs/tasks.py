@@ -1,11 +1,12 @@
 from abc import ABC
-from elasticsearch import Elasticsearch, RequestsHttpConnection
 from metadata_validation_conversion.celery import app
 from metadata_validation_conversion.helpers import send_message, validate_safe_name
+from metadata_validation_conversion.es_client import get_es_client
+from api.cache import refresh_and_invalidate
+from api.constants import MGET_MAX_IDS
 from collections import OrderedDict
 from metadata_validation_conversion.settings import \
     TRACKHUBS_USERNAME, TRACKHUBS_PASSWORD
-from django.conf import settings
 import requests
 import xlrd
 import json
@@ -14,6 +15,8 @@ import shutil
 import subprocess
 from celery import Task
 
+SPECIMEN_MGET_URL = 'http://backend-svc:8000/data/specimen/_mget/'
+
 
 class LogErrorsTask(Task, ABC):
     abstract = True
@@ -67,6 +70,24 @@ def read_excel_file(fileid):
         return {'error_flag': error_flag, 'data': data_dict}
 
 
+def find_invalid_specimen_ids(ids):
+    """
+    This function will check that specimens exist, ids are checked with one
+    request per MGET_MAX_IDS ids
+    :param ids: list of specimen ids, numbers read from the template are
+    converted to str
+    :return: list of ids that aren't found
+    """
+    ids = [str(id) for id in ids]
+    invalid_ids = []
+    for start in range(0, len(ids), MGET_MAX_IDS):
+        res = requests.post(SPECIMEN_MGET_URL,
+                            json={'ids': ids[start:start + MGET_MAX_IDS], '_source': 'biosampleId'})
+        res.raise_for_status()
+        invalid_ids.extend(doc['id'] for doc in res.json()['docs'] if not doc['found'])
+    return invalid_ids
+
+
 @app.task(base=LogErrorsTask)
 def validate(result, webin_credentials, fileid):
     error_flag = result['error_flag']
@@ -136,12 +157,13 @@ def validate(result, webin_credentials, fileid):
                                                    f'Please use one of the following types: {", ".join(valid_types)}'
                         # check that "Related Specimen ID" is a valid BioSamples ID
                         elif row_prop == 'Related Specimen ID' and row_prop not in errors:
-                            invalid_ids = []
-                            for id in data_dict[key][row_index][row_prop]:
-                                url = f'http://backend-svc:8000/data/specimen/{id}'
-                                res = requests.get(url)
-                                if res.status_code != 200 or len(json.loads(res.content)['hits']['hits']) == 0:
-                                    invalid_ids.append(id)
+                            try:
+                                invalid_ids = find_invalid_specimen_ids(data_dict[key][row_index][row_prop])
+                            except (requests.RequestException, ValueError, KeyError) as e:
+                                # ids are unknown, they aren't reported as invalid
+                                error_flag = True
+                                errors[row_prop] = f"Couldn't check specimen IDs: {e}"
+                                continue
                             if len(invalid_ids):
                                 error_flag = True
                                 if len(invalid_ids) == 1:
@@ -370,9 +392,9 @@ def update_es_records(data, roomid):
             })
         trackhub_data['subdirectories'] = sub_dirs_list
         # create ES record
-        es = Elasticsearch([settings.NODE], connection_class=RequestsHttpConnection, \
-            http_auth=(settings.ES_USER, settings.ES_PASSWORD), use_ssl=True, verify_certs=True)
+        es = get_es_client()
         es.index(index='trackhubs', id=trackhub_data['name'], body=trackhub_data)
+        refresh_and_invalidate(es, 'trackhubs')
         send_message(room_id=roomid,
                         submission_message="Updated track hub records")
     except:
@@ -446,7 +468,7 @@ def associate_specimen(res_dict, roomid):
             biosample_ids = biosample_ids + track['Related Specimen ID']
             biosample_ids = list(set(biosample_ids))
         errors = []
-        es = Elasticsearch([settings.NODE], connection_class=RequestsHttpConnection, http_auth=(settings.ES_USER, settings.ES_PASSWORD), use_ssl=True, verify_certs=True)
+        es = get_es_client()
         try:
             for id in biosample_ids:
                 es_data = es.update(index='specimen', id=id, body=update_payload)
@@ -459,5 +481,7 @@ def associate_specimen(res_dict, roomid):
                          errors=f"Track Hub registered.\n" \
                                 "Some specimen could not be linked, please contact faang-dcc@ebi.ac.uk")
         finally:
+            # some records may have been updated before a failure
+            refresh_and_invalidate(es, 'specimen')
             return {'error_flag': error_flag, 'data': data}
     return {'error_flag': error_flag, 'data': data}
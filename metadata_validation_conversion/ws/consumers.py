@@ -1,6 +1,14 @@
 from channels.generic.websocket import AsyncWebsocketConsumer
 import json
+import asyncio
+import logging
 from celery.result import AsyncResult
+from metadata_validation_conversion.es_client import get_async_es_client
+from api.constants import GLOBAL_DATASET_INDEX
+from api.helpers import global_search_requests, format_global_results, portal_index_name, \
+    empty_search_response, GLOBAL_ALLOWED_INDICES
+
+logger = logging.getLogger(__name__)
 
 
 class SubmissionConsumer(AsyncWebsocketConsumer):
@@ -93,3 +101,83 @@ class GraphQLTaskStatusConsumer(AsyncWebsocketConsumer):
         await self.send(text_data=json.dumps({
             'response': message
         }))
+
+
+class GlobalSearchConsumer(AsyncWebsocketConsumer):
+    """
+    Streaming version of /data/_gsearch/: client sends {"sterm": "..."} and
+    results of every index are sent as soon as that index answers, followed
+    by {"sterm": "...", "done": true}. New search term cancels the previous
+    search.
+    """
+    # messages aren't sent to groups, so the consumer doesn't need to listen
+    # on the channel layer
+    channel_layer_alias = None
+
+    async def connect(self):
+        self.search_task = None
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if self.search_task:
+            self.search_task.cancel()
+
+    # Receive search term from WebSocket
+    async def receive(self, text_data):
+        try:
+            message = json.loads(text_data)
+        except (TypeError, ValueError):
+            message = None
+        sterm = message.get('sterm', '') if isinstance(message, dict) else None
+        if not isinstance(sterm, str):
+            # malformed message doesn't close the socket
+            await self.send(text_data=json.dumps({
+                'status': '400',
+                'reason': 'Message should be a JSON object with "sterm" string'
+            }))
+            return
+        if self.search_task:
+            self.search_task.cancel()
+        self.search_task = asyncio.ensure_future(self.global_search(sterm))
+        self.search_task.add_done_callback(self.search_done)
+
+    @staticmethod
+    def search_done(task):
+        # otherwise the error is only reported when the task is garbage collected
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Global search over websocket failed", exc_info=task.exception())
+
+    async def global_search(self, sterm):
+        index_searches = global_search_requests(sterm, GLOBAL_ALLOWED_INDICES)
+        es = get_async_es_client()
+
+        async def search(name, body):
+            try:
+                data = await es.search(index=name, body=body)
+            except Exception:
+                # failure of one index doesn't fail the whole search
+                logger.exception(f"Global search failed for {name}")
+                data = empty_search_response()
+            data['index'] = portal_index_name(name)
+            return data
+
+        outp_data = []
+        for future in asyncio.as_completed([search(name, body) for name, body in index_searches]):
+            data = await future
+            outp_data.append(data)
+            if len(data['hits']['hits']) != 0:
+                await self.send(text_data=json.dumps({
+                    'sterm': sterm,
+                    'index': data['index'],
+                    'response': {k: v for k, v in data.items() if k != 'aggregations'}
+                }))
+
+        # datasets of the matching files, when no dataset matched
+        fallback = format_global_results(outp_data).get(GLOBAL_DATASET_INDEX)
+        if fallback and 'search_terms' in fallback:
+            await self.send(text_data=json.dumps({
+                'sterm': sterm,
+                'index': GLOBAL_DATASET_INDEX,
+                'response': fallback
+            }))
+        await self.send(text_data=json.dumps({'sterm': sterm, 'done': True}))
@@ -1,4 +1,4 @@
 python manage.py collectstatic
 python manage.py makemigrations
 python manage.py migrate
-celery -A metadata_validation_conversion worker -l INFO -Q validation,submission,upload,update,graphql_api,gsearch
\ No newline at end of file
+celery -A metadata_validation_conversion worker -l INFO -Q validation,submission,upload,update,graphql_api,export
\ No newline at end of file
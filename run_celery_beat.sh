@@ -0,0 +1 @@
+celery -A metadata_validation_conversion beat -l INFO